@@ -0,0 +1,220 @@
+"""API HTTP local del motor de consultas (query_engine.py), para bots y tableros.
+
+Usa la misma configuración que la app (.streamlit/secrets.toml) y mantiene
+un solo motor "caliente" (datos, cachés y modelos) para todas las peticiones.
+
+Uso: python api_server.py --port 8502 --workers 4
+
+    POST /query   {"question": "...", "max_rows": 100}  -> resultado en JSON
+    GET  /health  versión de datos activa y estado de la actualización
+    GET  /stats   peticiones atendidas, rechazadas y en curso del pool
+"""
+import argparse
+import json
+import threading
+import tomllib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chart_render import DEFAULT_MAX_POINTS as DEFAULT_CHART_MAX_POINTS
+from data_loader import (DEFAULT_MAX_WORKERS as DEFAULT_SHEET_WORKERS, DEFAULT_SHEET_URL, DEFAULT_TTL_SECONDS,
+                         SHEETS_SCOPES, SheetCache, SheetSource)
+from dataset_profile import ProfileStore
+from dataset_store import DatasetStore
+from forecasting import ForecastEngine
+from gemini_client import (API_BASE_URL as GEMINI_API_BASE_URL, DEFAULT_MAX_CONCURRENT, DEFAULT_MODEL,
+                           DEFAULT_READ_TIMEOUT, GeminiClient)
+from prompt_builder import DEFAULT_TOKEN_BUDGET
+from query_engine import DEFAULT_MAX_ROWS, QueryEngine
+from response_cache import (DEFAULT_CACHE_PATH as DEFAULT_RESPONSE_CACHE_PATH, DEFAULT_MAX_ENTRIES,
+                            DEFAULT_TTL_SECONDS as DEFAULT_RESPONSE_TTL_SECONDS, ResponseCache)
+from snapshot import DEFAULT_SNAPSHOT_PATH, snapshots_available
+from telemetry import DEFAULT_TRACE_MAX_MB, DEFAULT_TRACE_PATH, QueryTrace, TraceLog
+
+DEFAULT_SECRETS_PATH = ".streamlit/secrets.toml"
+DEFAULT_PORT = 8502
+DEFAULT_WORKERS = 4
+# Peticiones en espera además de las que se están atendiendo; con el pool lleno se responde 503
+DEFAULT_MAX_PENDING = 16
+DEFAULT_REQUEST_TIMEOUT = 120
+
+
+def load_secrets(path=DEFAULT_SECRETS_PATH):
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def build_engine(secrets, background_refresh=True):
+    """QueryEngine con los mismos secrets (y valores por defecto) que usa app.py."""
+    offline = bool(secrets.get("OFFLINE_MODE", False))
+    client = None
+    if not offline:
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        creds = Credentials.from_service_account_info(json.loads(secrets["GOOGLE_CREDENTIALS"]), scopes=SHEETS_SCOPES)
+        client = gspread.authorize(creds)
+    sources = [SheetSource.parse(source) for source in secrets.get("SHEET_SOURCES", [])]
+    snapshot_path = secrets.get("SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+    sheet_cache = SheetCache(client, secrets.get("SHEET_URL", DEFAULT_SHEET_URL),
+                             ttl_seconds=int(secrets.get("SHEET_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+                             snapshot_path=snapshot_path if snapshots_available() else None,
+                             sources=sources or None,
+                             max_workers=int(secrets.get("SHEET_MAX_WORKERS", DEFAULT_SHEET_WORKERS)))
+    trace_path = secrets.get("PERFORMANCE_LOG_PATH", DEFAULT_TRACE_PATH)
+    trace_log = TraceLog(trace_path, max_mb=float(secrets.get("PERFORMANCE_LOG_MAX_MB", DEFAULT_TRACE_MAX_MB))) \
+        if trace_path else None
+    engine = QueryEngine(
+        sheet_cache, DatasetStore(), ProfileStore(),
+        ResponseCache(secrets.get("RESPONSE_CACHE_PATH", DEFAULT_RESPONSE_CACHE_PATH),
+                      max_entries=int(secrets.get("RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                      ttl_seconds=int(secrets.get("RESPONSE_CACHE_TTL_SECONDS", DEFAULT_RESPONSE_TTL_SECONDS))),
+        GeminiClient(DEFAULT_MODEL, base_url=secrets.get("GEMINI_BASE_URL", GEMINI_API_BASE_URL),
+                     read_timeout=int(secrets.get("GEMINI_READ_TIMEOUT_SECONDS", DEFAULT_READ_TIMEOUT)),
+                     max_concurrent=int(secrets.get("GEMINI_MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT))),
+        ForecastEngine(max_workers=int(secrets.get("FORECAST_WORKERS", 0)) or None),
+        api_key=secrets.get("GOOGLE_GEMINI_API_KEY"),
+        local_intent_parser=bool(secrets.get("LOCAL_INTENT_PARSER", True)),
+        # Sin nadie mirando los fragmentos, una sola llamada es más simple y tarda lo mismo
+        streaming=False,
+        token_budget=int(secrets.get("PROMPT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+        chart_max_points=int(secrets.get("CHART_MAX_POINTS", DEFAULT_CHART_MAX_POINTS)),
+        trace_log=trace_log)
+    refresh_seconds = int(secrets.get("BACKGROUND_REFRESH_SECONDS", DEFAULT_TTL_SECONDS))
+    if background_refresh and refresh_seconds > 0:
+        sheet_cache.start_background_refresh(refresh_seconds, on_new_version=engine.prepare_version)
+    return engine
+
+
+class QueryServer(ThreadingHTTPServer):
+    """Servidor HTTP cuyas consultas corren en un pool de `workers` hilos con una cola acotada."""
+
+    daemon_threads = True
+
+    def __init__(self, address, engine, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        super().__init__(address, QueryHandler)
+        self.engine = engine
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self.request_timeout = request_timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._stats_lock = threading.Lock()
+        self.stats = {"workers": workers, "max_pending": max_pending, "in_flight": 0, "completed": 0,
+                      "rejected": 0, "timed_out": 0}
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self.stats[key] += delta
+
+    def run_query(self, question, max_rows):
+        """(código HTTP, cuerpo) de una consulta; 503 si el pool y su cola están llenos."""
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            return 503, {"error": "El servidor está ocupado; intenta de nuevo en unos segundos."}
+        self._count("in_flight")
+        try:
+            future = self.pool.submit(self._answer, question, max_rows)
+        except Exception:
+            self._release_slot()
+            raise
+        # El cupo se libera cuando la consulta termina de verdad, no cuando se responde 504:
+        # así una consulta colgada sigue ocupando su lugar en el pool y en la cola
+        future.add_done_callback(lambda _: self._release_slot())
+        try:
+            return 200, future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            self._count("timed_out")
+            return 504, {"error": "La consulta excedió el tiempo máximo de respuesta."}
+
+    def _release_slot(self):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    def _answer(self, question, max_rows):
+        trace = QueryTrace(question)
+        result = self.engine.ask(question, trace=trace)
+        self._count("completed")
+        return result.to_dict(max_rows=max_rows, trace=trace)
+
+    def health(self):
+        sheet_cache = self.engine.sheet_cache
+        df, fingerprint = sheet_cache.current()
+        return {"status": "ok" if df is not None else "loading", "data_version": fingerprint,
+                "rows": len(df) if df is not None else 0, "loaded_at": sheet_cache.loaded_at,
+                "loaded_from": sheet_cache.loaded_from, "checked_at": sheet_cache.checked_at,
+                "refreshing": sheet_cache.refreshing,
+                "last_error": str(sheet_cache.last_error) if sheet_cache.last_error else None}
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, self.server.health())
+        elif self.path == "/stats":
+            self._send(200, dict(self.server.stats))
+        else:
+            self._send(404, {"error": "Ruta no encontrada."})
+
+    def do_POST(self):
+        if self.path != "/query":
+            self._send(404, {"error": "Ruta no encontrada."})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            question = str(body.get("question", "")).strip()
+            max_rows = int(body.get("max_rows", DEFAULT_MAX_ROWS))
+        except (ValueError, TypeError, AttributeError):
+            self._send(400, {"error": "El cuerpo debe ser JSON con una clave 'question'."})
+            return
+        if not question:
+            self._send(400, {"error": "Falta la pregunta ('question')."})
+            return
+        if max_rows < 0:
+            self._send(400, {"error": "'max_rows' no puede ser negativo."})
+            return
+        self._send(*self.server.run_query(question, max_rows))
+
+    def log_message(self, format, *args):
+        # El registro de consultas ya queda en PERFORMANCE_LOG_PATH
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="consultas simultáneas")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING, help="consultas en espera antes de responder 503")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT, help="segundos máximos por consulta")
+    args = parser.parse_args()
+
+    engine = build_engine(load_secrets(args.secrets))
+    # Cargar los datos (y sus cachés) antes de aceptar peticiones
+    data = engine.load()
+    engine.prepare_version(data.fingerprint, data.df)
+    server = QueryServer((args.host, args.port), engine, args.workers, args.max_pending, args.timeout)
+    print(f"Motor listo ({len(data.df):,} filas). Escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.forecast_engine.close()
+
+
+if __name__ == "__main__":
+    main()
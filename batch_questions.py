@@ -0,0 +1,235 @@
+"""Preguntas en lote: responde una lista de preguntas en paralelo sobre una sola versión de datos y arma un reporte.
+
+Pensado para el cierre de mes (las mismas ~40 preguntas cada vez). Las
+preguntas repetidas y las que resuelven la misma intención se responden una
+sola vez.
+
+Uso: python batch_questions.py preguntas.txt --output reporte.html --workers 4
+
+    preguntas.txt  una pregunta por línea (las vacías y las que empiezan con # se omiten)
+    --output       .html (respuestas, tablas y gráficos interactivos) o .json (QueryResult.to_dict)
+"""
+import argparse
+import html
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import needs_analysis
+from query_engine import ANSWER_PREFIX, DEFAULT_MAX_ROWS
+from telemetry import QueryTrace
+from text_normalization import normalize_text
+
+# Con el valor por defecto de GEMINI_MAX_CONCURRENT, más hilos solo esperarían en el semáforo del cliente
+DEFAULT_BATCH_WORKERS = 4
+# Filas de cada tabla en el reporte HTML (el reporte JSON usa max_rows)
+DEFAULT_REPORT_ROWS = 200
+
+
+def read_questions(lines):
+    """Preguntas de un archivo o texto: una por línea, sin vacías ni comentarios (#)."""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+def intent_key(question, chart_data):
+    """Clave para reutilizar respuestas: la intención completa.
+
+    Si la respuesta va a necesitar el análisis de Gemini, este depende del
+    texto de la pregunta, así que la pregunta normalizada también es parte de
+    la clave.
+    """
+    key = json.dumps(chart_data, sort_keys=True, ensure_ascii=False, default=str)
+    if not chart_data.get("is_chart_request") and needs_analysis(chart_data.get("summary_response", "")):
+        key += "|" + normalize_text(question)
+    return key
+
+
+class BatchItem:
+    """Una pregunta del lote; `same_as` es el índice de la pregunta cuya respuesta se reutilizó."""
+
+    def __init__(self, index, question):
+        self.index = index
+        self.question = question
+        self.result = None
+        self.trace = None
+        self.same_as = None
+
+
+class BatchRun:
+    """Resultado de un lote: una entrada por pregunta, en el orden del archivo."""
+
+    def __init__(self, items, data, workers, wall_seconds):
+        self.items = items
+        self.data = data
+        self.workers = workers
+        self.wall_seconds = wall_seconds
+
+    def result(self, item):
+        return item.result if item.same_as is None else self.items[item.same_as].result
+
+    def summary(self):
+        answered = [item for item in self.items if item.same_as is None]
+        errors = sum(self.result(item).kind == "error" for item in self.items)
+        sequential_seconds = sum(item.trace["total_ms"] for item in self.items if item.trace) / 1000
+        return {"preguntas": len(self.items), "respondidas": len(answered),
+                "reutilizadas": len(self.items) - len(answered), "con error": errors, "hilos": self.workers,
+                "versión de datos": self.data.fingerprint, "filas": len(self.data.df),
+                "tiempo total (s)": round(self.wall_seconds, 2),
+                "suma de tiempos por pregunta (s)": round(sequential_seconds, 2),
+                "preguntas por minuto": round(len(self.items) / self.wall_seconds * 60, 1) if self.wall_seconds else None}
+
+    def to_dict(self, max_rows=DEFAULT_MAX_ROWS):
+        questions = []
+        for item in self.items:
+            entry = self.result(item).to_dict(max_rows=max_rows)
+            entry["question"] = item.question
+            entry["same_as"] = item.same_as
+            entry["trace"] = item.trace
+            questions.append(entry)
+        return {"summary": self.summary(), "questions": questions}
+
+
+def run_batch(engine, questions, workers=DEFAULT_BATCH_WORKERS, data=None, dedupe=True, on_progress=None):
+    """Responde `questions` con hasta `workers` consultas a la vez y devuelve un BatchRun.
+
+    Todas usan la misma versión de datos (`data`, o la activa al empezar). Cada
+    pregunta resuelve su intención y, si otra ya tomó la misma, reutiliza esa
+    respuesta en vez de calcularla de nuevo. `on_progress(listas, total)` se
+    llama desde el hilo que llamó a run_batch.
+    """
+    started = time.perf_counter()
+    data = data or engine.load()
+    items = [BatchItem(index, question) for index, question in enumerate(questions)]
+
+    # Preguntas idénticas (normalizadas) ni siquiera resuelven su intención
+    first_by_text = {}
+    pending = []
+    for item in items:
+        first = first_by_text.setdefault(normalize_text(item.question), item.index) if dedupe else item.index
+        if first != item.index:
+            item.same_as = first
+        else:
+            pending.append(item)
+
+    owners = {}  # clave de intención -> índice de la pregunta que la responde
+    owners_lock = threading.Lock()
+
+    def answer(item):
+        trace = QueryTrace(item.question)
+        chart_data, intent_result = engine.intent(item.question, data, trace)
+        if chart_data is None:
+            item.result = intent_result
+            if engine.trace_log is not None:
+                engine.trace_log.append(trace)
+        else:
+            with owners_lock:
+                owner = owners.setdefault(intent_key(item.question, chart_data), item.index) if dedupe else item.index
+            if owner != item.index:
+                item.same_as = owner
+            else:
+                item.result = engine.ask(item.question, data=data, trace=trace, chart_data=chart_data)
+                # Lo informado al resolver la intención (p. ej. el tamaño del prompt) va antes de la respuesta
+                item.result.blocks = intent_result.blocks + item.result.blocks
+        item.trace = trace.record()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="lote") as pool:
+        futures = [pool.submit(answer, item) for item in pending]
+        for done, future in enumerate(futures, start=1):
+            future.result()
+            if on_progress is not None:
+                on_progress(done, len(futures))
+    # Una pregunta repetida puede apuntar a otra que a su vez reutilizó una intención: apuntar a la que respondió
+    for item in items:
+        while item.same_as is not None and items[item.same_as].same_as is not None:
+            item.same_as = items[item.same_as].same_as
+    return BatchRun(items, data, workers, time.perf_counter() - started)
+
+
+# --- Reporte ---
+_REPORT_STYLE = """
+body { font-family: sans-serif; max-width: 1100px; margin: 2em auto; color: #222; }
+h2 { border-top: 1px solid #ddd; padding-top: 1em; font-size: 1.15em; }
+.success { background: #e8f5e9; } .info { background: #e3f2fd; } .warning { background: #fff8e1; }
+.error, .exception { background: #ffebee; }
+.success, .info, .warning, .error, .exception { padding: .6em .8em; border-radius: 4px; white-space: pre-wrap; }
+.caption, .same-as { color: #777; font-size: .85em; }
+table { border-collapse: collapse; font-size: .85em; } td, th { border: 1px solid #ddd; padding: 2px 6px; }
+"""
+
+
+def report_html(run, max_rows=DEFAULT_REPORT_ROWS):
+    """Reporte HTML autocontenido: resumen del lote y, por pregunta, respuestas, tablas y gráficos."""
+    parts = [f"<html><head><meta charset='utf-8'><title>Reporte de preguntas</title><style>{_REPORT_STYLE}</style></head><body>",
+             "<h1>Reporte de preguntas</h1><table>"]
+    parts += [f"<tr><th>{html.escape(str(name))}</th><td>{html.escape(str(value))}</td></tr>"
+              for name, value in run.summary().items()]
+    parts.append("</table>")
+    plotly_js = True  # plotly.js se incluye una sola vez, con el primer gráfico
+    for item in run.items:
+        parts.append(f"<h2>{item.index + 1}. {html.escape(item.question)}</h2>")
+        if item.same_as is not None:
+            parts.append(f"<p class='same-as'>Misma respuesta que la pregunta {item.same_as + 1}.</p>")
+        for kind, value in run.result(item).blocks:
+            if kind == "table":
+                parts.append(value.head(max_rows).to_html(index=False, na_rep=""))
+                if len(value) > max_rows:
+                    parts.append(f"<p class='caption'>Primeras {max_rows:,} de {len(value):,} filas.</p>")
+            elif kind == "chart":
+                parts.append(value.figure().to_html(full_html=False, include_plotlyjs=plotly_js))
+                plotly_js = False
+            elif kind == "subheader":
+                parts.append(f"<h3>{html.escape(value)}</h3>")
+            elif kind == "exception":
+                parts.append(f"<div class='exception'>{html.escape(f'{type(value).__name__}: {value}')}</div>")
+            else:
+                if kind == "success" and value.startswith(ANSWER_PREFIX):
+                    value = value[len(ANSWER_PREFIX):]
+                css_class = kind if kind != "text" else "caption"
+                parts.append(f"<div class='{css_class}'>{html.escape(value)}</div>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def write_report(run, path, max_rows=None):
+    """Guarda el reporte como HTML o, si `path` termina en .json, como JSON."""
+    if path.endswith(".json"):
+        content = json.dumps(run.to_dict(max_rows=max_rows or DEFAULT_MAX_ROWS), ensure_ascii=False, indent=2, default=str)
+    else:
+        content = report_html(run, max_rows=max_rows or DEFAULT_REPORT_ROWS)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def main():
+    from api_server import DEFAULT_SECRETS_PATH, build_engine, load_secrets
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="archivo con una pregunta por línea")
+    parser.add_argument("--output", default="reporte_preguntas.html", help=".html o .json")
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS_PATH)
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS, help="preguntas simultáneas")
+    parser.add_argument("--max-rows", type=int, default=None, help="filas por tabla en el reporte")
+    parser.add_argument("--no-dedupe", action="store_true", help="responder cada pregunta aunque se repita la intención")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = read_questions(f)
+    # Sin actualización en segundo plano: el lote completo usa la versión cargada al empezar
+    engine = build_engine(load_secrets(args.secrets), background_refresh=False)
+    try:
+        run = run_batch(engine, questions, workers=args.workers, dedupe=not args.no_dedupe,
+                        on_progress=lambda done, total: print(f"\r{done}/{total} preguntas", end="", flush=True))
+        print()
+        write_report(run, args.output, max_rows=args.max_rows)
+    finally:
+        engine.forecast_engine.close()
+    for name, value in run.summary().items():
+        print(f"{name}: {value}")
+    print(f"Reporte guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
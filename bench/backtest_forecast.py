@@ -0,0 +1,174 @@
+"""Backtesting con origen móvil de los métodos de proyección mensual.
+
+Para cada origen (mes) de cada serie se ajusta el método con la historia
+anterior y se proyectan los meses que quedan hasta diciembre, como en la
+app (o `--horizon` meses fijos). Reporta MAE, MAPE, tiempo medio de
+ajuste/proyección y pico de memoria por ajuste.
+
+Series: sintéticas de largo creciente (`--months`), hojas con la forma de
+la real de varios años (`--years`, total y segmentos de `--dimension`) y,
+si se indica, un snapshot Parquet de la hoja real (`--snapshot`).
+
+Uso: python -m bench.backtest_forecast --months 36 60 120 --years 2 4 --horizon 0
+"""
+import argparse
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from bench.synthetic import generate_monthly_series, generate_sheet_values
+from data_loader import clean_sheet_values
+from forecasting import MIN_SEASONAL_MONTHS, fit_model, monthly_history
+
+# Orígenes con al menos esta historia (un año: ningún método debería proyectar con menos)
+MIN_TRAIN_MONTHS = 12
+
+
+# --- Métodos candidatos: fit(historia) -> predict(meses) ---
+def fit_year_average(history):
+    # project_remaining_year: promedio de los meses del año en curso (o de los últimos 12 si aún no hay)
+    current_year = history[history.index.year == history.index[-1].year]
+    mean = float((current_year if len(current_year) else history.iloc[-12:]).mean())
+    return lambda months: np.full(len(months), mean)
+
+
+def fit_history_average(history):
+    # Respaldo de project_remaining_year_monthly con menos de 2 años: promedio histórico
+    mean = float(history.mean())
+    return lambda months: np.full(len(months), mean)
+
+
+def fit_seasonal_naive(history):
+    # Mismo mes del último año con datos
+    by_month = history.groupby(history.index.month).last()
+    return lambda months: np.array([by_month.get(m.month, history.iloc[-1]) for m in months], dtype="float64")
+
+
+def fit_decomposition(history):
+    # project_remaining_year_monthly: tendencia final + estacionalidad aditiva (forecasting.fit_model)
+    model = fit_model(history.to_numpy(), history.index[0])
+    return lambda months: np.array(model.project(months), dtype="float64")
+
+
+def fit_holt_winters(history):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    if len(history) < MIN_SEASONAL_MONTHS:
+        return fit_history_average(history)
+    # statsmodels fuerza sus propios filtros de advertencias (ConvergenceWarning)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        fitted = ExponentialSmoothing(history, trend="add", seasonal="add", seasonal_periods=12).fit()
+    return lambda months: np.maximum(0, fitted.predict(months[0], months[-1]).to_numpy())
+
+
+METHODS = {
+    "promedio del año": fit_year_average,
+    "promedio histórico": fit_history_average,
+    "naive estacional": fit_seasonal_naive,
+    "descomposición": fit_decomposition,
+    "holt-winters": fit_holt_winters,
+}
+
+
+def horizon_months(origin, horizon):
+    """Meses a proyectar desde el mes siguiente a `origin`: hasta diciembre si horizon es 0."""
+    count = horizon or 12 - origin.month
+    return pd.date_range(origin + pd.DateOffset(months=1), periods=count, freq="MS")
+
+
+def backtest(series, fit, horizon=0, step=1, measure_memory=True):
+    """Errores absolutos/porcentuales y tiempos por origen de `series` para un método."""
+    errors, pct_errors, fit_times, predict_times, peaks = [], [], [], [], []
+    # Un ajuste previo sin medir, para no contar imports ni cachés de la primera llamada
+    fit(series.iloc[:max(MIN_TRAIN_MONTHS, min(len(series), MIN_SEASONAL_MONTHS))])
+    for end in range(MIN_TRAIN_MONTHS, len(series), step):
+        history = series.iloc[:end]
+        months = horizon_months(history.index[-1], horizon)
+        actual = series.reindex(months).dropna()
+        if actual.empty:
+            continue
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        predict = fit(history)
+        fitted = time.perf_counter()
+        predicted = predict(pd.DatetimeIndex(actual.index))
+        fit_times.append(fitted - start)
+        predict_times.append(time.perf_counter() - fitted)
+        if measure_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        errors.extend(np.abs(predicted - actual.to_numpy()))
+        nonzero = actual.to_numpy() != 0
+        pct_errors.extend(np.abs(predicted - actual.to_numpy())[nonzero] / np.abs(actual.to_numpy()[nonzero]))
+    return {
+        "origenes": len(fit_times),
+        "mae": float(np.mean(errors)) if errors else np.nan,
+        "mape": float(np.mean(pct_errors)) * 100 if pct_errors else np.nan,
+        "ajuste_ms": float(np.mean(fit_times)) * 1000 if fit_times else np.nan,
+        "proyeccion_ms": float(np.mean(predict_times)) * 1000 if predict_times else np.nan,
+        "memoria_kib": float(np.max(peaks)) / 1024 if peaks else np.nan,
+    }
+
+
+def collect_series(args):
+    """{(conjunto, largo en meses): [series]} de todas las fuentes pedidas."""
+    datasets = {}
+    for n_months in args.months:
+        datasets[("sintética", n_months)] = [generate_monthly_series(n_months, seed=seed) for seed in range(args.seeds)]
+    for years in args.years:
+        df = clean_sheet_values(generate_sheet_values(args.rows, years=years, seed=years))
+        series = [monthly_history(df)["Total"]] + [values for _, values in monthly_history(df, args.dimension).items()]
+        datasets[("forma real", years * 12)] = series
+    if args.snapshot:
+        from snapshot import load_snapshot
+
+        loaded = load_snapshot(args.snapshot)
+        if loaded is None:
+            print(f"Sin snapshot compatible en {args.snapshot}; se omite.")
+        else:
+            df = loaded[0]
+            history = monthly_history(df)["Total"]
+            datasets[("snapshot", len(history))] = [history] + [values for _, values in monthly_history(df, args.dimension).items()]
+    return datasets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", type=int, nargs="*", default=[24, 36, 60, 120])
+    parser.add_argument("--years", type=int, nargs="*", default=[2, 4])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dimension", default="Sucursal")
+    parser.add_argument("--snapshot", help="Parquet de snapshot.py con la hoja real")
+    parser.add_argument("--seeds", type=int, default=3, help="series sintéticas por largo")
+    parser.add_argument("--horizon", type=int, default=0, help="meses a proyectar; 0 = hasta diciembre (como la app)")
+    parser.add_argument("--step", type=int, default=1, help="meses entre orígenes")
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("--csv", help="guarda los resultados en este archivo")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    rows = []
+    for (dataset, n_months), series_list in collect_series(args).items():
+        for method in args.methods:
+            results = [backtest(series, METHODS[method], args.horizon, args.step) for series in series_list]
+            summary = pd.DataFrame(results).mean(numeric_only=True).to_dict()
+            summary["origenes"] = int(sum(r["origenes"] for r in results))
+            rows.append({"conjunto": dataset, "meses": n_months, "series": len(series_list), "método": method, **summary})
+
+    report = pd.DataFrame(rows)
+    with pd.option_context("display.width", 200, "display.max_rows", None, "display.float_format", "{:,.2f}".format):
+        print(report.to_string(index=False))
+        print("\nMejor MAPE por conjunto y largo:")
+        best = report.loc[report.groupby(["conjunto", "meses"])["mape"].idxmin(), ["conjunto", "meses", "método", "mape", "ajuste_ms"]]
+        print(best.to_string(index=False))
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Preguntas en lote: una tras otra (como en la app) contra batch_questions.run_batch, con y sin deduplicar.
+
+Gemini se reemplaza por el sustituto de bench/stand_ins.py con latencia
+simulada; las preguntas que el parser local no resuelve cuestan dos llamadas
+(intención y análisis). Cada caso parte con la caché de
+respuestas vacía. El cliente de Gemini conserva su límite por defecto de
+llamadas simultáneas (GEMINI_MAX_CONCURRENT), así que con más hilos que ese
+límite las llamadas esperan su turno, igual que en la app.
+
+Uso: python -m bench.bench_batch --rows 20000 --latency 0.8 --workers 1 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+from batch_questions import read_questions, run_batch
+from bench.stand_ins import DEFAULT_INTENT, FakeSheetsClient, fake_gemini_client
+from bench.synthetic import generate_sheet_values
+from data_loader import SheetCache
+from dataset_profile import ProfileStore
+from dataset_store import DatasetStore
+from forecasting import ForecastEngine
+from query_engine import QueryEngine
+from response_cache import ResponseCache
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(__file__), "questions.txt")
+# Las preguntas que llegan a Gemini suelen ser abiertas (análisis, proyecciones): intención sin cálculo local
+ANALYSIS_INTENT = dict(DEFAULT_INTENT, calculation_type="none", summary_response="")
+
+
+def build_engine(values, latency, cache_path):
+    gemini = fake_gemini_client(intent=ANALYSIS_INTENT, latency_seconds=latency)
+    return QueryEngine(SheetCache(FakeSheetsClient(values), "hoja-sintética"), DatasetStore(), ProfileStore(),
+                       ResponseCache(cache_path), gemini, ForecastEngine(max_workers=1), api_key="bench",
+                       streaming=False)
+
+
+def sequential(engine, questions):
+    data = engine.load()
+    for question in questions:
+        engine.ask(question, data=data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--latency", type=float, default=0.8, help="segundos por llamada a Gemini")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = read_questions(f)
+    values = generate_sheet_values(args.rows)
+    print(f"{len(questions)} preguntas, {args.rows:,} filas, {args.latency * 1000:.0f} ms por llamada a Gemini")
+    print(f"{'caso':>28} {'respondidas':>12} {'llamadas Gemini':>16} {'tiempo (s)':>11} {'preg/min':>9}")
+    cases = [("una tras otra", None, False)]
+    cases += [(f"lote {workers} hilos sin dedupe", workers, False) for workers in args.workers]
+    cases += [(f"lote {workers} hilos", workers, True) for workers in args.workers]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (label, workers, dedupe) in enumerate(cases):
+            engine = build_engine(values, args.latency, os.path.join(tmp_dir, f"cache-{i}.sqlite"))
+            engine.load()  # descarga, limpieza y perfil fuera de la medición
+            start = time.perf_counter()
+            if workers is None:
+                sequential(engine, questions)
+                answered = len(questions)
+            else:
+                run = run_batch(engine, questions, workers=workers, dedupe=dedupe)
+                answered = run.summary()["respondidas"]
+            seconds = time.perf_counter() - start
+            print(f"{label:>28} {answered:>12} {engine.gemini_client.session.calls:>16} {seconds:>11.2f} "
+                  f"{len(questions) / seconds * 60:>9.1f}")
+            engine.forecast_engine.close()
+
+
+if __name__ == "__main__":
+    main()
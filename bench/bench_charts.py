@@ -0,0 +1,56 @@
+"""Tamaño del JSON de Plotly y tiempo de armado de gráficos grandes, sin reducir y con chart_render.downsample.
+
+Uso: python -m bench.bench_charts --rows 10000 100000 1000000
+"""
+import argparse
+import time
+
+import plotly.express as px
+
+from bench.synthetic import generate_sheet_values
+from chart_render import DEFAULT_MAX_POINTS, downsample
+from data_loader import clean_sheet_values
+
+
+def daily(df):
+    frame = df.assign(Fecha_Agrupada=df["Fecha"].dt.normalize())
+    return frame.groupby(["Fecha_Agrupada", "Tipo Cliente"], as_index=False, observed=True)["Monto Facturado"].sum()
+
+
+CASES = {
+    # (tipo, datos, x, y, color)
+    "dispersión": ("scatter", lambda df: df, "Monto Facturado", "Costos Financieros", None),
+    "línea sin agregar": ("line", lambda df: df.sort_values("Fecha"), "Fecha", "Monto Facturado", None),
+    "línea diaria x tipo": ("line", daily, "Fecha_Agrupada", "Monto Facturado", "Tipo Cliente"),
+}
+
+
+def build(kind, df, x, y, color, render_mode):
+    plot = px.scatter if kind == "scatter" else px.line
+    start = time.perf_counter()
+    payload = plot(df, x=x, y=y, color=color, render_mode=render_mode).to_json()
+    return time.perf_counter() - start, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS)
+    args = parser.parse_args()
+
+    print(f"{'filas':>9} {'caso':>20} {'puntos':>15} {'antes (KB)':>11} {'después (KB)':>13} {'antes (ms)':>11} {'después (ms)':>13}")
+    for n_rows in args.rows:
+        df = clean_sheet_values(generate_sheet_values(n_rows))
+        for label, (kind, prepare, x, y, color) in CASES.items():
+            data = prepare(df)
+            before_s, before_bytes = build(kind, data, x, y, color, "svg")
+            start = time.perf_counter()
+            sample = downsample(data, x, y, color, kind=kind, max_points=args.max_points)
+            sample_s = time.perf_counter() - start
+            after_s, after_bytes = build(kind, sample.df, x, y, color, sample.render_mode)
+            print(f"{n_rows:>9} {label:>20} {f'{sample.points}/{sample.original_points}':>15} {before_bytes / 1024:>11,.0f} "
+                  f"{after_bytes / 1024:>13,.0f} {before_s * 1000:>11.0f} {(sample_s + after_s) * 1000:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
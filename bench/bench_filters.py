@@ -0,0 +1,75 @@
+"""Compara el filtrado encadenado original (copia + máscara por filtro) con FilterPlan.
+
+Uso: python -m bench.bench_filters --rows 100000 1000000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from bench.synthetic import generate_sheet_values
+from data_loader import clean_sheet_values
+from filter_engine import DatasetIndex, FilterPlan
+from intent_parser import MONTH_NAMES
+
+CASES = {
+    "año": {"filter_column": "Fecha", "filter_value": "2023"},
+    "mes": {"filter_column": "Fecha", "filter_value": "Marzo"},
+    "rango + categoría": {"start_date": "2023-03-01", "end_date": "2024-06-30",
+                          "additional_filters": [{"column": "Tipo Cliente", "value": "particular"}]},
+    "año + 2 categorías": {"filter_column": "Fecha", "filter_value": "2024",
+                           "additional_filters": [{"column": "Sucursal", "value": "centro"},
+                                                  {"column": "Estado Pago", "value": "pagado"}]},
+}
+
+
+def legacy_filter(df, chart_data):
+    # Copia de la lógica previa a filter_engine.py, solo para comparar
+    filtered_df = df.copy()
+    if chart_data.get("filter_column") and chart_data.get("filter_value"):
+        if chart_data["filter_column"] == "Fecha":
+            try:
+                filtered_df = filtered_df[filtered_df["Fecha"].dt.year == int(chart_data["filter_value"])]
+            except ValueError:
+                month = MONTH_NAMES.get(chart_data["filter_value"].lower())
+                if month:
+                    filtered_df = filtered_df[filtered_df["Fecha"].dt.month == month]
+        else:
+            filtered_df = filtered_df[filtered_df[chart_data["filter_column"]].astype(str).str.contains(chart_data["filter_value"], case=False, na=False)]
+    if chart_data.get("start_date"):
+        filtered_df = filtered_df[filtered_df["Fecha"] >= pd.to_datetime(chart_data["start_date"])]
+    if chart_data.get("end_date"):
+        filtered_df = filtered_df[filtered_df["Fecha"] <= pd.to_datetime(chart_data["end_date"])]
+    for add_filter in chart_data.get("additional_filters", []):
+        filtered_df = filtered_df[filtered_df[add_filter["column"]].astype(str).str.contains(add_filter["value"], case=False, na=False)]
+    return filtered_df
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'filas':>9} {'caso':>20} {'resultado':>10} {'antes (ms)':>11} {'después (ms)':>13}")
+    for n_rows in args.rows:
+        df = clean_sheet_values(generate_sheet_values(n_rows))
+        index_seconds, index = timed(lambda: DatasetIndex.build(df), repeat=1)
+        print(f"{n_rows:>9} {'(construir índice)':>20} {'':>10} {'':>11} {index_seconds * 1000:>13.1f}")
+        for label, chart_data in CASES.items():
+            before, expected = timed(lambda: legacy_filter(df, chart_data))
+            after, result = timed(lambda: FilterPlan.from_chart_data(chart_data, df.columns).apply(index))
+            assert result.index.equals(expected.index), label
+            print(f"{n_rows:>9} {label:>20} {len(result):>10} {before * 1000:>11.1f} {after * 1000:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compara el ajuste de proyecciones por segmento: en serie, con el pool de procesos y desde la caché.
+
+Uso: python -m bench.bench_forecast --rows 100000 --workers 4
+"""
+import argparse
+import time
+import warnings
+
+from bench.synthetic import generate_sheet_values
+from data_loader import clean_sheet_values
+from forecasting import FORECAST_DIMENSIONS, ForecastEngine
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    print(f"{'filas':>9} {'series':>7} {'serie (ms)':>11} {'pool (ms)':>10} {'caché (ms)':>11}")
+    pool_engine = ForecastEngine(max_workers=args.workers, min_parallel=1)
+    try:
+        for n_rows in args.rows:
+            df = clean_sheet_values(generate_sheet_values(n_rows))
+            serial_engine = ForecastEngine(max_workers=1)
+            serial, expected = timed(lambda: serial_engine.for_version("serie", df).segments(FORECAST_DIMENSIONS[0]))
+            # Arranque del pool fuera de la medición (en la app ocurre al crear el motor)
+            pool_engine.warm_up()
+            pool_engine.fit_many({"arranque": serial_engine.for_version("serie", df).history()["Total"]})
+            forecasts = pool_engine.for_version(f"pool-{n_rows}", df)
+            pooled, result = timed(lambda: forecasts.segments(FORECAST_DIMENSIONS[0]))
+            cached, _ = timed(lambda: forecasts.segments(FORECAST_DIMENSIONS[0]))
+            assert all(abs(result[k].level - expected[k].level) < 1e-6 for k in expected)
+            print(f"{n_rows:>9} {serial_engine.fits:>7} {serial * 1000:>11.1f} {pooled * 1000:>10.1f} {cached * 1000:>11.3f}")
+    finally:
+        pool_engine.close()
+
+
+if __name__ == "__main__":
+    main()
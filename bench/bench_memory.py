@@ -0,0 +1,66 @@
+"""Memoria de N sesiones simultáneas: una copia del DataFrame por sesión (antes) contra vistas de DatasetStore.
+
+Cada sesión simulada toma sus datos, filtra un año y agrega una columna de
+mes, como en una consulta de gráfico. Se reporta la memoria propia de las
+sesiones (dataset_store.own_bytes) y, en Linux, el RSS del proceso.
+
+Uso: python -m bench.bench_memory --rows 100000 --sessions 30
+"""
+import argparse
+import gc
+import os
+
+from bench.synthetic import generate_sheet_values
+from data_loader import clean_sheet_values
+from dataset_store import MB, DatasetStore, own_bytes
+
+
+def rss_mb():
+    """RSS actual del proceso en MB (None fuera de Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError):
+        return None
+
+
+def session_frames(df):
+    year = df["Fecha"].dt.year.max()
+    filtered = df[df["Fecha"].dt.year == year]
+    filtered["Fecha_Agrupada"] = filtered["Fecha"].dt.to_period("M").dt.to_timestamp()
+    return [df, filtered]
+
+
+def run(base, n_sessions, shared):
+    store = DatasetStore()
+    store.publish("v1", base)
+    gc.collect()
+    before = rss_mb()
+    sessions = []
+    for i in range(n_sessions):
+        df = store.view("v1", f"sesion-{i}") if shared else base.copy()
+        sessions.append(session_frames(df))
+    gc.collect()
+    after = rss_mb()
+    own = sum(own_bytes(frame, [base]) for frames in sessions for frame in frames) / MB
+    return own, (after - before) if before is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 30])
+    args = parser.parse_args()
+
+    base = clean_sheet_values(generate_sheet_values(args.rows))
+    print(f"{args.rows:,} filas, dataset de {base.memory_usage(deep=True).sum() / MB:,.1f} MB")
+    print(f"{'sesiones':>9} {'modo':>18} {'MB propios':>11} {'MB/sesión':>10} {'Δ RSS (MB)':>11}")
+    for n_sessions in args.sessions:
+        for label, shared in (("copia por sesión", False), ("vistas compartidas", True)):
+            own, rss = run(base, n_sessions, shared)
+            rss_text = f"{rss:>11,.1f}" if rss is not None else f"{'-':>11}"
+            print(f"{n_sessions:>9} {label:>18} {own:>11,.1f} {own / n_sessions:>10,.2f} {rss_text}")
+
+
+if __name__ == "__main__":
+    main()
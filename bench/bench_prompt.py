@@ -0,0 +1,96 @@
+"""Tamaño de los prompts de Gemini y latencia según el tamaño de la hoja.
+
+Uso: python -m bench.bench_prompt [--rows 1000 10000 100000] [--budget 6000]
+                                  [--api-key CLAVE [--base-url URL]]
+
+Compara el prompt de antes de prompt_builder.py (plantilla indentada dentro de
+app.py y perfil sin recortar) con el prompt dentro del presupuesto de tokens.
+Sin --api-key solo se mide la preparación local (perfil + prompt); con --api-key
+también la llamada a Gemini (o a un servidor compatible indicado en --base-url)
+y los tokens que informa la API.
+"""
+import argparse
+import textwrap
+import time
+
+from bench.synthetic import generate_sheet_values
+from data_loader import clean_sheet_values
+from dataset_profile import DatasetProfile
+from prompt_builder import (ANALYSIS_PROMPT, DEFAULT_TOKEN_BUDGET, INTENT_PROMPT, PromptBuilder,
+                            estimate_tokens, INTENT_RESPONSE_SCHEMA)
+
+QUESTIONS = {
+    "intent": "creame un grafico con la evolucion de ventas de 2025 separado por particular y seguro",
+    "analysis": "puedes darme insights de mejora para los proximos meses",
+}
+
+
+# Indentación que tenían las plantillas dentro de app.py
+LEGACY_INDENT = {"intent": 32, "analysis": 28}
+
+
+def legacy_payload(kind, profile, question):
+    template = INTENT_PROMPT if kind == "intent" else ANALYSIS_PROMPT
+    first, rest = template.split("\n", 1)
+    template = first + "\n" + textwrap.indent(rest, " " * LEGACY_INDENT[kind], lambda line: True)
+    text = template.format(available_columns_str=profile.available_columns_str,
+                           df_summary_str=profile.summary_str, pregunta=question)
+    config = {"responseMimeType": "application/json", "responseSchema": INTENT_RESPONSE_SCHEMA} \
+        if kind == "intent" else {"temperature": 0.5}
+    return {"contents": [{"role": "user", "parts": [{"text": text}]}], "generationConfig": config}, estimate_tokens(text)
+
+
+def call_gemini(client, payload, api_key):
+    start = time.perf_counter()
+    response = client.generate_content(payload, api_key)
+    seconds = time.perf_counter() - start
+    usage = response.json().get("usageMetadata", {}) if response.status_code == 200 else {}
+    return seconds, usage.get("promptTokenCount")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--api-key", help="medir también la llamada a Gemini")
+    parser.add_argument("--base-url", help="URL base de la API (p. ej. un servidor simulado)")
+    args = parser.parse_args()
+
+    client = None
+    if args.api_key:
+        from gemini_client import API_BASE_URL, GeminiClient
+        client = GeminiClient(base_url=args.base_url or API_BASE_URL)
+
+    header = f"{'filas':>8} {'llamada':>9} {'versión':>12} {'tokens':>7} {'perfil (ms)':>12} {'prompt (ms)':>12}"
+    if client is not None:
+        header += f" {'Gemini (s)':>11} {'tokens API':>11}"
+    print(header)
+    for n_rows in args.rows:
+        df = clean_sheet_values(generate_sheet_values(n_rows))
+        start = time.perf_counter()
+        profile = DatasetProfile.build(df)
+        profile_ms = (time.perf_counter() - start) * 1000
+
+        for kind, question in QUESTIONS.items():
+            start = time.perf_counter()
+            payload, tokens = legacy_payload(kind, profile, question)
+            rows = [("antes", payload, tokens, (time.perf_counter() - start) * 1000)]
+
+            builder = PromptBuilder(profile, args.budget, stats=None)
+            start = time.perf_counter()
+            payload, stats = builder.intent_payload(question) if kind == "intent" else builder.analysis_payload(question)
+            rows.append(("presupuesto", payload, stats["tokens"], (time.perf_counter() - start) * 1000))
+
+            for label, payload, tokens, prompt_ms in rows:
+                line = f"{n_rows:>8} {kind:>9} {label:>12} {tokens:>7} {profile_ms:>12.1f} {prompt_ms:>12.2f}"
+                if client is not None:
+                    seconds, api_tokens = call_gemini(client, payload, args.api_key)
+                    line += f" {seconds:>11.2f} {api_tokens if api_tokens is not None else '-':>11}"
+                print(line)
+
+    if client is not None:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compara la limpieza original (objetos + to_numeric) con el esquema tipado.
+
+Uso: python -m bench.bench_schema --rows 10000 100000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from bench.synthetic import generate_sheet_values
+from data_loader import clean_sheet_values
+
+
+def legacy_clean(values):
+    # Copia de la limpieza previa a schema.py, solo para comparar
+    df = pd.DataFrame(values[1:], columns=values[0])
+    df.columns = df.columns.str.strip()
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+    df['Monto Facturado'] = df['Monto Facturado'].astype(str).str.replace('[$,.]', '', regex=True)
+    df['Monto Facturado'] = df['Monto Facturado'].str.replace(',', '.', regex=False)
+    df['Monto Facturado'] = pd.to_numeric(df['Monto Facturado'], errors="coerce")
+    for col in ['Materiales y Pintura', 'Costos Financieros', 'Descuento Aplicado (%)']:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df.dropna(subset=["Fecha", "Monto Facturado"], inplace=True)
+    return df
+
+
+def measure(clean, values):
+    start = time.perf_counter()
+    df = clean(values)
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for col in ["Sucursal", "Tipo Cliente", "Cliente", "Estado Pago"]:
+        df.groupby(col, observed=True)["Monto Facturado"].sum()
+    groupby_seconds = time.perf_counter() - start
+
+    return {
+        "parse_s": parse_seconds,
+        "groupby_s": groupby_seconds,
+        "memory_mb": df.memory_usage(deep=True).sum() / 1e6,
+        "nan_materiales": int(df["Materiales y Pintura"].isna().sum()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'versión':>8} {'parse (s)':>10} {'groupby (s)':>12} {'memoria (MB)':>13} {'NaN Materiales':>15}")
+    for n_rows in args.rows:
+        values = generate_sheet_values(n_rows)
+        for label, clean in (("antes", legacy_clean), ("después", clean_sheet_values)):
+            r = measure(clean, values)
+            print(f"{n_rows:>10} {label:>8} {r['parse_s']:>10.3f} {r['groupby_s']:>12.4f} {r['memory_mb']:>13.1f} {r['nan_materiales']:>15}")
+
+
+if __name__ == "__main__":
+    main()
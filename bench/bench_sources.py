@@ -0,0 +1,58 @@
+"""Carga de una planilla con varias pestañas (una por sucursal): lectura secuencial vs data_loader.load_sources.
+
+La latencia de la API se simula con time.sleep en los sustitutos de gspread.
+
+Uso: python -m bench.bench_sources --tabs 12 --rows 5000 --latency 0.3
+"""
+import argparse
+import time
+
+from bench.stand_ins import FakeBatchSpreadsheet, FakeSheetsClient, FakeSpreadsheet, FakeWorksheet
+from bench.synthetic import generate_sheet_values
+from data_loader import ALL_WORKSHEETS, SheetSource, clean_sheet_values, concat_sources, load_sources
+
+URL = "planilla-sucursales"
+
+
+def sequential(spreadsheet):
+    """Como se haría sin load_sources: una pestaña tras otra, en el hilo actual."""
+    frames = [(worksheet.title, clean_sheet_values(worksheet.get_all_values())) for worksheet in spreadsheet.worksheets()]
+    return concat_sources(frames)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tabs", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=5000, help="filas por pestaña")
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos por llamada a la API")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    worksheets = [FakeWorksheet(generate_sheet_values(args.rows, seed=i), title=f"Sucursal {i + 1}",
+                                latency_seconds=args.latency) for i in range(args.tabs)]
+    per_tab = FakeSpreadsheet(worksheets)
+    batch = FakeBatchSpreadsheet(worksheets, latency_seconds=args.latency)
+    source = [SheetSource(URL, [ALL_WORKSHEETS])]
+
+    cases = {
+        "secuencial": lambda: sequential(per_tab),
+        "paralelo (una llamada por pestaña)": lambda: load_sources(
+            FakeSheetsClient(spreadsheets={URL: per_tab}), source, args.workers)[0],
+        "lectura por lotes": lambda: load_sources(
+            FakeSheetsClient(spreadsheets={URL: batch}), source, args.workers)[0],
+    }
+    print(f"{args.tabs} pestañas x {args.rows:,} filas, {args.latency * 1000:.0f} ms por llamada")
+    print(f"{'caso':>36} {'filas':>9} {'tiempo (s)':>11}")
+    for label, fn in cases.items():
+        seconds, df = timed(fn)
+        print(f"{label:>36} {len(df):>9,} {seconds:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
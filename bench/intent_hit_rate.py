@@ -0,0 +1,58 @@
+"""Reporte de tasa de acierto del parser local de intención (intent_parser.py).
+
+Uso: python -m bench.intent_hit_rate [--questions bench/questions.txt] [--snapshot .cache/fenix_snapshot.parquet] [-v]
+
+Las preguntas reconocidas no necesitan la primera llamada a Gemini. Sin
+--snapshot se usan los valores de categoría de las hojas sintéticas.
+"""
+import argparse
+import os
+import time
+
+from bench import synthetic
+from intent_parser import IntentParser, IntentParserStats
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(__file__), "questions.txt")
+
+
+def synthetic_category_values():
+    return {"Tipo Cliente": synthetic.TIPOS_CLIENTE, "Tipo Vehículo": synthetic.TIPOS_VEHICULO,
+            "Sucursal": synthetic.SUCURSALES, "Ejecutivo": synthetic.EJECUTIVOS,
+            "Estado Pago": synthetic.ESTADOS_PAGO, "Forma de Pago": synthetic.FORMAS_PAGO}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--snapshot", help="usar los valores de categoría de un snapshot local")
+    parser.add_argument("-v", "--verbose", action="store_true", help="mostrar cada pregunta")
+    args = parser.parse_args()
+
+    stats = IntentParserStats()
+    if args.snapshot:
+        from dataset_profile import DatasetProfile
+        from snapshot import load_snapshot
+        df, _ = load_snapshot(args.snapshot)
+        intent_parser = IntentParser.from_profile(DatasetProfile.build(df), stats=stats)
+    else:
+        intent_parser = IntentParser(synthetic_category_values(), stats=stats)
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    start = time.perf_counter()
+    for question in questions:
+        result = intent_parser.parse(question)
+        if args.verbose:
+            kind = "-" if result is None else (result["chart_type"] if result["is_chart_request"] else result["calculation_type"])
+            print(f"{'✔' if result else '·'} {kind:<40} {question}")
+    elapsed = time.perf_counter() - start
+
+    print(f"\nPreguntas: {len(questions)}  |  resueltas localmente: {stats.hits}  |  enviadas a Gemini: {stats.misses}")
+    print(f"Tasa de acierto: {stats.hit_rate:.1%}  |  tiempo medio del parser: {elapsed / max(len(questions), 1) * 1000:.2f} ms")
+    for kind, count in sorted(stats.by_type.items(), key=lambda item: -item[1]):
+        print(f"  {kind:<40} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Prueba de carga: N sesiones simultáneas haciendo preguntas mixtas, con throughput y percentiles de latencia.
+
+Por defecto todo corre en este proceso y sin red: el motor de consultas de la
+app (query_engine.py, con streaming como en la app) sobre una hoja sintética
+(SyntheticSheetsClient) y el simulador de Gemini de bench/mock_gemini.py.
+Con `--url` se prueba en cambio un api_server.py ya levantado (configurado,
+por ejemplo, con GEMINI_BASE_URL apuntando al simulador).
+
+Cada sesión elige preguntas al azar de `--questions` y espera un tiempo de
+lectura exponencial (media `--think`) entre una y otra. Se prueba cada nivel
+de `--sessions` durante `--duration` segundos; cada nivel parte con la caché
+de respuestas vacía (`--no-cache` la desactiva del todo).
+
+Uso: python -m bench.load_test --sessions 1 5 10 20 --duration 30 --latency 0.8 --errors 429:0.02,503:0.01
+     python -m bench.load_test --url http://127.0.0.1:8502 --sessions 4 8
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+import requests
+
+from batch_questions import read_questions
+from bench.mock_gemini import MockGeminiServer, parse_errors
+from bench.stand_ins import SyntheticSheetsClient
+from data_loader import SheetCache
+from dataset_profile import ProfileStore
+from dataset_store import DatasetStore
+from forecasting import ForecastEngine
+from gemini_client import GeminiClient
+from query_engine import QueryEngine
+from response_cache import ResponseCache
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(__file__), "questions.txt")
+PERCENTILES = (50, 95, 99)
+
+
+class LoadResult:
+    """Consultas de un nivel de carga: (segundos, tipo de resultado) por consulta."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.samples = []
+        self.wall_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, kind):
+        with self._lock:
+            self.samples.append((seconds, kind))
+
+    def summary(self):
+        latencies = np.array([seconds for seconds, _ in self.samples]) if self.samples else np.zeros(1)
+        kinds = {}
+        for _, kind in self.samples:
+            kinds[kind] = kinds.get(kind, 0) + 1
+        return {"sessions": self.sessions, "queries": len(self.samples), "errors": kinds.get("error", 0),
+                "throughput_qps": len(self.samples) / self.wall_seconds if self.wall_seconds else 0.0,
+                **{f"p{p}_s": float(np.percentile(latencies, p)) for p in PERCENTILES},
+                "max_s": float(latencies.max()), "kinds": kinds}
+
+
+def engine_target(engine):
+    """Función pregunta -> tipo de resultado, contra el motor en este proceso (una sesión por hilo)."""
+    def ask(question, cancel_event):
+        return engine.ask(question, cancel_event=cancel_event).kind
+    return ask
+
+
+def http_target(url):
+    """Función pregunta -> tipo de resultado, contra un api_server.py (una conexión por sesión)."""
+    local = threading.local()
+
+    def ask(question, cancel_event):
+        session = getattr(local, "session", None) or requests.Session()
+        local.session = session
+        response = session.post(url.rstrip("/") + "/query", json={"question": question, "max_rows": 50}, timeout=300)
+        return response.json().get("kind", "error") if response.status_code == 200 else "error"
+    return ask
+
+
+def run_level(target, questions, sessions, duration, think, seed=0):
+    """Corre `sessions` sesiones durante `duration` segundos y devuelve un LoadResult."""
+    result = LoadResult(sessions)
+    deadline = time.perf_counter() + duration
+
+    def session(index):
+        rng = random.Random(seed * 1000 + index)
+        cancel_event = threading.Event()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                kind = target(rng.choice(questions), cancel_event)
+            except Exception:
+                kind = "error"
+            result.add(time.perf_counter() - start, kind)
+            if think:
+                time.sleep(min(rng.expovariate(1 / think), max(0.0, deadline - time.perf_counter())))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,), name=f"sesion-{i}") for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Las consultas en curso al vencer el plazo terminan y cuentan: el tiempo es el real, no `duration`
+    result.wall_seconds = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--duration", type=float, default=30, help="segundos por nivel de carga")
+    parser.add_argument("--think", type=float, default=2.0, help="segundos medios entre preguntas de una sesión")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--url", help="api_server.py a probar en vez del motor en este proceso")
+    parser.add_argument("--rows", type=int, default=20_000, help="filas de la hoja sintética")
+    parser.add_argument("--sheet-latency", type=float, default=0.5, help="segundos por descarga de la hoja")
+    parser.add_argument("--sheet-update-every", type=float, default=0,
+                        help="cada cuántos segundos la hoja recibe filas nuevas (0: nunca)")
+    parser.add_argument("--gemini-url", help="Gemini (o simulador) ya levantado; si falta se inicia uno local")
+    parser.add_argument("--latency", type=float, default=0.8, help="mediana de segundos por llamada a Gemini")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--errors", default="", help="p. ej. 429:0.02,503:0.01,timeout:0.005")
+    parser.add_argument("--gemini-concurrency", type=int, default=4, help="GEMINI_MAX_CONCURRENT")
+    parser.add_argument("--no-cache", action="store_true", help="sin caché de respuestas")
+    parser.add_argument("--output", help="guardar los resultados en JSON")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = read_questions(f)
+
+    mock = sheets = engine = None
+    stop = threading.Event()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.url:
+            target = http_target(args.url)
+            print(f"Probando {args.url}")
+        else:
+            if args.gemini_url:
+                gemini_url = args.gemini_url
+            else:
+                mock = MockGeminiServer(("127.0.0.1", 0), args.latency, args.latency_sigma, parse_errors(args.errors),
+                                        hang_seconds=30).start()
+                gemini_url = mock.base_url
+            sheets = SyntheticSheetsClient(args.rows, latency_seconds=args.sheet_latency)
+            sheet_cache = SheetCache(sheets, "hoja-sintética")
+            gemini = GeminiClient(base_url=gemini_url, read_timeout=20, max_concurrent=args.gemini_concurrency)
+            engine = QueryEngine(sheet_cache, DatasetStore(), ProfileStore(),
+                                 ResponseCache(os.path.join(tmp_dir, "cache.sqlite")), gemini, ForecastEngine(),
+                                 api_key="load-test")
+            target = engine_target(engine)
+            data = engine.load()
+            engine.prepare_version(data.fingerprint, data.df)
+            if args.sheet_update_every:
+                sheet_cache.start_background_refresh(max(1, int(args.sheet_update_every / 2)),
+                                                     on_new_version=engine.prepare_version)
+
+                def grow():
+                    while not stop.wait(args.sheet_update_every):
+                        sheets.append_rows(max(1, args.rows // 100))
+                threading.Thread(target=grow, daemon=True, name="hoja-crece").start()
+            print(f"Motor en proceso: {len(data.df):,} filas, Gemini en {gemini_url}")
+
+        print(f"{len(questions)} preguntas, {args.duration:.0f} s por nivel, {args.think:.1f} s de espera media")
+        header = f"{'sesiones':>9} {'consultas':>10} {'errores':>8} {'consultas/s':>12}" + \
+            "".join(f" {f'p{p} (s)':>9}" for p in PERCENTILES) + f" {'máx (s)':>9}"
+        print(header)
+        results = []
+        for level, sessions in enumerate(args.sessions):
+            if engine is not None:
+                # Caché de respuestas nueva por nivel, para que un nivel no se beneficie del anterior
+                engine.response_cache = ResponseCache(os.path.join(tmp_dir, f"cache-{level}.sqlite"),
+                                                      ttl_seconds=0 if args.no_cache else 3600)
+            summary = run_level(target, questions, sessions,
+                                args.duration, args.think, seed=level).summary()
+            results.append(summary)
+            print(f"{sessions:>9} {summary['queries']:>10} {summary['errors']:>8} {summary['throughput_qps']:>12.2f}"
+                  + "".join(f" {summary[f'p{p}_s']:>9.2f}" for p in PERCENTILES) + f" {summary['max_s']:>9.2f}")
+
+        stop.set()
+        if mock is not None:
+            print(f"Llamadas al simulador de Gemini: {json.dumps(mock.stats, ensure_ascii=False)}")
+            mock.shutdown()
+        if engine is not None:
+            print(f"Versiones de la hoja: {engine.sheet_cache.fingerprint} ({engine.sheet_cache.downloads} descargas)")
+            engine.forecast_engine.close()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Servidor HTTP local que imita la API de Gemini que usa la app, para pruebas de carga sin red ni cuota.
+
+Implementa `models/{modelo}:generateContent` y `:streamGenerateContent?alt=sse`.
+Las llamadas de intención (`responseMimeType: application/json`) reciben un
+JSON con exactamente las propiedades del `responseSchema` del pedido,
+llenado a partir de la pregunta (parser local de la app o reglas simples).
+Las demás reciben un texto de análisis, en fragmentos si es streaming.
+
+La latencia es lognormal (mediana `--latency`, dispersión `--latency-sigma`) y
+los errores siguen `--errors`, p. ej. `429:0.02,503:0.03,timeout:0.01`:
+proporción de llamadas que responden ese código (429 con Retry-After) o que
+se cuelgan `--hang-seconds` antes de responder 504.
+
+Uso: python -m bench.mock_gemini --port 8601 --latency 0.8 --errors 429:0.02,503:0.02
+     y en .streamlit/secrets.toml: GEMINI_BASE_URL = "http://127.0.0.1:8601/v1beta"
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench.stand_ins import DEFAULT_ANALYSIS
+from intent_parser import IntentParser, IntentParserStats
+
+DEFAULT_PORT = 8601
+_QUESTION = re.compile(r"Pregunta del usuario:\**\s*\n?\s*\"?(.+?)\"?\s*$", re.MULTILINE)
+_PATH = re.compile(r"^/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)(\?.*)?$")
+_CHART_WORDS = re.compile(r"gr[aá]fic|evoluci[oó]n|tabla|lista", re.IGNORECASE)
+_FORECAST_WORDS = re.compile(r"proyec|estim|pron[oó]stic", re.IGNORECASE)
+_YEAR = re.compile(r"\b(20\d{2})\b")
+
+
+def parse_errors(spec):
+    """'429:0.02,503:0.03,timeout:0.01' -> [("429", 0.02), ("503", 0.03), ("timeout", 0.01)]."""
+    errors = []
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        code, _, rate = item.partition(":")
+        errors.append((code.strip(), float(rate)))
+    return errors
+
+
+def schema_defaults(schema):
+    """Valor vacío que cumple `schema` (formato de responseSchema de Gemini: OBJECT, STRING, ARRAY...)."""
+    kind = schema.get("type", "STRING").upper()
+    if kind == "OBJECT":
+        # Los objetos anidados (calculation_params) quedan vacíos, como cuando Gemini omite los opcionales
+        return {name: {} if prop.get("type", "").upper() == "OBJECT" else schema_defaults(prop)
+                for name, prop in schema.get("properties", {}).items()}
+    if kind == "ARRAY":
+        return []
+    if kind == "BOOLEAN":
+        return False
+    if kind in ("NUMBER", "INTEGER"):
+        return 0
+    if "enum" in schema:
+        return "none" if "none" in schema["enum"] else schema["enum"][0]
+    return ""
+
+
+def conform(value, schema):
+    """Copia de `value` con solo las propiedades del esquema (y las que falten con su valor vacío)."""
+    if schema.get("type", "").upper() != "OBJECT" or not isinstance(value, dict):
+        return value
+    defaults = schema_defaults(schema)
+    return {name: value.get(name, defaults[name]) for name in defaults}
+
+
+def mock_intent(question, schema, parser=None):
+    """JSON de intención plausible para `question`, con la forma de `schema`."""
+    intent = (parser or IntentParser()).parse(question)
+    if intent is None:
+        intent = schema_defaults(schema)
+        if _FORECAST_WORDS.search(question):
+            years = _YEAR.findall(question)
+            year = int(years[-1]) if years else time.localtime().tm_year
+            intent.update(calculation_type="project_remaining_year", calculation_params={"target_year": year},
+                          summary_response="Aquí tienes una estimación de las ventas para lo que queda de [TARGET_YEAR]: "
+                                           "$[ESTIMACION_RESTO_YEAR].")
+        elif _CHART_WORDS.search(question):
+            intent.update(is_chart_request=True, chart_type="line", x_axis="Fecha", y_axis="Monto Facturado",
+                          aggregation_period="month", summary_response="Aquí tienes la evolución de Monto Facturado:")
+        # El resto queda sin cálculo y con summary_response vacía: la app pedirá el análisis
+    return conform(intent, schema)
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.8, latency_sigma=0.3, errors=None, hang_seconds=120,
+                 analysis=DEFAULT_ANALYSIS, chunks=8, seed=None):
+        super().__init__(address, MockGeminiHandler)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.errors = errors or []
+        self.hang_seconds = hang_seconds
+        self.analysis = analysis
+        self.chunks = max(1, chunks)
+        # Contadores propios: no se mezclan con los del parser de la app si corren en el mismo proceso
+        self.parser = IntentParser(stats=IntentParserStats())
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "intent": 0, "analysis": 0, "stream": 0, "errors": {}}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def _draw(self):
+        """(segundos de latencia, código de error o None) para una llamada."""
+        with self._lock:
+            seconds = self.latency * self._random.lognormvariate(0, self.latency_sigma) if self.latency else 0.0
+            roll = self._random.random()
+        for code, rate in self.errors:
+            if roll < rate:
+                return seconds, code
+            roll -= rate
+        return seconds, None
+
+    def _count(self, key, error=None):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats[key] += 1
+            if error is not None:
+                self.stats["errors"][error] = self.stats["errors"].get(error, 0) + 1
+
+    def start(self):
+        """Atiende en un hilo de fondo (para usarlo dentro de otro script); devuelve el servidor."""
+        threading.Thread(target=self.serve_forever, daemon=True, name="mock-gemini").start()
+        return self
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats)
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        match = _PATH.match(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if match is None:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+        stream = match.group(2) == "streamGenerateContent"
+        config = body.get("generationConfig", {})
+        is_intent = config.get("responseMimeType") == "application/json"
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        found = _QUESTION.findall(prompt)
+        question = found[-1] if found else prompt[-200:]
+
+        server = self.server
+        seconds, error = server._draw()
+        server._count("stream" if stream else "intent" if is_intent else "analysis", error)
+        if error == "timeout":
+            time.sleep(server.hang_seconds)
+            self._send_json(504, {"error": {"code": 504, "message": "Deadline exceeded"}})
+            return
+        if error is not None:
+            time.sleep(seconds)
+            self._send_json(int(error), {"error": {"code": int(error), "message": "Error simulado"}},
+                            headers={"Retry-After": "1"} if error == "429" else None)
+            return
+
+        usage = {"promptTokenCount": len(prompt) // 4}
+        if is_intent:
+            text = json.dumps(mock_intent(question, config.get("responseSchema", {}), server.parser), ensure_ascii=False)
+        else:
+            text = server.analysis
+        if not stream:
+            time.sleep(seconds)
+            self._send_json(200, {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+                                  "usageMetadata": usage})
+            return
+
+        # SSE: la mitad de la latencia hasta el primer fragmento y el resto repartido entre los demás
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        size = -(-len(text) // server.chunks)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        time.sleep(seconds / 2)
+        for piece in pieces:
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}], "usageMetadata": usage}
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(seconds / 2 / len(pieces))
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.8, help="mediana de segundos por llamada")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="dispersión lognormal (0 = fija)")
+    parser.add_argument("--errors", default="", help="p. ej. 429:0.02,503:0.03,timeout:0.01")
+    parser.add_argument("--hang-seconds", type=float, default=120, help="duración de los errores 'timeout'")
+    args = parser.parse_args()
+
+    server = MockGeminiServer((args.host, args.port), args.latency, args.latency_sigma, parse_errors(args.errors),
+                              args.hang_seconds)
+    print(f"Gemini simulado en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Sustitutos locales de gspread y de la API de Gemini para correr benchmarks sin red."""
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from bench.synthetic import generate_sheet_values
+from gemini_client import GeminiClient
+
+DEFAULT_INTENT = {"is_chart_request": False, "chart_type": "none", "x_axis": "", "y_axis": "", "color_column": "",
+                  "filter_column": "", "filter_value": "", "start_date": "", "end_date": "", "additional_filters": [],
+                  "summary_response": "El monto total facturado en todos los datos es de $[TOTAL_MONTO_FACTURADO].",
+                  "aggregation_period": "none", "table_columns": [],
+                  "calculation_type": "total_sales", "calculation_params": {}}
+DEFAULT_ANALYSIS = "Las ventas muestran estacionalidad marcada; conviene reforzar los meses de menor facturación."
+
+
+# --- gspread ---
+class FakeWorksheet:
+    def __init__(self, values, title="Hoja 1", latency_seconds=0.0):
+        self.values = values
+        self.title = title
+        self.latency_seconds = latency_seconds
+        self.reads = 0
+
+    def get_all_values(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        self.reads += 1
+        return self.values
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets, last_update_time="2024-01-01T00:00:00.000Z"):
+        self.worksheets_list = worksheets
+        self.lastUpdateTime = last_update_time
+
+    @property
+    def sheet1(self):
+        return self.worksheets_list[0]
+
+    def worksheets(self):
+        return list(self.worksheets_list)
+
+    def worksheet(self, title):
+        for worksheet in self.worksheets_list:
+            if worksheet.title == title:
+                return worksheet
+        raise KeyError(title)
+
+
+class FakeBatchSpreadsheet(FakeSpreadsheet):
+    """Planilla que además acepta `values_batch_get`: todas las pestañas pedidas en una sola llamada."""
+
+    def __init__(self, worksheets, last_update_time="2024-01-01T00:00:00.000Z", latency_seconds=0.0):
+        super().__init__(worksheets, last_update_time)
+        self.latency_seconds = latency_seconds
+        self.batch_reads = 0
+
+    def values_batch_get(self, ranges):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        self.batch_reads += 1
+        titles = [r.strip("'").replace("''", "'") for r in ranges]
+        return {"valueRanges": [{"range": r, "values": self.worksheet(title).values} for r, title in zip(ranges, titles)]}
+
+
+class FakeSheetsClient:
+    """Cliente con la interfaz de gspread que usa la app (`open_by_url`), sobre filas en memoria.
+
+    Con `spreadsheets` ({url: planilla}) sirve varias planillas; si no, una sola
+    planilla de una pestaña con `values` para cualquier URL.
+    """
+
+    def __init__(self, values=None, latency_seconds=0.0, spreadsheets=None):
+        self.spreadsheets = spreadsheets or {}
+        self.spreadsheet = FakeSpreadsheet([FakeWorksheet(values, latency_seconds=latency_seconds)]) if values else None
+        self.opens = 0
+
+    def open_by_url(self, url):
+        self.opens += 1
+        return self.spreadsheets.get(url, self.spreadsheet)
+
+
+class SyntheticSheetsClient(FakeSheetsClient):
+    """Hoja sintética (bench/synthetic.py) que puede crecer mientras se usa, como la planilla real.
+
+    `append_rows` agrega filas al final y cambia la fecha de modificación, así
+    que SheetCache detecta una versión nueva y la trata como un agregado.
+    """
+
+    def __init__(self, rows, latency_seconds=0.0, seed=0):
+        super().__init__(generate_sheet_values(rows, seed=seed), latency_seconds=latency_seconds)
+        self.seed = seed
+        self._lock = threading.Lock()
+
+    def append_rows(self, rows):
+        with self._lock:
+            self.seed += 1
+            worksheet = self.spreadsheet.sheet1
+            # Lista nueva: una descarga en curso conserva la versión anterior completa
+            worksheet.values = worksheet.values + generate_sheet_values(rows, seed=self.seed)[1:]
+            self.spreadsheet.lastUpdateTime = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+# --- Gemini ---
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {}
+        self.encoding = "utf-8"
+
+    @property
+    def text(self):
+        return json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+    def iter_lines(self, decode_unicode=False):
+        yield "data: " + json.dumps(self.body)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeGeminiSession:
+    """Reemplaza la requests.Session del GeminiClient: responde sin red con textos fijos.
+
+    Las llamadas con respuesta JSON (intención) devuelven `intent`; las demás,
+    `analysis`. `latency_seconds` simula el tiempo de la API.
+    """
+
+    def __init__(self, intent=None, analysis=DEFAULT_ANALYSIS, latency_seconds=0.0):
+        self.intent = intent or DEFAULT_INTENT
+        self.analysis = analysis
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+
+    def post(self, url, json=None, headers=None, params=None, timeout=None, stream=False):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        self.calls += 1
+        config = (json or {}).get("generationConfig", {})
+        text = _json_dumps(self.intent) if config.get("responseMimeType") == "application/json" else self.analysis
+        prompt_chars = sum(len(part.get("text", "")) for content in (json or {}).get("contents", [])
+                           for part in content.get("parts", []))
+        return FakeResponse({"candidates": [{"content": {"parts": [{"text": text}]}}],
+                             "usageMetadata": {"promptTokenCount": prompt_chars // 4}})
+
+    def close(self):
+        pass
+
+
+def _json_dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def fake_gemini_client(**kwargs):
+    """GeminiClient real (reintentos, semáforo, extracción de texto) sobre FakeGeminiSession."""
+    client = GeminiClient()
+    client.session.close()
+    client.session = FakeGeminiSession(**kwargs)
+    return client
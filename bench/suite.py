@@ -0,0 +1,209 @@
+"""Benchmark de cada etapa de la app sobre hojas sintéticas, sin red.
+
+Uso: python -m bench.suite [--rows 1000 10000 100000] [--stages carga limpieza ...]
+                           [--results bench/results.jsonl] [--threshold 1.25] [--fail-on-regression]
+
+Cada etapa se mide por separado (mejor tiempo de `--repeat` corridas y pico de
+memoria con tracemalloc en una corrida aparte). gspread y Gemini se reemplazan
+por los sustitutos de bench/stand_ins.py. Los resultados se agregan a
+`--results` (una línea JSON por etapa y tamaño, con el commit actual) y se
+comparan con la última corrida guardada de otro commit: las etapas más lentas
+que `--threshold` veces se marcan como regresión.
+
+Para 5M filas se necesitan varios GB de RAM (la hoja sintética se arma como
+listas de strings, igual que get_all_values()).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+from bench.bench_filters import CASES as FILTER_CASES
+from bench.stand_ins import FakeSheetsClient, fake_gemini_client
+from bench.synthetic import generate_sheet_values
+from cube import AggregateCube
+from data_loader import SheetCache, clean_sheet_values
+from dataset_profile import DatasetProfile
+from filter_engine import DatasetIndex, FilterPlan
+from forecasting import FORECAST_DIMENSIONS, ForecastEngine
+from gemini_client import extract_text
+from intent_parser import IntentParser
+from metrics import METRICS, MetricExecutor
+from prompt_builder import PromptBuilder
+import snapshot
+
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results.jsonl")
+QUESTION = "creame un grafico con la evolucion de ventas de 2025 separado por particular y seguro"
+# Tamaños de hoja de 1k a 5M filas; por defecto los que corren en segundos
+ALL_ROWS = [1_000, 10_000, 100_000, 1_000_000, 5_000_000]
+
+
+def calculation_params(year):
+    """Parámetros de ejemplo por calculation_type (los que no figuran corren con {})."""
+    return {
+        "sales_for_period": {"year": year, "month": 3},
+        "project_remaining_year": {"target_year": year},
+        "project_remaining_year_monthly": {"target_year": year, "segment_column": "Sucursal"},
+        "percentage_variation": {"column_to_analyze": "Monto Facturado", "year1": year - 1, "year2": year},
+        "average_by_column": {"column_to_average": "Monto Facturado", "group_by_column": "Sucursal"},
+        "total_for_column_by_year": {"column_to_sum": "Materiales y Pintura", "year": year},
+        "percentage_of_total_sales_by_category": {"category_column": "Tipo Cliente", "category_value": "Particular"},
+    }
+
+
+def chart_aggregation(df):
+    # Agregación de los gráficos de línea/barras de app.py: suma mensual por Tipo Cliente
+    grouped = df.assign(Fecha_Agrupada=df["Fecha"].dt.to_period("M").dt.to_timestamp())
+    return grouped.groupby(["Fecha_Agrupada", "Tipo Cliente"], as_index=False, observed=True)["Monto Facturado"].sum() \
+        .sort_values(by="Fecha_Agrupada")
+
+
+def build_stages(values, tmp_dir):
+    """[(etapa, función)] en el orden del pipeline; cada función es independiente de las demás corridas."""
+    df = clean_sheet_values(values)
+    profile = DatasetProfile.build(df)
+    cube = AggregateCube.build(df)
+    index = DatasetIndex.build(df)
+    year = int(df["Fecha"].dt.year.max())
+    snapshot_path = os.path.join(tmp_dir, "snapshot.parquet")
+    gemini = fake_gemini_client()
+
+    stages = [
+        ("carga", lambda: SheetCache(FakeSheetsClient(values), "hoja-sintética").get()),
+        ("limpieza", lambda: clean_sheet_values(values)),
+        ("huella", lambda: snapshot.dataframe_fingerprint(df)),
+    ]
+    if snapshot.snapshots_available():
+        stages += [
+            ("snapshot guardar", lambda: snapshot.save_snapshot(df, snapshot_path)),
+            ("snapshot leer", lambda: snapshot.load_snapshot(snapshot_path)),
+        ]
+    stages += [
+        ("perfil", lambda: DatasetProfile.build(df).summary_str),
+        ("parser local", lambda: IntentParser.from_profile(profile, stats=None).parse(QUESTION)),
+        ("prompt intención", lambda: PromptBuilder(profile, stats=None).intent_payload(QUESTION)),
+        ("prompt análisis", lambda: PromptBuilder(profile, stats=None).analysis_payload(QUESTION)),
+        ("gemini (sustituto)", lambda: extract_text(gemini.generate_content({"contents": []}, "clave").json())),
+        ("índice", lambda: DatasetIndex.build(df)),
+    ]
+    for label, chart_data in FILTER_CASES.items():
+        stages.append((f"filtro {label}", lambda chart_data=chart_data:
+                       FilterPlan.from_chart_data(chart_data, df.columns).apply(index)))
+    stages += [
+        ("agregación gráfico", lambda: chart_aggregation(df)),
+        ("cubo", lambda: AggregateCube.build(df)),
+    ]
+    params = calculation_params(year)
+    for name in METRICS:
+        stages.append((f"cálculo {name}", lambda name=name:
+                       MetricExecutor(cube, df).run([(name, params.get(name, {}))], "")))
+    stages += [
+        ("proyección total", lambda: ForecastEngine(max_workers=1).for_version("bench", df).total()),
+        ("proyección segmentos", lambda: ForecastEngine(max_workers=1).for_version("bench", df)
+         .segments(FORECAST_DIMENSIONS[0])),
+    ]
+    return stages
+
+
+def measure(fn, repeat, memory=True):
+    """(mejor tiempo en segundos, pico de memoria en MiB o None)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return best, peak
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=os.path.dirname(__file__)).stdout.strip() != ""
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def load_baseline(path, commit):
+    """{(filas, etapa): registro} de la última corrida guardada de un commit distinto al actual."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    previous = [r for r in records if r.get("commit") != commit]
+    if not previous:
+        return {}
+    last_run = previous[-1]["run"]
+    return {(r["rows"], r["stage"]): r for r in previous if r["run"] == last_run}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=ALL_ROWS[:3])
+    parser.add_argument("--stages", nargs="+", help="solo las etapas cuyo nombre empieza con alguno de estos textos")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="no medir memoria (tracemalloc agrega overhead)")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    commit, dirty = current_commit()
+    baseline = load_baseline(args.results, commit)
+    run_id = datetime.now().isoformat(timespec="seconds")
+    records, regressions = [], []
+
+    print(f"{'filas':>9} {'etapa':<45} {'ms':>10} {'MiB':>8} {'vs base':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Una corrida sin medir sobre una hoja chica: imports (statsmodels, pyarrow) y cachés de primera llamada
+        for stage, fn in build_stages(generate_sheet_values(1_000), tmp_dir):
+            fn()
+        for n_rows in args.rows:
+            values = generate_sheet_values(n_rows)
+            for stage, fn in build_stages(values, tmp_dir):
+                if args.stages and not any(stage.startswith(prefix) for prefix in args.stages):
+                    continue
+                seconds, peak = measure(fn, args.repeat, memory=not args.no_memory)
+                previous = baseline.get((n_rows, stage))
+                ratio = seconds / previous["seconds"] if previous and previous["seconds"] > 0 else None
+                flag = ""
+                if ratio is not None and ratio > args.threshold:
+                    flag = " ⚠"
+                    regressions.append((n_rows, stage, ratio))
+                print(f"{n_rows:>9} {stage:<45} {seconds * 1000:>10.2f} {peak if peak is not None else float('nan'):>8.1f} "
+                      f"{f'{ratio:.2f}x' if ratio is not None else '-':>8}{flag}")
+                records.append({"run": run_id, "commit": commit, "dirty": dirty, "python": platform.python_version(),
+                                "rows": n_rows, "stage": stage, "seconds": seconds, "peak_mib": peak})
+            del values
+
+    if not args.no_save:
+        with open(args.results, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if regressions:
+        print(f"\n{len(regressions)} etapa(s) más lentas que {args.threshold}x la corrida anterior "
+              f"({next(iter(baseline.values()))['commit']}):")
+        for n_rows, stage, ratio in regressions:
+            print(f"  {n_rows:>9} {stage}: {ratio:.2f}x")
+        if args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
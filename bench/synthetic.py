@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import REQUIRED_COLUMNS
+
+# --- Generador de hojas sintéticas con la misma forma que la hoja real ---
+TIPOS_CLIENTE = ["Particular", "Seguro", "Empresa", "Flota"]
+TIPOS_VEHICULO = ["Liviano", "Pesado", "SUV", "Camioneta"]
+SUCURSALES = ["Santiago Centro", "Providencia", "Maipú", "Concepción", "Valparaíso", "Antofagasta"]
+EJECUTIVOS = ["Ana Pérez", "Juan Soto", "María González", "Pedro Rojas", "Camila Muñoz", "Diego Díaz", "Valentina Silva"]
+ESTADOS_PAGO = ["Pagado", "Pendiente", "Vencido"]
+FORMAS_PAGO = ["Transferencia", "Efectivo", "Tarjeta de Crédito", "Cheque"]
+OBSERVACIONES = ["", "", "", "Cliente frecuente", "Reparación de carrocería", "Pintura completa",
+                 "Cambio de parachoques", "Pago en cuotas", "Requiere seguimiento"]
+
+
+def format_clp(values):
+    """Formatea montos enteros como en la hoja: $1.234.567."""
+    return ["$" + f"{v:,}".replace(",", ".") for v in values]
+
+
+def generate_raw_frame(n_rows, start_year=2021, years=4, n_clients=None, seed=0):
+    """DataFrame de strings con la forma de get_all_values() (sin la fila de encabezado)."""
+    rng = np.random.default_rng(seed)
+    n_clients = n_clients or max(50, n_rows // 40)
+
+    start = pd.Timestamp(year=start_year, month=1, day=1)
+    days = (pd.Timestamp(year=start_year + years, month=1, day=1) - start).days
+    offsets = rng.integers(0, days, n_rows)
+    fechas = start + pd.to_timedelta(offsets, unit="D")
+    # Estacionalidad mensual y tendencia suave para que las proyecciones tengan señal
+    month_factor = 1 + 0.25 * np.sin(2 * np.pi * (fechas.month.to_numpy() - 3) / 12)
+    trend_factor = 1 + 0.08 * (fechas.year.to_numpy() - start_year)
+    monto = (rng.lognormal(mean=13.2, sigma=0.6, size=n_rows) * month_factor * trend_factor).astype(np.int64)
+
+    return pd.DataFrame({
+        "Fecha": fechas.strftime("%Y-%m-%d"),
+        "Cliente": [f"Cliente {i:05d}" for i in rng.integers(0, n_clients, n_rows)],
+        "Tipo Cliente": rng.choice(TIPOS_CLIENTE, n_rows, p=[0.45, 0.3, 0.15, 0.1]),
+        "Tipo Vehículo": rng.choice(TIPOS_VEHICULO, n_rows),
+        "Factura N°": [f"F-{i:07d}" for i in range(1, n_rows + 1)],
+        "Monto Facturado": format_clp(monto),
+        "Materiales y Pintura": format_clp((monto * rng.uniform(0.15, 0.4, n_rows)).astype(np.int64)),
+        "Costos Financieros": format_clp((monto * rng.uniform(0.0, 0.05, n_rows)).astype(np.int64)),
+        "Sucursal": rng.choice(SUCURSALES, n_rows),
+        "Ejecutivo": rng.choice(EJECUTIVOS, n_rows),
+        "Estado Pago": rng.choice(ESTADOS_PAGO, n_rows, p=[0.7, 0.2, 0.1]),
+        "Forma de Pago": rng.choice(FORMAS_PAGO, n_rows),
+        "Descuento Aplicado (%)": rng.choice(["0", "5", "10", "7,5", "15%"], n_rows),
+        "Observaciones": rng.choice(OBSERVACIONES, n_rows),
+    }, columns=REQUIRED_COLUMNS)
+
+
+def generate_sheet_values(n_rows, **kwargs):
+    """Lista de filas con encabezado, igual que worksheet.get_all_values()."""
+    raw = generate_raw_frame(n_rows, **kwargs)
+    return [list(raw.columns)] + raw.to_numpy().tolist()
+
+
+def generate_monthly_series(n_months, start="2015-01-01", level=1e8, trend=0.006, seasonality=0.25, noise=0.08, seed=0):
+    """Serie mensual de ventas con tendencia, estacionalidad y ruido multiplicativos (índice de inicio de mes)."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=n_months, freq="MS")
+    steps = np.arange(n_months)
+    values = (level * (1 + trend) ** steps
+              * (1 + seasonality * np.sin(2 * np.pi * (index.month.to_numpy() - 3) / 12))
+              * rng.lognormal(0, noise, n_months))
+    return pd.Series(values, index=index)
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# Puntos máximos enviados al navegador por gráfico (repartidos entre las series)
+DEFAULT_MAX_POINTS = 4000
+# Desde cuántos puntos conviene dibujar con WebGL (scattergl) en vez de SVG
+WEBGL_MIN_POINTS = 1000
+# Mínimo de puntos por serie al repartir el presupuesto (LTTB necesita al menos 3)
+MIN_POINTS_PER_SERIES = 50
+
+
+def lttb_indices(x, y, threshold):
+    """Índices elegidos por Largest-Triangle-Three-Buckets sobre x creciente.
+
+    Conserva el primer y el último punto y, en cada bucket, el punto que forma
+    el triángulo de mayor área con el punto elegido antes y el promedio del
+    bucket siguiente: mantiene la forma de la curva (picos y valles).
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, n_buckets):
+    """Índices del mínimo y el máximo de y en cada uno de `n_buckets` tramos consecutivos (ignora los NaN)."""
+    y = np.asarray(y, dtype="float64")
+    n = len(y)
+    if n_buckets * 2 >= n:
+        return np.arange(n)
+    buckets = np.arange(n) * n_buckets // n
+    # Sin los NaN (huecos en la serie): un tramo que solo tiene NaN no aporta puntos
+    valid = ~np.isnan(y)
+    values = pd.Series(y[valid], index=np.flatnonzero(valid))
+    grouped = values.groupby(buckets[valid])
+    return np.unique(np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy()]).astype(np.int64))
+
+
+def _numeric_axis(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy().astype("datetime64[ns]").astype(np.int64).astype("float64")
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype="float64")
+    return None
+
+
+def _series_indices(frame, x_col, y_col, budget, method):
+    """Posiciones (dentro de `frame`) a conservar de una serie."""
+    n = len(frame)
+    if n <= budget:
+        return np.arange(n)
+    y = frame[y_col] if y_col in frame.columns else None
+    if y is None or not pd.api.types.is_numeric_dtype(y):
+        # Sin eje Y numérico no hay forma que preservar: muestreo uniforme
+        return np.linspace(0, n - 1, budget).astype(np.int64)
+    y = y.to_numpy(dtype="float64")
+    if method == "lttb":
+        x = _numeric_axis(frame[x_col]) if x_col in frame.columns else None
+        return lttb_indices(np.arange(n, dtype="float64") if x is None else x, y, budget)
+    return minmax_indices(y, max(1, budget // 2))
+
+
+class ChartSample:
+    """Datos listos para Plotly: el DataFrame reducido, si hubo reducción y si conviene WebGL."""
+
+    def __init__(self, df, original_points, method=None):
+        self.df = df
+        self.original_points = original_points
+        self.method = method
+
+    @property
+    def points(self):
+        return len(self.df)
+
+    @property
+    def downsampled(self):
+        return self.points < self.original_points
+
+    @property
+    def render_mode(self):
+        """render_mode de px.line/px.scatter: "webgl" (scattergl) para muchos puntos."""
+        return "webgl" if self.points >= WEBGL_MIN_POINTS else "svg"
+
+    def note(self):
+        if not self.downsampled:
+            return None
+        if self.method == "lttb":
+            detail = "LTTB: se conserva la forma de cada serie, con sus picos y valles"
+        else:
+            detail = "mínimo y máximo por tramo del eje X: se conservan los valores extremos"
+        return f"Gráfico simplificado: se muestran {self.points:,} de {self.original_points:,} puntos ({detail})."
+
+
+def downsample(df, x_col, y_col, color_col=None, kind="line", max_points=DEFAULT_MAX_POINTS):
+    """Reduce `df` a ~`max_points` puntos por gráfico, serie por serie (según `color_col`).
+
+    Las líneas usan LTTB sobre el eje X ordenado; los gráficos de dispersión y
+    de barras sin agregar usan mínimo/máximo por tramo de X, para no perder los
+    valores extremos.
+    """
+    original_points = len(df)
+    if not max_points or original_points <= max_points:
+        return ChartSample(df, original_points)
+    method = "lttb" if kind == "line" else "minmax"
+    if x_col and x_col in df.columns:
+        df = df.sort_values(x_col, kind="stable")
+    if color_col and color_col in df.columns:
+        groups = [group for _, group in df.groupby(color_col, observed=True, sort=False)]
+    else:
+        groups = [df]
+    budget = max(MIN_POINTS_PER_SERIES, max_points // max(1, len(groups)))
+    parts = [group.iloc[_series_indices(group, x_col, y_col, budget, method)] for group in groups]
+    return ChartSample(pd.concat(parts) if len(parts) > 1 else parts[0], original_points, method)
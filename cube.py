@@ -0,0 +1,49 @@
+import pandas as pd
+
+from schema import NUMERIC_COLUMNS
+
+# --- Dimensiones del cubo (además de año y mes) ---
+CUBE_DIMENSIONS = ["Tipo Cliente", "Sucursal", "Tipo Vehículo", "Estado Pago"]
+CUBE_MEASURES = NUMERIC_COLUMNS
+CLIENT_COLUMN = "Cliente"
+
+COUNT_SUFFIX = "__n"
+
+
+class AggregateCube:
+    """Rollup de las medidas numéricas por año × mes × dimensiones, más totales por Cliente.
+
+    Se construye una vez por versión de datos; las métricas (metrics.py) se
+    responden sumando celdas del cubo en vez de recorrer todas las filas del
+    DataFrame. Junto a cada medida va su conteo de valores no nulos
+    (`<medida>__n`), para los promedios.
+    """
+
+    def __init__(self, cells, client_totals, measures, dimensions):
+        self.cells = cells
+        self.client_totals = client_totals
+        self.measures = measures
+        self.dimensions = dimensions
+
+    @classmethod
+    def build(cls, df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES):
+        dimensions = [col for col in dimensions if col in df.columns]
+        measures = [col for col in measures if col in df.columns]
+        keyed = df[dimensions + measures].assign(year=df["Fecha"].dt.year, month=df["Fecha"].dt.month)
+        keys = ["year", "month"] + dimensions
+
+        grouped = keyed.groupby(keys, observed=True, dropna=False)[measures]
+        cells = grouped.sum()
+        # Conteo de valores no nulos por medida, para poder calcular promedios desde el cubo
+        counts = grouped.count().add_suffix(COUNT_SUFFIX)
+        cells = cells.join(counts).reset_index()
+
+        client_totals = df.groupby(CLIENT_COLUMN, observed=True)[measures].sum() \
+            if CLIENT_COLUMN in df.columns else pd.DataFrame(columns=measures)
+        return cls(cells, client_totals, measures, dimensions)
+
+    def has_measure(self, measure):
+        return measure in self.measures
+
+    def has_dimension(self, dimension):
+        return dimension in self.dimensions
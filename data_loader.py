@@ -0,0 +1,391 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import snapshot
+from schema import apply_schema, remove_unused_categories
+
+# --- Columnas esenciales (con los nombres exactos de la hoja) ---
+REQUIRED_COLUMNS = ["Fecha", "Cliente", "Tipo Cliente", "Tipo Vehículo", "Factura N°",
+                    "Monto Facturado", "Materiales y Pintura", "Costos Financieros",
+                    "Sucursal", "Ejecutivo", "Estado Pago", "Forma de Pago",
+                    "Descuento Aplicado (%)", "Observaciones"]
+
+# Hoja de Google Sheets de la app (el secret SHEET_URL la reemplaza)
+DEFAULT_SHEET_URL = "https://docs.google.com/spreadsheets/d/1mXxUmIQ44rd9escHOee2w0LxGs4MVNXaPrUeqj4USpk/edit?gid=0#gid=0"
+# drive.metadata.readonly permite consultar la fecha de modificación de la hoja
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly",
+                 "https://www.googleapis.com/auth/drive.metadata.readonly"]
+
+# Tiempo (segundos) durante el cual se reutiliza el DataFrame sin consultar la hoja.
+DEFAULT_TTL_SECONDS = 300
+
+# Columna con la pestaña/planilla de origen de cada fila (solo si hay más de una fuente)
+SOURCE_COLUMN = "Origen"
+# Descargas y limpiezas simultáneas de pestañas
+DEFAULT_MAX_WORKERS = 8
+ALL_WORKSHEETS = "*"
+
+
+class MissingColumnsError(ValueError):
+    """La hoja no contiene todas las columnas de REQUIRED_COLUMNS."""
+
+    def __init__(self, missing_columns, source=None):
+        self.missing_columns = list(missing_columns)
+        self.source = source
+        where = f" en '{source}'" if source else ""
+        super().__init__(f"Faltan columnas esenciales{where}: {', '.join(self.missing_columns)}")
+
+
+class EmptyDatasetError(ValueError):
+    """No quedaron filas válidas después de la limpieza."""
+
+
+def clean_sheet_values(values):
+    """Convierte la salida de get_all_values() en el DataFrame limpio que usa la app."""
+    df = pd.DataFrame(values[1:], columns=values[0])
+
+    # --- Limpiar nombres de columnas (eliminar espacios en blanco alrededor) ---
+    df.columns = df.columns.str.strip()
+
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise MissingColumnsError(missing_columns)
+
+    # Convertir tipos según el esquema declarado (fechas, montos en formato chileno y categorías)
+    apply_schema(df)
+
+    # Eliminar filas con valores NaN en columnas críticas para el análisis o gráficos
+    df.dropna(subset=["Fecha", "Monto Facturado"], inplace=True)
+    remove_unused_categories(df)
+
+    if df.empty:
+        raise EmptyDatasetError("No se encontraron filas válidas con 'Fecha' y 'Monto Facturado'.")
+    return df
+
+
+class SheetSource:
+    """Una planilla y las pestañas a leer: ninguna indicada = la primera, ["*"] = todas."""
+
+    def __init__(self, url, worksheets=None, label=None):
+        self.url = url
+        self.worksheets = list(worksheets or [])
+        self.label = label
+
+    @classmethod
+    def parse(cls, config):
+        """Desde una URL o un dict {"url", "worksheets", "label"} (p. ej. una entrada de SHEET_SOURCES)."""
+        if isinstance(config, str):
+            return cls(config)
+        return cls(config["url"], config.get("worksheets"), config.get("label"))
+
+    def source_label(self, worksheet_title):
+        return f"{self.label} / {worksheet_title}" if self.label else worksheet_title
+
+
+def _a1_range(title):
+    # Nombre de pestaña como rango A1 (toda la pestaña), con comillas simples escapadas
+    return "'" + str(title).replace("'", "''") + "'"
+
+
+def _pad_rows(values):
+    # La lectura por lotes omite las celdas vacías al final de cada fila; get_all_values() las rellena
+    width = max((len(row) for row in values), default=0)
+    return [row + [""] * (width - len(row)) if len(row) < width else row for row in values]
+
+
+def _source_tabs(spreadsheet, source):
+    """[(origen, filas)] de una planilla ya abierta; si no permite lecturas por lotes, en lugar
+    de las filas va una función que descarga esa pestaña."""
+    if not source.worksheets:
+        worksheet = spreadsheet.sheet1
+        return [(source.source_label(getattr(worksheet, "title", "Hoja 1")), worksheet.get_all_values)]
+    if ALL_WORKSHEETS in source.worksheets:
+        titles = [worksheet.title for worksheet in spreadsheet.worksheets()]
+    else:
+        titles = source.worksheets
+    if hasattr(spreadsheet, "values_batch_get"):
+        # Una sola llamada a la API para todas las pestañas de la planilla
+        value_ranges = spreadsheet.values_batch_get([_a1_range(title) for title in titles]).get("valueRanges", [])
+        return [(source.source_label(title), _pad_rows(value_range.get("values", [])))
+                for title, value_range in zip(titles, value_ranges)]
+    return [(source.source_label(title), lambda title=title: spreadsheet.worksheet(title).get_all_values())
+            for title in titles]
+
+
+def _clean_tab(label, values):
+    if len(values) < 2:
+        # Pestaña vacía o solo con encabezado (p. ej. notas): no aporta datos, pero no invalida el resto
+        return None
+    try:
+        return clean_sheet_values(values)
+    except MissingColumnsError as e:
+        raise MissingColumnsError(e.missing_columns, source=label) from None
+    except EmptyDatasetError:
+        return None
+
+
+def concat_sources(frames):
+    """Une los DataFrames limpios [(origen, df)] con una columna SOURCE_COLUMN y categorías unificadas."""
+    frames = [(label, df) for label, df in frames if df is not None]
+    if not frames:
+        raise EmptyDatasetError("No se encontraron filas válidas con 'Fecha' y 'Monto Facturado' en ninguna pestaña.")
+    labels = list(dict.fromkeys(label for label, _ in frames))
+    parts = [df.assign(**{SOURCE_COLUMN: pd.Categorical([label] * len(df), categories=labels)}) for label, df in frames]
+    # Con las mismas categorías en todas las partes, concat conserva el tipo category
+    columns = dict.fromkeys(col for part in parts for col in part.columns
+                            if col != SOURCE_COLUMN and isinstance(part[col].dtype, pd.CategoricalDtype))
+    for col in columns:
+        with_col = [part for part in parts if col in part.columns]
+        categories = pd.Index(pd.unique(pd.concat([pd.Series(part[col].cat.categories) for part in with_col])))
+        for part in with_col:
+            part[col] = part[col].cat.set_categories(categories)
+    df = pd.concat(parts, ignore_index=True)
+    remove_unused_categories(df)
+    return df
+
+
+def load_sources(client, sources, max_workers=DEFAULT_MAX_WORKERS, known_version=None):
+    """Descarga en paralelo las pestañas de varias planillas y las limpia por separado.
+
+    Devuelve (df, versión, tiempos por etapa). La versión es la de la planilla
+    (las de todas unidas por "|" si son varias; None si alguna no la informa). Si coincide con
+    `known_version` no se descarga nada y df es None. Con una sola pestaña el
+    resultado es el mismo que clean_sheet_values (sin columna de origen).
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        spreadsheets = list(pool.map(client.open_by_url, [source.url for source in sources]))
+        versions = [get_sheet_version(spreadsheet) for spreadsheet in spreadsheets]
+        version = None if None in versions else "|".join(map(str, versions))
+        if version is not None and version == known_version:
+            return None, version, {"descarga sheets": time.perf_counter() - start}
+
+        tabs = [tab for source_tabs in pool.map(_source_tabs, spreadsheets, sources) for tab in source_tabs]
+        # Las pestañas que no vinieron en una lectura por lotes se descargan cada una en su hilo
+        futures = [pool.submit(values) if callable(values) else None for _, values in tabs]
+        tabs = [(label, future.result() if future is not None else values)
+                for (label, values), future in zip(tabs, futures)]
+        downloaded = time.perf_counter()
+        if len(tabs) == 1:
+            df = clean_sheet_values(tabs[0][1])
+        else:
+            df = concat_sources(list(zip([label for label, _ in tabs], pool.map(lambda tab: _clean_tab(*tab), tabs))))
+    timings = {"descarga sheets": downloaded - start, "limpieza": time.perf_counter() - downloaded}
+    return df, version, timings
+
+
+def get_sheet_version(spreadsheet):
+    """Devuelve la fecha de última modificación de la hoja (Drive API) o None si no está disponible."""
+    try:
+        if hasattr(spreadsheet, "get_lastUpdateTime"):
+            return spreadsheet.get_lastUpdateTime()
+        return spreadsheet.lastUpdateTime
+    except Exception:
+        # Sin permisos de Drive o API deshabilitada: se recurre solo al TTL.
+        return None
+
+
+class OfflineDataError(RuntimeError):
+    """Modo offline sin un snapshot local disponible."""
+
+
+class SheetCache:
+    """Caché en memoria del DataFrame limpio, compartida por todas las sesiones del proceso.
+
+    Dentro del TTL se sirve el DataFrame sin tocar la red. Al vencer, se consulta
+    solo la fecha de modificación de la hoja y se vuelve a descargar únicamente
+    si cambió (o si la hoja no expone esa información).
+
+    Si hay un snapshot local (Parquet), el arranque en frío lo usa de inmediato y
+    la hoja se refresca en segundo plano. Con client=None la caché trabaja solo
+    contra el snapshot (modo offline).
+
+    Con `sources` (lista de SheetSource) se leen varias planillas o pestañas en
+    paralelo y se unen con una columna SOURCE_COLUMN; por defecto, la primera
+    pestaña de `sheet_url`.
+
+    Con `start_background_refresh` la hoja se revisa en un hilo propio y `get`
+    ya no espera a la red: devuelve la versión activa, que se reemplaza de una
+    vez cuando la nueva está lista (incluidas sus cachés, vía `on_new_version`).
+    """
+
+    def __init__(self, client, sheet_url, ttl_seconds=DEFAULT_TTL_SECONDS, snapshot_path=None,
+                 sources=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.client = client
+        self.sheet_url = sheet_url
+        self.sources = sources or [SheetSource(sheet_url)]
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._df = None
+        self._version = None
+        self._checked_at = 0.0
+        self.fingerprint = None
+        # (huella_anterior, filas_anteriores) si la última versión solo anexó filas
+        self.append_of = None
+        self._row_hashes = None
+        self.loaded_at = None
+        self.loaded_from = None
+        self.downloads = 0
+        self.last_error = None
+        # Segundos de la última descarga por etapa ("descarga sheets", "limpieza", "huella")
+        self.last_timings = {}
+        # Actualización en segundo plano
+        self.refresh_interval = None
+        self.on_new_version = None
+        self.checked_at = None  # hora (time.time()) de la última revisión de la hoja
+        self.last_refresh_seconds = None  # duración de la última actualización con descarga
+        self.refreshing = False
+        self._refresher = None
+        self._wake = threading.Event()
+        self._force_next = False
+
+    @property
+    def offline(self):
+        return self.client is None
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def background(self):
+        return self._refresher is not None
+
+    def current(self):
+        """(DataFrame, huella) de la versión activa, leídos juntos."""
+        with self._lock:
+            return self._df, self.fingerprint
+
+    def start_background_refresh(self, interval_seconds, on_new_version=None):
+        """Revisa la hoja ahora y luego cada `interval_seconds` en un hilo propio.
+
+        `on_new_version(huella, df, append_of)` se llama con cada versión nueva
+        antes de activarla, para construir sus cachés fuera de las consultas.
+        """
+        with self._lock:
+            if self._refresher is not None or self.offline:
+                return
+            self.refresh_interval = interval_seconds
+            self.on_new_version = on_new_version
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True, name="sheet-refresher")
+            self._refresher.start()
+
+    def request_refresh(self):
+        """Pide al hilo de actualización una descarga completa inmediata, sin esperarla."""
+        self._force_next = True
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while True:
+            force, self._force_next = self._force_next, False
+            self._background_refresh(force)
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+            self._version = None
+
+    def get(self, force_refresh=False):
+        with self._lock:
+            if self._df is None and self.snapshot_path and self._load_snapshot():
+                if not self.offline and not self.background:
+                    threading.Thread(target=self._background_refresh, daemon=True).start()
+                return self._df
+            if self.offline:
+                if self._df is None:
+                    raise OfflineDataError(f"No se encontró un snapshot local en '{self.snapshot_path}'.")
+                return self._df
+            if self.background and self._df is not None:
+                # La versión activa se sirve siempre; el hilo de actualización la reemplaza
+                if force_refresh:
+                    self.request_refresh()
+                return self._df
+            if not force_refresh and self._df is not None and time.monotonic() - self._checked_at < self.ttl_seconds:
+                return self._df
+        return self._refresh(force_refresh)
+
+    def _load_snapshot(self):
+        loaded = snapshot.load_snapshot(self.snapshot_path)
+        if loaded is None:
+            return False
+        self._df, meta = loaded
+        self._version = meta.get("source_version")
+        self.fingerprint = meta.get("fingerprint")
+        self.loaded_at = meta.get("saved_at")
+        self.loaded_from = "snapshot"
+        self._checked_at = time.monotonic()
+        return True
+
+    def _detect_append(self, new_hashes):
+        if self._df is None:
+            return None
+        if self._row_hashes is None:
+            self._row_hashes = snapshot.row_hashes(self._df)
+        n_previous = len(self._row_hashes)
+        if len(new_hashes) > n_previous and (new_hashes[:n_previous] == self._row_hashes).all():
+            return self.fingerprint, n_previous
+        return None
+
+    def _background_refresh(self, force_refresh=False):
+        try:
+            self._refresh(force_refresh=force_refresh, ignore_ttl=True)
+        except Exception as e:
+            # La versión activa (o el snapshot) sigue sirviendo; el error queda disponible para la UI
+            self.last_error = e
+
+    def _refresh(self, force_refresh, ignore_ttl=False):
+        # Una sola descarga a la vez; las demás sesiones esperan y reutilizan el resultado
+        with self._refresh_lock:
+            if not force_refresh and not ignore_ttl and self._df is not None and time.monotonic() - self._checked_at < self.ttl_seconds:
+                return self._df
+
+            start = time.perf_counter()
+            self.refreshing = True
+            try:
+                known_version = self._version if not force_refresh and self._df is not None else None
+                df, version, timings = load_sources(self.client, self.sources, self.max_workers, known_version)
+                if df is None:
+                    self._checked_at = time.monotonic()
+                    self.checked_at = time.time()
+                    return self._df
+
+                cleaned = time.perf_counter()
+                hashes = snapshot.row_hashes(df)
+                fingerprint = snapshot.dataframe_fingerprint(df, hashes)
+                timings["huella"] = time.perf_counter() - cleaned
+                changed = fingerprint != self.fingerprint
+                append_of = self._detect_append(hashes) if changed else None
+                if changed and self.on_new_version is not None:
+                    try:
+                        self.on_new_version(fingerprint, df, append_of)
+                    except Exception:
+                        # Las cachés de la versión se construirán en la primera consulta que las use
+                        pass
+                # Cambio de versión atómico: las consultas en curso conservan la versión anterior
+                with self._lock:
+                    if changed:
+                        self.append_of = append_of
+                        self._df = df
+                        self._row_hashes = hashes
+                        self.fingerprint = fingerprint
+                    self._version = version
+                    self._checked_at = time.monotonic()
+                    self.checked_at = self.loaded_at = time.time()
+                    self.loaded_from = "sheets"
+                    self.downloads += 1
+                    self.last_timings = timings
+                    self.last_refresh_seconds = time.perf_counter() - start
+                    self.last_error = None
+                if changed and self.snapshot_path:
+                    snapshot.save_snapshot(df, self.snapshot_path, source_version=version, fingerprint=fingerprint)
+                return self._df
+            finally:
+                self.refreshing = False
@@ -0,0 +1,197 @@
+import heapq
+import threading
+
+import pandas as pd
+
+# Cantidad de valores distintos bajo la cual se listan todos los valores de una columna de texto
+MAX_LISTED_VALUES = 10
+TOP_VALUES = 10
+COMPACT_TOP_VALUES = 3
+
+# Niveles de detalle de una columna en los prompts (ver prompt_builder.py)
+DETAIL_FULL = 2     # valores listados y 10 más frecuentes
+DETAIL_COMPACT = 1  # solo los 3 valores más frecuentes
+DETAIL_NAME = 0     # solo nombre y tipo
+
+
+class ColumnProfile:
+    """Estadísticas combinables de una columna (se pueden sumar al anexar filas)."""
+
+    def __init__(self, name, kind, dtype, non_null=0, minimum=None, maximum=None, total=0.0, value_counts=None):
+        self.name = name
+        self.kind = kind  # "datetime", "numeric" o "text"
+        self.dtype = dtype
+        self.non_null = non_null
+        self.minimum = minimum
+        self.maximum = maximum
+        self.total = total
+        self.value_counts = value_counts if value_counts is not None else {}
+
+    @classmethod
+    def from_series(cls, series):
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return cls(series.name, "datetime", str(series.dtype), int(series.count()), series.min(), series.max())
+        if pd.api.types.is_numeric_dtype(series):
+            return cls(series.name, "numeric", str(series.dtype), int(series.count()),
+                       series.min(), series.max(), float(series.sum()))
+        counts = series.value_counts(sort=False, dropna=True)
+        counts = counts[counts > 0]
+        return cls(series.name, "text", str(series.dtype), int(series.count()),
+                   value_counts={value: int(count) for value, count in counts.items()})
+
+    def merge(self, other):
+        """Combina con el perfil de las filas anexadas."""
+        merged = ColumnProfile(self.name, self.kind, self.dtype, self.non_null + other.non_null,
+                               _combine(self.minimum, other.minimum, min),
+                               _combine(self.maximum, other.maximum, max),
+                               self.total + other.total, dict(self.value_counts))
+        for value, count in other.value_counts.items():
+            merged.value_counts[value] = merged.value_counts.get(value, 0) + count
+        return merged
+
+    @property
+    def mean(self):
+        return self.total / self.non_null if self.non_null else float("nan")
+
+
+def _combine(a, b, fn):
+    if a is None or pd.isna(a):
+        return b
+    if b is None or pd.isna(b):
+        return a
+    return fn(a, b)
+
+
+def _fmt(value):
+    return f"{value:,.2f}" if value is not None else "nan"
+
+
+class DatasetProfile:
+    """Perfil del DataFrame que alimenta los prompts de Gemini.
+
+    Se calcula una vez por versión de datos; si la nueva versión solo anexa
+    filas, `extend` actualiza las estadísticas sin volver a recorrer las existentes.
+    """
+
+    def __init__(self, columns, n_rows):
+        self.columns = columns
+        self.n_rows = n_rows
+        self._available_columns_str = None
+        self._summary_str = None
+        self._column_lines = {}
+
+    @classmethod
+    def build(cls, df):
+        return cls([ColumnProfile.from_series(df[col]) for col in df.columns], len(df))
+
+    def extend(self, appended_df):
+        appended = DatasetProfile.build(appended_df)
+        columns = [col.merge(new_col) for col, new_col in zip(self.columns, appended.columns)]
+        return DatasetProfile(columns, self.n_rows + appended.n_rows)
+
+    # --- Información dinámica de columnas para el prompt de Gemini ---
+    @property
+    def available_columns_str(self):
+        if self._available_columns_str is None:
+            self._available_columns_str = self.render_available_columns()
+        return self._available_columns_str
+
+    # --- Resumen más completo del DataFrame para Gemini ---
+    @property
+    def summary_str(self):
+        if self._summary_str is None:
+            self._summary_str = self.render_summary()
+        return self._summary_str
+
+    def render_available_columns(self, details=None):
+        """Lista de columnas; `details` asigna un nivel DETAIL_* por columna (las ausentes se omiten)."""
+        return "\n".join(self.column_lines(col.name)[level][0]
+                         for col, level in self._levels(details))
+
+    def render_summary(self, details=None):
+        parts = ["Resumen de la estructura del DataFrame:",
+                 f"Número total de filas: {self.n_rows}",
+                 f"Número total de columnas: {len(self.columns)}",
+                 "\nInformación detallada de Columnas:"]
+        for col, level in self._levels(details):
+            line = self.column_lines(col.name)[level][1]
+            if line:
+                parts.append(line)
+        return "\n".join(parts)
+
+    def _levels(self, details):
+        if details is None:
+            return [(col, DETAIL_FULL) for col in self.columns]
+        return [(col, details[col.name]) for col in self.columns if col.name in details]
+
+    def column_lines(self, name):
+        """{nivel: (línea de columnas disponibles, línea del resumen)} de una columna, calculado una sola vez."""
+        lines = self._column_lines.get(name)
+        if lines is None:
+            col = next(col for col in self.columns if col.name == name)
+            lines = {level: (self._available_line(col, level), self._summary_line(col, level))
+                     for level in (DETAIL_FULL, DETAIL_COMPACT, DETAIL_NAME)}
+            self._column_lines[name] = lines
+        return lines
+
+    def _available_line(self, col, level):
+        if col.kind == "datetime":
+            if level == DETAIL_NAME:
+                return f"- '{col.name}' (tipo fecha, formato YYYY-MM-DD)"
+            if pd.isna(col.minimum) or pd.isna(col.maximum):
+                return f"- '{col.name}' (tipo fecha, formato YYYY-MM-DD, con valores nulos)"
+            return f"- '{col.name}' (tipo fecha, formato YYYY-MM-DD, rango: {col.minimum.strftime('%Y-%m-%d')} a {col.maximum.strftime('%Y-%m-%d')})"
+        if col.kind == "numeric":
+            return f"- '{col.name}' (tipo numérico)"
+        if level != DETAIL_NAME and len(col.value_counts) < MAX_LISTED_VALUES:
+            return f"- '{col.name}' (tipo texto, valores: {', '.join(map(str, col.value_counts))})"
+        return f"- '{col.name}' (tipo texto)"
+
+    def _summary_line(self, col, level):
+        # En el nivel DETAIL_NAME la columna solo aparece en la lista de columnas disponibles
+        if level == DETAIL_NAME:
+            return ""
+        null_percentage = (1 - col.non_null / self.n_rows) * 100 if self.n_rows else 0.0
+        col_info = f"- Columna '{col.name}': Tipo '{col.dtype}', {col.non_null}/{self.n_rows} valores no nulos ({null_percentage:.2f}% nulos)."
+        if col.kind == "numeric":
+            col_info += f" Estadísticas: Min={_fmt(col.minimum)}, Max={_fmt(col.maximum)}, Media={col.mean:,.2f}, Suma={col.total:,.2f}"
+        elif col.kind == "datetime":
+            if not pd.isna(col.minimum) and not pd.isna(col.maximum):
+                col_info += f" Rango de fechas: [{col.minimum.strftime('%Y-%m-%d')} a {col.maximum.strftime('%Y-%m-%d')}]"
+            else:
+                col_info += " Rango de fechas: (Contiene valores nulos o inválidos)"
+        elif col.value_counts:
+            n_top = TOP_VALUES if level == DETAIL_FULL else COMPACT_TOP_VALUES
+            top_values = heapq.nlargest(n_top, col.value_counts.items(), key=lambda item: item[1])
+            top_values_str = [f"'{val}' ({count})" for val, count in top_values]
+            col_info += f" Valores más frecuentes: {', '.join(top_values_str)}"
+        return col_info
+
+
+class ProfileStore:
+    """Perfiles por huella de datos, compartidos por todas las sesiones del proceso."""
+
+    def __init__(self, max_entries=2):
+        self.max_entries = max_entries
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, df, append_of=None):
+        """Devuelve el perfil de `fingerprint`.
+
+        `append_of` es (huella_anterior, filas_anteriores) cuando la versión nueva
+        solo anexó filas a la anterior; en ese caso se perfilan solo las filas nuevas.
+        """
+        with self._lock:
+            profile = self._profiles.get(fingerprint)
+            if profile is not None:
+                return profile
+            base = self._profiles.get(append_of[0]) if append_of else None
+            if base is not None and base.n_rows == append_of[1]:
+                profile = base.extend(df.iloc[append_of[1]:])
+            else:
+                profile = DatasetProfile.build(df)
+            self._profiles[fingerprint] = profile
+            while len(self._profiles) > self.max_entries:
+                self._profiles.pop(next(iter(self._profiles)))
+            return profile
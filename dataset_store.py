@@ -0,0 +1,142 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+if int(pd.__version__.split(".")[0]) < 3:
+    # Desde pandas 3 copy-on-write siempre está activo; en 2.x hay que pedirlo para que escribir
+    # en una vista copie solo esa columna en vez de modificar los datos compartidos
+    pd.set_option("mode.copy_on_write", True)
+
+MB = 1024 ** 2
+
+
+def _arrays(series):
+    """Arreglos numpy que respaldan una columna (sin copiarlos), para saber si comparte memoria con otra."""
+    values = series.array
+    if isinstance(values, pd.Categorical):
+        return [values.codes]
+    if hasattr(values, "__arrow_array__"):
+        chunked = values.__arrow_array__()
+        return [np.frombuffer(buffer, dtype=np.uint8) for chunk in chunked.chunks
+                for buffer in chunk.buffers() if buffer is not None and buffer.size]
+    return [np.asarray(values)]
+
+
+def _shares_memory(series, base):
+    base_arrays = _arrays(base)
+    return any(np.shares_memory(a, b) for a in _arrays(series) for b in base_arrays)
+
+
+def own_bytes(frame, bases):
+    """Bytes de `frame` que no comparte con ninguno de los DataFrames de `bases` (columnas copiadas o nuevas)."""
+    total = 0
+    for col in frame.columns:
+        series = frame[col]
+        if any(col in base.columns and _shares_memory(series, base[col]) for base in bases):
+            continue
+        total += int(series.memory_usage(deep=True, index=False))
+    return total
+
+
+class SessionFrames:
+    """DataFrames vivos de una sesión (referencias débiles: no los retienen)."""
+
+    def __init__(self):
+        self._frames = []  # [(etiqueta, weakref)]
+
+    def track(self, label, frame):
+        self._frames = [(l, ref) for l, ref in self._frames if ref() is not None]
+        self._frames.append((label, weakref.ref(frame)))
+
+    def live(self):
+        return [(label, frame) for label, frame in ((l, ref()) for l, ref in self._frames) if frame is not None]
+
+
+class DatasetStore:
+    """Una sola copia inmutable por versión de datos (huella), compartida por todas las sesiones del proceso.
+
+    Cada sesión recibe una vista (`view`): un DataFrame propio que comparte las
+    columnas con la versión publicada. Con copy-on-write, agregar o modificar
+    una columna en la vista copia solo esa columna y nunca toca los datos
+    compartidos. Los DataFrames derivados que la sesión registra con `track`
+    permiten medir su memoria propia sin retenerlos.
+
+    `derived` guarda lo que se construye una vez por versión (índice, cubo,
+    perfil...) y lo descarta junto con la versión. No depende de Streamlit, así
+    que también se puede llenar desde el hilo de actualización de los datos.
+    """
+
+    def __init__(self, max_versions=2):
+        self.max_versions = max_versions
+        self._versions = {}  # huella -> DataFrame, de la más antigua a la más nueva
+        self._sessions = {}  # id de sesión -> SessionFrames
+        self._derived = {}  # huella -> {nombre: objeto}
+        self._lock = threading.Lock()
+
+    def publish(self, fingerprint, df):
+        """Registra `df` como la versión `fingerprint` (sin copiarlo: el almacén pasa a ser su dueño)."""
+        with self._lock:
+            if fingerprint not in self._versions:
+                self._versions[fingerprint] = df
+                while len(self._versions) > self.max_versions:
+                    # Las sesiones que todavía tengan una vista de la versión descartada la conservan hasta su próxima ejecución
+                    evicted = next(iter(self._versions))
+                    self._versions.pop(evicted)
+                    self._derived.pop(evicted, None)
+            return self._versions[fingerprint]
+
+    def get(self, fingerprint):
+        with self._lock:
+            return self._versions.get(fingerprint)
+
+    def derived(self, fingerprint, name, build):
+        """Objeto `name` de la versión, construido con `build(df)` la primera vez que se pide."""
+        with self._lock:
+            df = self._versions.get(fingerprint)
+            built = self._derived.get(fingerprint, {}).get(name)
+        if built is not None:
+            return built
+        if df is None:
+            raise KeyError(fingerprint)
+        # Se construye fuera del candado; si dos sesiones lo piden a la vez, se conserva el primero
+        built = build(df)
+        with self._lock:
+            if fingerprint in self._versions:
+                built = self._derived.setdefault(fingerprint, {}).setdefault(name, built)
+        return built
+
+    def view(self, fingerprint, session_id=None):
+        """Vista de solo lectura (en lo compartido) de una versión publicada, registrada para la sesión."""
+        df = self.get(fingerprint)
+        if df is None:
+            raise KeyError(fingerprint)
+        view = df.copy(deep=False)
+        if session_id is not None:
+            self.track(session_id, "vista del dataset", view)
+        return view
+
+    def track(self, session_id, label, frame):
+        with self._lock:
+            self._sessions.setdefault(session_id, SessionFrames()).track(label, frame)
+
+    def memory_report(self):
+        """(DataFrame de versiones, DataFrame por sesión) con MB compartidos y MB propios de cada sesión."""
+        with self._lock:
+            versions = dict(self._versions)
+            sessions = {session_id: frames.live() for session_id, frames in self._sessions.items()}
+            # Las sesiones cerradas ya no tienen DataFrames vivos
+            self._sessions = {session_id: self._sessions[session_id] for session_id, live in sessions.items() if live}
+        bases = list(versions.values())
+        version_rows = [{"versión": str(fingerprint)[:12], "filas": len(df),
+                         "MB": df.memory_usage(deep=True).sum() / MB} for fingerprint, df in versions.items()]
+        session_rows = []
+        for session_id, live in sessions.items():
+            if live:
+                frames = {id(frame): frame for _, frame in live}  # un mismo DataFrame puede estar registrado dos veces
+                session_rows.append({"sesión": session_id[:8], "DataFrames vivos": len(frames),
+                                     "MB propios": sum(own_bytes(frame, bases) for frame in frames.values()) / MB,
+                                     "detalle": ", ".join(sorted({label for label, _ in live}))})
+        return (pd.DataFrame(version_rows, columns=["versión", "filas", "MB"]),
+                pd.DataFrame(session_rows, columns=["sesión", "DataFrames vivos", "MB propios", "detalle"]))
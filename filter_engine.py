@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from intent_parser import MONTH_NAMES
+from value_index import ValueIndex
+
+DATE_COLUMN = "Fecha"
+
+
+class DatasetIndex:
+    """Índices de una versión de datos para filtrar sin copiar el DataFrame.
+
+    Guarda las posiciones de las filas ordenadas por Fecha (los rangos de fechas
+    se resuelven con búsqueda binaria), el mes de cada fila y, por columna, los
+    códigos de sus valores distintos (los filtros de texto se evalúan sobre los
+    valores distintos y no fila por fila). Todo se calcula una vez por versión de datos.
+    Sin columna Fecha (p. ej. una tabla agregada) solo quedan los códigos por columna.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.order = self.sorted_dates = self.months = None
+        if DATE_COLUMN in df.columns:
+            dates = df[DATE_COLUMN].to_numpy()
+            self.order = np.argsort(dates, kind="stable")
+            self.sorted_dates = dates[self.order]
+            self.months = df[DATE_COLUMN].dt.month.to_numpy()
+        self._codes = {}
+        self._value_indexes = {}
+
+    @classmethod
+    def build(cls, df):
+        return cls(df)
+
+    def __len__(self):
+        return len(self.df)
+
+    def codes(self, column):
+        """(códigos por fila, valores distintos como texto); -1 indica valor nulo."""
+        cached = self._codes.get(column)
+        if cached is None:
+            series = self.df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                cached = (series.cat.codes.to_numpy(), pd.Index(series.cat.categories.astype(str)))
+            else:
+                codes, uniques = pd.factorize(series)
+                cached = (codes, pd.Index(uniques.astype(str)))
+            self._codes[column] = cached
+        return cached
+
+    def value_index(self, column):
+        """ValueIndex (valores distintos normalizados) de una columna de texto."""
+        value_index = self._value_indexes.get(column)
+        if value_index is None:
+            value_index = ValueIndex(self.codes(column)[1])
+            self._value_indexes[column] = value_index
+        return value_index
+
+    def is_text(self, column):
+        dtype = self.df[column].dtype
+        return isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+    def value_matches(self, column, pattern):
+        """Arreglo booleano por valor distinto de `column` (en el orden de sus códigos)."""
+        if self.is_text(column):
+            return self.value_index(column).matches(pattern)
+        # Columnas numéricas o de fecha: coincidencia sobre su representación como texto
+        return np.asarray(self.codes(column)[1].str.contains(pattern, case=False, na=False, regex=True), dtype=bool)
+
+    def rows_matching(self, column, pattern):
+        """Máscara por fila de los valores de `column` que coinciden con `pattern`."""
+        codes = self.codes(column)[0]
+        return np.append(self.value_matches(column, pattern), False)[codes]
+
+    def date_positions(self, start=None, end=None):
+        """Posiciones (en el orden original) de las filas con start <= Fecha <= end."""
+        lo = 0 if start is None else np.searchsorted(self.sorted_dates, start.to_datetime64(), side="left")
+        hi = len(self.sorted_dates) if end is None else np.searchsorted(self.sorted_dates, end.to_datetime64(), side="right")
+        return self.order[lo:hi]
+
+
+class FilterPlan:
+    """Predicados de un chart_data combinados en un rango de fechas y una sola máscara."""
+
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.month = None
+        self.contains = []  # (columna, valor) que se comparan con DatasetIndex.value_matches
+        self.warnings = []
+
+    @classmethod
+    def from_chart_data(cls, chart_data, columns):
+        plan = cls()
+        filter_column = chart_data.get("filter_column")
+        filter_value = chart_data.get("filter_value")
+
+        # --- Filtro principal (año/mes o texto en una columna) ---
+        if filter_column and filter_value:
+            if filter_column == DATE_COLUMN:
+                try:
+                    year = int(filter_value)
+                    plan.restrict_dates(pd.Timestamp(year=year, month=1, day=1),
+                                        pd.Timestamp(year=year + 1, month=1, day=1) - pd.Timedelta(1, "ns"))
+                except ValueError:
+                    month = MONTH_NAMES.get(str(filter_value).lower())
+                    if month is not None:
+                        plan.month = month
+                    else:
+                        plan.warnings.append(f"No se pudo aplicar el filtro de fecha '{filter_value}'.")
+            elif filter_column in columns:
+                plan.contains.append((filter_column, str(filter_value)))
+            else:
+                plan.warnings.append(f"La columna '{filter_column}' para filtro principal no se encontró.")
+
+        # --- Rango de fechas (start_date, end_date) ---
+        for key, label in (("start_date", "inicio"), ("end_date", "fin")):
+            value = chart_data.get(key)
+            if not value:
+                continue
+            try:
+                date = pd.to_datetime(value)
+            except (ValueError, TypeError):
+                plan.warnings.append(f"Formato de fecha de {label} inválido: {value}. No se aplicó el filtro.")
+                continue
+            if key == "start_date":
+                plan.restrict_dates(date, None)
+            else:
+                plan.restrict_dates(None, date)
+
+        # --- Filtros adicionales ---
+        for add_filter in chart_data.get("additional_filters") or []:
+            col = add_filter.get("column")
+            val = add_filter.get("value")
+            if col and val and col in columns:
+                plan.contains.append((col, str(val)))
+            elif col and col not in columns:
+                plan.warnings.append(f"La columna '{col}' para filtro adicional no se encontró en los datos.")
+        return plan
+
+    def restrict_dates(self, start, end):
+        """Intersecta el rango de fechas del plan con [start, end]."""
+        if start is not None:
+            self.start = start if self.start is None else max(self.start, start)
+        if end is not None:
+            self.end = end if self.end is None else min(self.end, end)
+
+    def positions(self, index):
+        """Posiciones (en el orden original) de las filas que cumplen todos los predicados."""
+        if self.start is not None or self.end is not None:
+            if self.start is not None and self.end is not None and self.start > self.end:
+                return np.empty(0, dtype=np.intp)
+            candidates = np.sort(index.date_positions(self.start, self.end))
+        else:
+            candidates = None
+
+        mask = None
+        if self.month is not None:
+            months = index.months if candidates is None else index.months[candidates]
+            mask = months == self.month
+        for column, pattern in self.contains:
+            codes = index.codes(column)[0]
+            # El patrón se evalúa una vez por valor distinto; la fila toma el resultado de su código
+            lookup = np.append(index.value_matches(column, pattern), False)  # el código -1 (nulo) apunta al último elemento
+            column_mask = lookup[codes if candidates is None else codes[candidates]]
+            mask = column_mask if mask is None else mask & column_mask
+
+        if candidates is None:
+            return np.arange(len(index)) if mask is None else np.flatnonzero(mask)
+        return candidates if mask is None else candidates[mask]
+
+    def apply(self, index):
+        """DataFrame con solo las filas resultantes (la única copia del filtrado)."""
+        return index.df.take(self.positions(index))
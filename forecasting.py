@@ -0,0 +1,233 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+SALES_COLUMN = "Monto Facturado"
+DATE_COLUMN = "Fecha"
+# Segmentos con proyección propia (además del total)
+FORECAST_DIMENSIONS = ["Sucursal", "Tipo Cliente", "Tipo Vehículo", "Ejecutivo"]
+# Meses de historia necesarios para estimar una estacionalidad mensual
+MIN_SEASONAL_MONTHS = 24
+# Con menos series que esto no conviene pagar el envío a otros procesos (cada ajuste tarda ~10 ms)
+DEFAULT_MIN_PARALLEL = 64
+TOTAL_SERIES = "Total"
+
+
+class SeriesModel:
+    """Descomposición ajustada de una serie mensual, lista para proyectar meses futuros.
+
+    Guarda solo lo necesario para proyectar (último valor de tendencia y
+    componente estacional por mes calendario), de modo que se puede cachear
+    por versión de datos y enviar entre procesos.
+    """
+
+    def __init__(self, method, level, seasonal_by_month=None, mean=0.0, n_months=0, error=None):
+        self.method = method  # "seasonal" o "average"
+        self.level = level
+        self.seasonal_by_month = seasonal_by_month or {}
+        self.mean = mean
+        self.n_months = n_months
+        self.error = error
+
+    def predict(self, month):
+        """Valor proyectado para el mes (Timestamp o datetime) indicado, nunca negativo."""
+        if self.method == "seasonal":
+            return max(0, self.level + self.seasonal_by_month.get(month.month, 0.0))
+        return self.mean
+
+    def project(self, months):
+        return [self.predict(month) for month in months]
+
+
+def fit_model(values, start):
+    """Ajusta un SeriesModel a una serie mensual que empieza en `start` (función de módulo para el pool)."""
+    # Import local: los procesos del pool solo cargan statsmodels si ajustan modelos
+    from statsmodels.tsa.seasonal import seasonal_decompose
+
+    series = pd.Series(values, index=pd.date_range(start, periods=len(values), freq="MS"), dtype="float64")
+    mean = float(series.mean()) if len(series) else 0.0
+    if len(series) < MIN_SEASONAL_MONTHS:
+        return SeriesModel("average", mean, mean=mean, n_months=len(series))
+    try:
+        decomposition = seasonal_decompose(series, model='additive', period=12, extrapolate_trend='freq')
+    except Exception as e:
+        return SeriesModel("average", mean, mean=mean, n_months=len(series), error=str(e))
+    trend = decomposition.trend
+    if not trend.empty and not pd.isna(trend.iloc[-1]):
+        level = float(trend.iloc[-1])
+    else:
+        level = float(trend.mean()) if not trend.empty else mean
+    # Componente estacional por mes calendario (es el mismo valor cada 12 meses)
+    seasonal_by_month = decomposition.seasonal.groupby(decomposition.seasonal.index.month).first().to_dict()
+    return SeriesModel("seasonal", level, seasonal_by_month, mean, len(series))
+
+
+def _fit_batch(batch):
+    return [fit_model(values, start) for values, start in batch]
+
+
+def _warm_up():
+    import statsmodels.tsa.seasonal  # noqa: F401
+    return os.getpid()
+
+
+def remaining_months(now=None):
+    """Meses (inicio de mes) entre el mes siguiente a `now` y diciembre del mismo año."""
+    now = now or datetime.now()
+    return [pd.Timestamp(now + relativedelta(months=i + 1)).normalize().replace(day=1)
+            for i in range(12 - now.month)]
+
+
+def monthly_history(df, column=None, measure=SALES_COLUMN):
+    """Totales mensuales continuos (meses sin ventas en 0); una columna por segmento si se indica `column`."""
+    months = df[DATE_COLUMN].dt.to_period("M").dt.to_timestamp()
+    if column is None:
+        history = df[measure].groupby(months).sum().to_frame(TOTAL_SERIES)
+    else:
+        history = df.groupby([months, df[column]], observed=True)[measure].sum().unstack(fill_value=0)
+        history.columns = history.columns.astype(str)
+    if history.empty:
+        return history
+    full_range = pd.date_range(history.index.min(), history.index.max(), freq="MS")
+    return history.reindex(full_range, fill_value=0)
+
+
+class VersionForecasts:
+    """Modelos de una versión de datos: el total y cada segmento de FORECAST_DIMENSIONS.
+
+    Se ajustan la primera vez que se piden; todos los segmentos de todas las
+    dimensiones se ajustan juntos, en paralelo, en el pool del motor.
+    """
+
+    def __init__(self, engine, df, measure=SALES_COLUMN):
+        self.engine = engine
+        self.df = df
+        self.measure = measure
+        self._histories = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def history(self, column=None):
+        if column not in self._histories:
+            self._histories[column] = monthly_history(self.df, column, self.measure)
+        return self._histories[column]
+
+    def total(self):
+        """SeriesModel de la serie total."""
+        with self._lock:
+            if None not in self._models:
+                history = self.history()
+                self._models[None] = self.engine.fit_many({TOTAL_SERIES: history[TOTAL_SERIES]})
+            return self._models[None].get(TOTAL_SERIES)
+
+    def segments(self, column):
+        """{segmento: SeriesModel} de una dimensión."""
+        with self._lock:
+            if column not in self._models:
+                series = {}
+                for dimension in FORECAST_DIMENSIONS:
+                    if dimension in self.df.columns and dimension not in self._models:
+                        for segment, values in self.history(dimension).items():
+                            series[(dimension, segment)] = values
+                if column not in FORECAST_DIMENSIONS and column in self.df.columns:
+                    for segment, values in self.history(column).items():
+                        series[(column, segment)] = values
+                fitted = self.engine.fit_many(series)
+                for (dimension, segment), model in fitted.items():
+                    self._models.setdefault(dimension, {})[segment] = model
+            return self._models.get(column, {})
+
+
+class ForecastEngine:
+    """Ajusta y cachea modelos de proyección por versión de datos.
+
+    Las descomposiciones se calculan una vez por versión (huella de datos) y se
+    reparten entre procesos cuando hay suficientes series; si el pool no está
+    disponible se ajustan en el proceso actual.
+    """
+
+    def __init__(self, max_workers=None, min_parallel=DEFAULT_MIN_PARALLEL, max_versions=2):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.min_parallel = min_parallel
+        self.max_versions = max_versions
+        self.fits = 0
+        self._versions = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def for_version(self, fingerprint, df):
+        with self._lock:
+            forecasts = self._versions.get(fingerprint)
+            if forecasts is None:
+                forecasts = VersionForecasts(self, df)
+                self._versions[fingerprint] = forecasts
+                while len(self._versions) > self.max_versions:
+                    self._versions.pop(next(iter(self._versions)))
+            return forecasts
+
+    def fit_many(self, series):
+        """{clave: serie mensual} -> {clave: SeriesModel}."""
+        keys = list(series)
+        batch = [(values.to_numpy(), values.index[0] if len(values) else pd.Timestamp("1970-01-01"))
+                 for values in series.values()]
+        self.fits += len(batch)
+        if len(batch) < self.min_parallel or self.max_workers < 2:
+            return dict(zip(keys, _fit_batch(batch)))
+        try:
+            # Un lote por proceso para no pagar el envío de cada serie por separado
+            chunks = [batch[i::self.max_workers] for i in range(self.max_workers)]
+            results = list(self._get_pool().map(_fit_batch, chunks))
+        except (BrokenProcessPool, OSError):
+            self._pool = None
+            return dict(zip(keys, _fit_batch(batch)))
+        models = [None] * len(batch)
+        for i, chunk_models in enumerate(results):
+            models[i::self.max_workers] = chunk_models
+        return dict(zip(keys, models))
+
+    def warm_up(self):
+        """Arranca los procesos del pool (e importa statsmodels en ellos) sin esperar a que terminen."""
+        if self.max_workers < 2:
+            return
+        try:
+            pool = self._get_pool()
+            for _ in range(self.max_workers):
+                pool.submit(_warm_up)
+        except (BrokenProcessPool, OSError):
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # "spawn": el proceso de Streamlit tiene hilos y fork no es seguro con ellos
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def forecast_frame(forecasts, column=None, horizon=12):
+    """Historia y proyección en formato largo para graficar (Fecha, medida, Serie, Tipo)."""
+    history = forecasts.history(column)
+    if history.empty:
+        return pd.DataFrame(columns=[DATE_COLUMN, forecasts.measure, "Serie", "Tipo"])
+    future = list(pd.date_range(history.index.max() + pd.DateOffset(months=1), periods=horizon, freq="MS"))
+    models = {TOTAL_SERIES: forecasts.total()} if column is None else forecasts.segments(column)
+
+    frames = []
+    for name, model in models.items():
+        frames.append(pd.DataFrame({DATE_COLUMN: history.index, forecasts.measure: history[name].to_numpy(),
+                                    "Serie": name, "Tipo": "Histórico"}))
+        # La proyección parte del último mes histórico para que la línea sea continua
+        frames.append(pd.DataFrame({DATE_COLUMN: [history.index[-1]] + future,
+                                    forecasts.measure: [history[name].iloc[-1]] + model.project(future),
+                                    "Serie": name, "Tipo": "Proyección"}))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,139 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_MAX_CONCURRENT = 4
+
+# Códigos que vale la pena reintentar: cuota excedida y errores transitorios del servidor
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiBusyError(RuntimeError):
+    """Se alcanzó el máximo de llamadas concurrentes a Gemini y no se liberó un cupo a tiempo."""
+
+
+class GeminiAPIError(RuntimeError):
+    """Respuesta HTTP distinta de 200 en una llamada en streaming."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        super().__init__(f"Gemini respondió {status_code}")
+
+
+def extract_text(response_json):
+    """Texto de la primera candidata de una respuesta (o fragmento) de generateContent."""
+    candidates = (response_json or {}).get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiClient:
+    """Cliente HTTP compartido para la API de Gemini.
+
+    Mantiene un pool de conexiones keep-alive, aplica timeouts de conexión y
+    lectura en cada llamada, reintenta 429/5xx con backoff exponencial con jitter
+    y limita las llamadas simultáneas del proceso.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, base_url=API_BASE_URL,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=0.5, backoff_max=8.0,
+                 max_concurrent=DEFAULT_MAX_CONCURRENT, acquire_timeout=30):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def url(self, method="generateContent", model=None):
+        return f"{self.base_url}/models/{model or self.model}:{method}"
+
+    def _backoff_seconds(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # "Full jitter": espera aleatoria entre 0 y el tope exponencial
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise GeminiBusyError("Demasiadas consultas simultáneas a Gemini; intenta nuevamente en unos segundos.")
+
+    def _post_with_retries(self, url, payload, api_key, timeout, stream=False, params=None):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, headers={"x-goog-api-key": api_key},
+                                             params=params, timeout=timeout or self.timeout, stream=stream)
+            except requests.exceptions.ConnectionError:
+                # No se pudo conectar: reintentar. Los timeouts de lectura no se reintentan.
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff_seconds(attempt))
+                attempt += 1
+                continue
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                wait = self._backoff_seconds(attempt, response)
+                response.close()
+                time.sleep(wait)
+                attempt += 1
+                continue
+            return response
+
+    def generate_content(self, payload, api_key, timeout=None, model=None):
+        """POST a generateContent; devuelve el requests.Response final (después de reintentos)."""
+        self._acquire()
+        try:
+            return self._post_with_retries(self.url("generateContent", model), payload, api_key, timeout)
+        finally:
+            self._slots.release()
+
+    def stream_generate_content(self, payload, api_key, cancel_event=None, timeout=None, model=None):
+        """Generador con los fragmentos de texto de streamGenerateContent (SSE).
+
+        Se detiene sin error si `cancel_event` se activa (p. ej. el usuario hizo
+        otra pregunta); al cerrarse libera la conexión y el cupo de concurrencia.
+        """
+        self._acquire()
+        try:
+            response = self._post_with_retries(self.url("streamGenerateContent", model), payload, api_key,
+                                               timeout, stream=True, params={"alt": "sse"})
+            with response:
+                if response.status_code != 200:
+                    raise GeminiAPIError(response.status_code, response.text)
+                response.encoding = "utf-8"  # text/event-stream no siempre declara charset
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    if not line or not line.startswith("data:"):
+                        continue
+                    text = extract_text(json.loads(line[len("data:"):].strip()))
+                    if text:
+                        yield text
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self.session.close()
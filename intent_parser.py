@@ -0,0 +1,392 @@
+import calendar
+import re
+import threading
+
+from schema import COLUMN_SCHEMA, MONEY_COLUMNS
+from text_normalization import normalize_text
+
+# --- Parser local de intención (evita la primera llamada a Gemini en preguntas formulaicas) ---
+# Devuelve el mismo JSON que la primera llamada (chart_data) solo cuando reconoce la
+# pregunta con certeza; en cualquier otro caso devuelve None y se consulta a Gemini.
+
+MONTH_NAMES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4,
+    'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
+    'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12
+}
+
+SALES_COLUMN = "Monto Facturado"
+DIMENSION_COLUMNS = [col for col, kind in COLUMN_SCHEMA.items() if kind == "category"]
+# Columnas de categoría cuyos valores se reconocen en la pregunta (Cliente tiene demasiados)
+VALUE_COLUMNS = [col for col in DIMENSION_COLUMNS if col != "Cliente"]
+MAX_VALUES_PER_COLUMN = 50
+
+# Preguntas abiertas que requieren a Gemini (análisis, recomendaciones, proyecciones)
+_DEFER = re.compile(r"\b(recomend\w*|mejor(ar|as|es)|insights?|analisis|analiza\w*|tendencias?|anomal\w*|proyec\w*|"
+                    r"estim\w*|pronostic\w*|por que|como puedo|deberia\w*|consejos?|sin|excepto|salvo|no|trimestre|semestre|"
+                    r"ultim\w*|proxim\w*|top|\d+ (clientes|transacciones|facturas))\b")
+# Preguntas que piden algo distinto de una suma (conteos, máximos/mínimos, márgenes, montos netos).
+# "mayor cantidad de ventas" sí es una suma: es el cliente con más ventas
+_NOT_A_SUM = re.compile(r"\b(cuant[oa]s|numero de|(?<!mayor )(?<!menor )cantidad|maxim\w*|minim\w*|margen\w*|net[oa]s?)\b")
+# Rangos abiertos y exclusiones ("desde marzo", "hasta 2024", "excluyendo seguro"): el parser solo arma periodos
+# cerrados y filtros de inclusión. "entre <fecha> y <fecha>" (o dos años) y "el mes con menos ventas" sí los entiende
+_RANGE = re.compile(r"\b(excluy\w*|(?<!con )menos|desde|hasta|a partir de|despues|antes|entre)\b")
+_CLOSED_RANGE = re.compile(r"\bentre (el ano )?(\d{4}-\d{2}-\d{2}|20\d{2}) y (el ano )?(\d{4}-\d{2}-\d{2}|20\d{2})\b")
+_CHART = re.compile(r"\b(grafic[oa]s?|evolucion|chart)\b")
+_TABLE = re.compile(r"\b(tabla|lista\w*)\b")
+_YEAR = re.compile(r"\b(20\d{2})\b")
+_ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_SALES_WORDS = re.compile(r"\b(ventas?|vendi\w*|factura\w*|facturacion|ingresos?|monto facturado)\b")
+
+_MEASURE_ALIASES = {
+    "Monto Facturado": ["monto facturado", "montos facturados"],
+    "Materiales y Pintura": ["materiales y pintura", "materiales"],
+    "Costos Financieros": ["costos financieros", "costo financiero"],
+    "Descuento Aplicado (%)": ["descuento aplicado", "descuentos", "descuento"],
+}
+
+
+def _column_aliases(column):
+    name = normalize_text(column)
+    aliases = {name, name + "s", name + "es"}
+    words = name.split()
+    if len(words) == 2:
+        # "tipo cliente" -> "tipo de cliente", "estado pago" -> "estado de pago"
+        aliases.add(f"{words[0]} de {words[1]}")
+        aliases.add(f"{words[0]}s de {words[1]}")
+    return aliases
+
+
+class IntentParserStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.by_type = {}
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return
+            self.hits += 1
+            key = result["chart_type"] if result["is_chart_request"] else result["calculation_type"]
+            self.by_type[key] = self.by_type.get(key, 0) + 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+# Contadores del proceso (se muestran en la app y en bench/intent_hit_rate.py)
+STATS = IntentParserStats()
+
+
+def _payload(**overrides):
+    payload = {"is_chart_request": False, "chart_type": "none", "x_axis": "", "y_axis": "", "color_column": "",
+               "filter_column": "", "filter_value": "", "start_date": "", "end_date": "", "additional_filters": [],
+               "summary_response": "", "aggregation_period": "none", "table_columns": [],
+               "calculation_type": "none", "calculation_params": {}}
+    payload.update(overrides)
+    return payload
+
+
+# Columnas que un cálculo usa sin nombrarlas en el JSON
+_IMPLICIT_COLUMNS = {"max_client_sales": {"Cliente"}}
+
+
+def _used_columns(payload):
+    """Columnas de categoría que el JSON usa como eje, segmentación, filtro o parámetro."""
+    params = payload["calculation_params"]
+    used = {payload["x_axis"], payload["color_column"], payload["filter_column"], *payload["table_columns"],
+            params.get("group_by_column"), params.get("category_column")}
+    used.update(f["column"] for f in payload["additional_filters"])
+    return used | _IMPLICIT_COLUMNS.get(payload["calculation_type"], set())
+
+
+def _contains(text, phrase):
+    return re.search(rf"\b{re.escape(phrase)}\b", text) is not None
+
+
+class IntentParser:
+    """Parser determinístico de preguntas en español sobre los datos de la hoja.
+
+    `category_values` es {columna: [valores distintos]} (p. ej. desde el perfil del dataset).
+    """
+
+    def __init__(self, category_values=None, stats=STATS):
+        self.stats = stats
+        self.dimension_aliases = {col: _column_aliases(col) for col in DIMENSION_COLUMNS}
+        self.value_lookup = {}
+        for col, values in (category_values or {}).items():
+            if col not in VALUE_COLUMNS or len(values) > MAX_VALUES_PER_COLUMN:
+                continue
+            for value in values:
+                normalized = normalize_text(value)
+                if normalized:
+                    self.value_lookup.setdefault(normalized, []).append((col, str(value)))
+
+    @classmethod
+    def from_profile(cls, profile, stats=STATS):
+        values = {col.name: list(col.value_counts) for col in profile.columns
+                  if col.name in VALUE_COLUMNS and len(col.value_counts) <= MAX_VALUES_PER_COLUMN}
+        return cls(values, stats=stats)
+
+    def parse(self, question):
+        text = normalize_text(question)
+        result = self._parse(text)
+        # Una columna o valor nombrado que no terminó en un filtro o agrupación se perdería en silencio
+        if result is not None and not self._mentioned_dimensions(text) <= _used_columns(result):
+            result = None
+        if self.stats is not None:
+            self.stats.record(result)
+        return result
+
+    # --- Reconocimiento de piezas de la pregunta ---
+    def _measures(self, text):
+        """Columnas numéricas mencionadas, en el orden en que aparecen en la pregunta."""
+        found = {}
+        for column, aliases in _MEASURE_ALIASES.items():
+            positions = [m.start() for alias in aliases for m in re.finditer(rf"\b{re.escape(alias)}\b", text)]
+            if positions:
+                found[column] = min(positions)
+        return sorted(found, key=found.get)
+
+    def _dimension_after(self, text, prefixes=("por", "cada", "separado por", "segun")):
+        for column, aliases in self.dimension_aliases.items():
+            for alias in aliases:
+                for prefix in prefixes:
+                    if _contains(text, f"{prefix} {alias}"):
+                        return column
+        return None
+
+    def _mentioned_dimensions(self, text):
+        """Columnas de categoría nombradas en la pregunta, por su nombre o por uno de sus valores."""
+        found = set()
+        aliases = sorted(((alias, col) for col, col_aliases in self.dimension_aliases.items() for alias in col_aliases),
+                         key=lambda item: -len(item[0]))
+        for alias, column in aliases:
+            pattern = rf"\b{re.escape(alias)}\b"
+            if re.search(pattern, text):
+                found.add(column)
+                # "tipo de cliente" no cuenta además como "cliente"
+                text = re.sub(pattern, " ", text)
+        return found | {col for col, _ in self._category_values(text)}
+
+    def _category_values(self, text):
+        found = []
+        for normalized, targets in self.value_lookup.items():
+            if any(_contains(text, form) for form in (normalized, normalized + "s", normalized + "es")):
+                found.extend(targets)
+        return found
+
+    def _period(self, text):
+        if re.search(r"\b(por|cada) mes\b|\bmensual\w*", text):
+            return "month"
+        if re.search(r"\b(por|cada) ano\b|\banual\w*", text):
+            return "year"
+        if re.search(r"\b(por|cada) dia\b|\bdiari\w*", text):
+            return "day"
+        return None
+
+    def _month(self, text):
+        months = [number for name, number in MONTH_NAMES.items() if _contains(text, name)]
+        return months[0] if len(months) == 1 else (None if not months else -1)
+
+    # --- Reglas ---
+    def _parse(self, text):
+        if not text or _DEFER.search(text) or _NOT_A_SUM.search(text) or _RANGE.search(_CLOSED_RANGE.sub(" ", text)):
+            return None
+        years = sorted(set(int(y) for y in _YEAR.findall(text)))
+        dates = _ISO_DATE.findall(text)
+        month = self._month(text)
+        if month == -1:
+            return None
+        if _CHART.search(text) and _TABLE.search(text):
+            return None
+        if _CHART.search(text):
+            return self._chart(text, years, dates, month)
+        if _TABLE.search(text):
+            return self._table(text, years, month)
+        if len(dates) == 2 or (self._period(text) and not re.search(r"\b(total|cuanto|promedio|porcentaje)\b", text)):
+            # "ventas entre 2024-03-01 y 2024-06-30", "ventas por mes", "ventas mensuales de 2023"
+            return self._chart(text, years, dates, month)
+        if dates:
+            return None
+        return self._calculation(text, years, month)
+
+    def _chart(self, text, years, dates, month):
+        dimension = self._dimension_after(text)
+        period = self._period(text)
+        if re.search(r"\bbarras?\b", text):
+            chart_type = "bar"
+        elif re.search(r"\b(torta|pastel|circular)\b", text):
+            chart_type = "pie"
+        elif re.search(r"\bdispersion\b", text):
+            chart_type = "scatter"
+        elif re.search(r"\blineas?\b|\bevolucion\b|\bmensual\w*", text) or dates:
+            chart_type = "line"
+        elif (period and period != "month") or (period and not years) or (dimension and not period):
+            chart_type = "bar"
+        else:
+            chart_type = "line"
+
+        measures = self._measures(text)
+        if chart_type == "scatter":
+            if len(measures) != 2:
+                return None
+            x_axis, y_axis = measures
+        else:
+            if len(measures) > 1 or (not measures and not _SALES_WORDS.search(text)):
+                return None
+            x_axis, y_axis = "Fecha", (measures[0] if measures else SALES_COLUMN)
+
+        payload = _payload(is_chart_request=True, chart_type=chart_type, x_axis=x_axis, y_axis=y_axis)
+        if len(dates) == 2:
+            payload.update(start_date=dates[0], end_date=dates[1], aggregation_period="month")
+        elif dates or len(years) > 1:
+            return None
+        elif years:
+            if month:
+                last_day = calendar.monthrange(years[0], month)[1]
+                payload.update(start_date=f"{years[0]}-{month:02d}-01", end_date=f"{years[0]}-{month:02d}-{last_day:02d}")
+            else:
+                payload.update(filter_column="Fecha", filter_value=str(years[0]))
+        elif month:
+            return None
+
+        values = self._category_values(text)
+        value_columns = {col for col, _ in values}
+        if len(value_columns) > 1:
+            return None
+        if len(values) >= 2:
+            # "separado por particular y seguro": se segmenta por la columna de esos valores
+            dimension = dimension or next(iter(value_columns))
+        elif len(values) == 1:
+            payload["additional_filters"] = [{"column": values[0][0], "value": values[0][1]}]
+
+        if chart_type == "scatter":
+            payload.update(color_column=dimension or "")
+        elif chart_type == "pie" or (dimension and period is None and chart_type == "bar"):
+            if not dimension:
+                return None
+            payload.update(x_axis=dimension, color_column=dimension if chart_type == "bar" else "")
+        else:
+            default_period = payload["aggregation_period"] if payload["aggregation_period"] != "none" else "month"
+            payload.update(color_column=dimension or "", aggregation_period=period or default_period)
+
+        if chart_type == "scatter":
+            what = f"{payload['x_axis']} y {payload['y_axis']}"
+        elif payload["x_axis"] != "Fecha":
+            what = f"{payload['y_axis']} por {payload['x_axis']}"
+        else:
+            what = payload["y_axis"]
+        titles = {"line": "la evolución de", "bar": "un gráfico de barras de", "pie": "la distribución de", "scatter": "la relación entre"}
+        payload["summary_response"] = f"Aquí tienes {titles[chart_type]} {what}" + \
+            (f" en {payload['filter_value']}" if payload["filter_value"] else "") + ":"
+        return payload
+
+    def _table(self, text, years, month):
+        dimension = self._dimension_after(text, prefixes=("por", "cada", "segun"))
+        measures = self._measures(text)
+        if not dimension or len(measures) > 1 or (not measures and not _SALES_WORDS.search(text)) or month:
+            return None
+        measure = measures[0] if measures else SALES_COLUMN
+        payload = _payload(is_chart_request=True, chart_type="table", x_axis=dimension, y_axis=measure,
+                           table_columns=[dimension, measure],
+                           summary_response=f"Aquí tienes una tabla con {measure} por {dimension}:")
+        if len(years) > 1:
+            return None
+        if years:
+            payload.update(filter_column="Fecha", filter_value=str(years[0]))
+        return payload
+
+    def _calculation(self, text, years, month):
+        if self._period(text):
+            return None
+        measures = self._measures(text)
+        measure = measures[0] if len(measures) == 1 else (SALES_COLUMN if not measures else None)
+        if measure is None:
+            return None
+        values = self._category_values(text)
+
+        if "variacion" in text:
+            if len(years) != 2 or values:
+                return None
+            return _payload(calculation_type="percentage_variation",
+                            calculation_params={"column_to_analyze": measure, "year1": years[0], "year2": years[1]},
+                            summary_response=f"La variación porcentual de {measure} entre [YEAR1] y [YEAR2] fue del [PERCENTAGE_VARIATION:.2f]%.")
+        if len(years) > 1:
+            return None
+
+        if "porcentaje" in text:
+            if len(values) != 1 or years or month or measure != SALES_COLUMN:
+                return None
+            column, value = values[0]
+            return _payload(calculation_type="percentage_of_total_sales_by_category",
+                            calculation_params={"category_column": column, "category_value": value},
+                            summary_response=f"El porcentaje de ventas que corresponde a {column} [CATEGORY_VALUE] es del [PERCENTAGE_SALES_CATEGORY:.2f]%.")
+        if re.search(r"\bvencid[oa]s?\b", text):
+            if years or month or measure != SALES_COLUMN or any(col != "Estado Pago" for col, _ in values):
+                return None
+            return _payload(calculation_type="total_overdue_payments", filter_column="Estado Pago", filter_value="Vencido",
+                            summary_response="El monto total facturado con estado de pago vencido es de $[TOTAL_MONTO_VENCIDO].")
+
+        if values:
+            # Los cálculos de totales no aplican filtros por categoría: mejor que responda Gemini
+            return None
+
+        if "promedio" in text:
+            dimension = self._dimension_after(text)
+            if not dimension or years or month:
+                return None
+            return _payload(calculation_type="average_by_column",
+                            calculation_params={"column_to_average": measure, "group_by_column": dimension},
+                            summary_response=f"El promedio de {measure} por {dimension} es: [AVERAGE_BY_SUCURSAL].")
+
+        if self._dimension_after(text):
+            return None
+
+        if re.search(r"\bclientes?\b", text) and re.search(r"\b(mas|mayor)\b", text):
+            if years or month or measure != SALES_COLUMN:
+                return None
+            return _payload(calculation_type="max_client_sales",
+                            summary_response="Basado en tus datos, el cliente que generó la mayor cantidad de ventas es [NOMBRE_CLIENTE_MAX_VENTAS] con un total de $[MONTO_MAX_VENTAS].")
+
+        if re.search(r"\bmes\b", text) and re.search(r"\b(menos|menor|peor)\b", text):
+            if years or month or measure != SALES_COLUMN:
+                return None
+            return _payload(calculation_type="min_month_sales",
+                            summary_response="El mes con menos ingresos fue [MES_MIN_INGRESOS] con un total de $[MONTO_MIN_INGRESOS].")
+
+        if re.search(r"\b(mas|mayor|menos|menor|maximo|minimo|mejor|peor)\b", text):
+            return None
+
+        if measure != SALES_COLUMN:
+            if len(years) != 1 or month or not re.search(r"\b(total|cuanto|suma)\b", text) \
+                    or measure not in MONEY_COLUMNS:
+                return None
+            return _payload(calculation_type="total_for_column_by_year", filter_column="Fecha", filter_value=str(years[0]),
+                            aggregation_period="year",
+                            calculation_params={"column_to_sum": measure, "year": years[0]},
+                            summary_response=f"El total de {measure} para el año [YEAR] fue de $[TOTAL_MATERIALS_PAINT].")
+
+        if not _SALES_WORDS.search(text):
+            return None
+        if years and month:
+            last_day = calendar.monthrange(years[0], month)[1]
+            return _payload(calculation_type="sales_for_period", filter_column="Fecha", filter_value=str(years[0]),
+                            start_date=f"{years[0]}-{month:02d}-01", end_date=f"{years[0]}-{month:02d}-{last_day:02d}",
+                            aggregation_period="month", calculation_params={"year": years[0], "month": month},
+                            summary_response="Las ventas de [MONTH] de [YEAR] fueron de $[CALCULATED_SALES_MONTH_YEAR].")
+        if years:
+            return _payload(calculation_type="sales_for_period", filter_column="Fecha", filter_value=str(years[0]),
+                            aggregation_period="year", calculation_params={"year": years[0]},
+                            summary_response="El monto total facturado en [YEAR] fue de $[CALCULATED_TOTAL_YEAR].")
+        if month:
+            return None
+        if re.search(r"\b(total|totales|cuanto|suma)\b", text):
+            return _payload(calculation_type="total_sales",
+                            summary_response="El monto total facturado en todos los datos es de $[TOTAL_MONTO_FACTURADO].")
+        return None
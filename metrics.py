@@ -0,0 +1,434 @@
+from datetime import datetime
+
+import pandas as pd
+
+from cube import CLIENT_COLUMN, COUNT_SUFFIX
+from forecasting import ForecastEngine, VersionForecasts, remaining_months
+from value_index import ValueIndex
+
+SALES_COLUMN = "Monto Facturado"
+DATE_KEYS = ("year", "month")
+
+# Placeholders que, si quedan sin reemplazar, derivan la pregunta a la llamada de análisis de Gemini
+FALLBACK_PLACEHOLDERS = ["[NOMBRE_CLIENTE_MAX_VENTAS]", "[ESTIMACION_RESTO_YEAR]", "[ESTIMACION_MENSUAL_RESTO_YEAR]",
+                         "[TOTAL_MONTO_VENCIDO]", "[CALCULATED_TOTAL_YEAR]", "[CALCULATED_SALES_MONTH_YEAR]",
+                         "[PERCENTAGE_VARIATION:.2f]", "[AVERAGE_BY_SUCURSAL]", "[TOTAL_MATERIALS_PAINT]",
+                         "[PERCENTAGE_SALES_CATEGORY:.2f]"]
+
+
+def needs_analysis(summary):
+    """True si la respuesta está vacía o le quedan placeholders que Python no pudo calcular."""
+    return not summary or any(placeholder in summary for placeholder in FALLBACK_PLACEHOLDERS)
+
+
+# --- Registro de métricas ---
+METRICS = {}
+
+
+def register(metric_class):
+    """Decorador: registra la métrica bajo su calculation_type."""
+    METRICS[metric_class.name] = metric_class()
+    return metric_class
+
+
+class Metric:
+    """Cálculo de un calculation_type.
+
+    `needs` declara las agregaciones que necesita como (claves de agrupación,
+    medidas); el ejecutor las resuelve todas juntas y `fill` reemplaza los
+    placeholders de la respuesta con los resultados.
+    """
+
+    name = None
+
+    def needs(self, params, data):
+        return []
+
+    def fill(self, summary, params, data, results):
+        return summary
+
+
+class AggregationResults:
+    """Agregaciones resueltas por el ejecutor, consultables por claves de agrupación."""
+
+    def __init__(self, tables, source_of):
+        self._tables = tables  # {fuente: DataFrame agrupado por la unión de claves}
+        self._source_of = source_of
+        self._derived = {}
+        self.messages = []  # (nivel, texto) para mostrar en la interfaz
+
+    def table(self, keys, measure):
+        """DataFrame indexado por `keys` con la suma (y el conteo) de `measure`."""
+        keys = tuple(keys)
+        source = self._source_of(keys, [measure])
+        cache_key = (source, keys)
+        if cache_key not in self._derived:
+            base = self._tables[source]
+            # Reagrega el resultado de la pasada (pequeño) a las claves pedidas
+            self._derived[cache_key] = base.sum().to_frame().T if not keys \
+                else base.groupby(list(keys), observed=True).sum()
+        return self._derived[cache_key]
+
+    def total(self, measure, year=None, month=None):
+        keys = tuple(key for key, value in (("year", year), ("month", month)) if value is not None)
+        table = self.table(keys, measure)
+        if not keys:
+            return table[measure].iloc[0]
+        position = tuple(int(value) for value in (year, month) if value is not None)
+        position = position[0] if len(position) == 1 else position
+        return table[measure].get(position, 0)
+
+    def sums_by(self, keys, measure):
+        return self.table(keys, measure)[measure]
+
+    def mean_by(self, keys, measure):
+        table = self.table(keys, measure)
+        return table[measure] / table[measure + COUNT_SUFFIX]
+
+    def monthly_series(self, measure):
+        """Serie mensual continua (meses sin ventas en 0), equivalente a resample('MS').sum()."""
+        totals = self.sums_by(DATE_KEYS, measure)
+        if totals.empty:
+            return pd.Series(dtype="float64")
+        index = pd.to_datetime(pd.DataFrame({"year": totals.index.get_level_values(0),
+                                             "month": totals.index.get_level_values(1), "day": 1}))
+        series = pd.Series(totals.to_numpy(), index=index).sort_index()
+        return series.reindex(pd.date_range(series.index.min(), series.index.max(), freq="MS"), fill_value=0)
+
+    def total_matching(self, measure, column, pattern):
+        """Suma de `measure` donde `column` coincide con `pattern` (ver ValueIndex)."""
+        sums = self.sums_by((column,), measure)
+        matches = ValueIndex(sums.index.astype(str)).matches(pattern)
+        return sums[matches].sum()
+
+
+class MetricExecutor:
+    """Resuelve varias métricas con una sola pasada `groupby` por fuente de datos.
+
+    Las agregaciones pedidas por todas las métricas de la pregunta se agrupan
+    por la unión de sus claves: sobre las celdas del cubo si las claves y
+    medidas están en él, sobre los totales por Cliente del cubo, o sobre las
+    filas del DataFrame en cualquier otro caso. Cada métrica lee luego su
+    agregación reagrupando ese resultado, que es pequeño.
+    """
+
+    def __init__(self, cube, df, forecasts=None):
+        self.cube = cube
+        self.df = df
+        # Sin motor compartido, los modelos se ajustan en este proceso y no se reutilizan
+        self.forecasts = forecasts or VersionForecasts(ForecastEngine(max_workers=1), df)
+        self.columns = df.columns
+        self.passes = 0
+        self.rows_scanned = 0
+
+    def is_numeric(self, column):
+        return column in self.columns and pd.api.types.is_numeric_dtype(self.df[column])
+
+    def run(self, calculations, summary):
+        """Aplica [(calculation_type, params), ...] sobre `summary`; devuelve (summary, mensajes)."""
+        requested = [(METRICS[name], params or {}) for name, params in calculations if name in METRICS]
+        needs = [need for metric, params in requested for need in metric.needs(params, self)]
+        results = AggregationResults(self._aggregate(needs), self._source)
+        for metric, params in requested:
+            summary = metric.fill(summary, params, self, results)
+        return summary, results.messages
+
+    def _source(self, keys, measures):
+        if keys == (CLIENT_COLUMN,) and set(measures) <= set(self.cube.client_totals.columns):
+            return "clients"
+        cube_keys = set(DATE_KEYS) | set(self.cube.dimensions)
+        if set(keys) <= cube_keys and all(self.cube.has_measure(measure) for measure in measures):
+            return "cube"
+        return "rows"
+
+    def _aggregate(self, needs):
+        plan = {}
+        for keys, measures in needs:
+            keys = tuple(keys)
+            source = self._source(keys, measures)
+            source_keys, source_measures = plan.setdefault(source, ([], []))
+            source_keys.extend(key for key in keys if key not in source_keys)
+            source_measures.extend(measure for measure in measures if measure not in source_measures)
+
+        tables = {}
+        for source, (keys, measures) in plan.items():
+            self.passes += 1
+            if source == "clients":
+                self.rows_scanned += len(self.cube.client_totals)
+                tables[source] = self.cube.client_totals[measures]
+                continue
+            if source == "cube":
+                frame = self.cube.cells
+                self.rows_scanned += len(frame)
+                grouped = frame.groupby(keys, observed=True, dropna=False) if keys else None
+                columns = measures + [measure + COUNT_SUFFIX for measure in measures]
+                tables[source] = grouped[columns].sum() if keys else frame[columns].sum().to_frame().T
+                continue
+            frame = self.df[[key for key in keys if key in self.columns] + measures]
+            self.rows_scanned += len(frame)
+            if "year" in keys:
+                frame = frame.assign(year=self.df["Fecha"].dt.year)
+            if "month" in keys:
+                frame = frame.assign(month=self.df["Fecha"].dt.month)
+            if keys:
+                grouped = frame.groupby(keys, observed=True, dropna=False)[measures]
+                tables[source] = grouped.sum().join(grouped.count().add_suffix(COUNT_SUFFIX))
+            else:
+                tables[source] = pd.concat([frame[measures].sum(), frame[measures].count().add_suffix(COUNT_SUFFIX)]).to_frame().T
+        return tables
+
+
+def _replace(summary, **values):
+    for placeholder, value in values.items():
+        summary = summary.replace(f"[{placeholder}]", value)
+    return summary
+
+
+# --- Métricas ---
+@register
+class TotalSales(Metric):
+    name = "total_sales"
+
+    def needs(self, params, data):
+        return [((), [SALES_COLUMN])]
+
+    def fill(self, summary, params, data, results):
+        return summary.replace("[TOTAL_MONTO_FACTURADO]", f"{results.total(SALES_COLUMN):,.2f}")
+
+
+@register
+class MaxClientSales(Metric):
+    name = "max_client_sales"
+
+    def needs(self, params, data):
+        return [((CLIENT_COLUMN,), [SALES_COLUMN])] if CLIENT_COLUMN in data.columns and SALES_COLUMN in data.columns else []
+
+    def fill(self, summary, params, data, results):
+        if CLIENT_COLUMN not in data.columns or SALES_COLUMN not in data.columns:
+            return _replace(summary, NOMBRE_CLIENTE_MAX_VENTAS="N/A", MONTO_MAX_VENTAS="N/A")
+        totals = results.sums_by((CLIENT_COLUMN,), SALES_COLUMN)
+        if totals.empty:
+            return _replace(summary, NOMBRE_CLIENTE_MAX_VENTAS="No hay datos de clientes disponibles para este cálculo.",
+                            MONTO_MAX_VENTAS="N/A")
+        return _replace(summary, NOMBRE_CLIENTE_MAX_VENTAS=str(totals.idxmax()), MONTO_MAX_VENTAS=f"{totals.max():,.2f}")
+
+
+@register
+class MinMonthSales(Metric):
+    name = "min_month_sales"
+
+    def needs(self, params, data):
+        return [(DATE_KEYS, [SALES_COLUMN])]
+
+    def fill(self, summary, params, data, results):
+        monthly = results.monthly_series(SALES_COLUMN)
+        if monthly.empty:
+            return _replace(summary, MES_MIN_INGRESOS="N/A", MONTO_MIN_INGRESOS="N/A")
+        return _replace(summary, MES_MIN_INGRESOS=monthly.idxmin().strftime("%B %Y"),
+                        MONTO_MIN_INGRESOS=f"{monthly.min():,.2f}")
+
+
+@register
+class SalesForPeriod(Metric):
+    name = "sales_for_period"
+
+    def needs(self, params, data):
+        if not params.get("year"):
+            return []
+        return [(DATE_KEYS if params.get("month") else ("year",), [SALES_COLUMN])]
+
+    def fill(self, summary, params, data, results):
+        year, month = params.get("year"), params.get("month")
+        if not year:
+            return _replace(summary, CALCULATED_TOTAL_YEAR="N/A", CALCULATED_SALES_MONTH_YEAR="N/A", MONTH="N/A", YEAR="N/A")
+        if month:
+            sales = results.total(SALES_COLUMN, year=year, month=month)
+            return _replace(summary, CALCULATED_SALES_MONTH_YEAR=f"{sales:,.2f}",
+                            MONTH=datetime(year, month, 1).strftime("%B").capitalize(), YEAR=str(year))
+        return _replace(summary, CALCULATED_TOTAL_YEAR=f"{results.total(SALES_COLUMN, year=year):,.2f}", YEAR=str(year))
+
+
+@register
+class ProjectRemainingYear(Metric):
+    name = "project_remaining_year"
+
+    def needs(self, params, data):
+        return [(DATE_KEYS, [SALES_COLUMN])] if params.get("target_year") else []
+
+    def fill(self, summary, params, data, results):
+        target_year = params.get("target_year")
+        if not target_year:
+            return _replace(summary, ESTIMACION_RESTO_YEAR="N/A", TARGET_YEAR="N/A")
+        current_month = datetime.now().month
+        # Totales de los meses con datos del año objetivo hasta el mes actual
+        monthly = results.sums_by(DATE_KEYS, SALES_COLUMN)
+        monthly = monthly[(monthly.index.get_level_values(0) == int(target_year)) &
+                          (monthly.index.get_level_values(1) <= current_month)]
+        if monthly.empty:
+            return _replace(summary, ESTIMACION_RESTO_YEAR="No hay suficientes datos para una estimación.", TARGET_YEAR=str(target_year))
+        projected_sales = monthly.mean() * (12 - current_month)
+        return _replace(summary, ESTIMACION_RESTO_YEAR=f"{projected_sales:,.2f}", TARGET_YEAR=str(target_year))
+
+
+@register
+class ProjectRemainingYearMonthly(Metric):
+    """Proyección mensual hasta fin de año con estacionalidad, del total o de cada segmento.
+
+    Los modelos vienen del ForecastEngine (una descomposición por serie y
+    versión de datos); aquí solo se proyectan los meses que quedan del año.
+    """
+
+    name = "project_remaining_year_monthly"
+
+    def fill(self, summary, params, data, results):
+        target_year = params.get("target_year")
+        if not target_year:
+            return _replace(summary, ESTIMACION_MENSUAL_RESTO_YEAR="N/A", TARGET_YEAR="N/A")
+        segment_column = params.get("segment_column")
+        if segment_column and segment_column in data.columns:
+            return self._fill_segments(summary, target_year, segment_column, data)
+
+        model = data.forecasts.total()
+        current_month = datetime.now().month
+        if model.method == "average" and model.error is None:
+            results.messages.append(("warning", "Se necesitan al menos 2 años de datos mensuales para una proyección con estacionalidad precisa. Recurriendo a proyección basada en promedio simple."))
+            projection = "\n" + "\n".join(_average_projection(model.mean, target_year, current_month))
+            return _replace(summary, ESTIMACION_MENSUAL_RESTO_YEAR=projection, TARGET_YEAR=str(target_year))
+        if model.error is not None:
+            results.messages.append(("error", f"Error al realizar la descomposición de series de tiempo: {model.error}. Asegúrate de tener suficientes datos históricos (al menos 2 años completos) para detectar estacionalidad mensual."))
+            summary = summary.replace("[ESTIMACION_MENSUAL_RESTO_YEAR]", "No se pudo generar una estimación con estacionalidad debido a un error o falta de datos.")
+            # Fallback a promedio simple si el modelo falla
+            summary += "\n\nSe recurrió a una proyección basada en promedio simple." + "\n" + "\n".join(_average_projection(model.mean, target_year, current_month))
+            return summary.replace("[TARGET_YEAR]", str(target_year))
+
+        months = remaining_months()
+        if not months:
+            return _replace(summary, ESTIMACION_MENSUAL_RESTO_YEAR="No hay meses restantes para proyectar en este año.", TARGET_YEAR=str(target_year))
+        projected_months_list = [f"- {month.strftime('%B').capitalize()} {month.year}: ${value:,.2f}"
+                                 for month, value in zip(months, model.project(months))]
+        return _replace(summary, ESTIMACION_MENSUAL_RESTO_YEAR="\n" + "\n".join(projected_months_list), TARGET_YEAR=str(target_year))
+
+    def _fill_segments(self, summary, target_year, segment_column, data):
+        months = remaining_months()
+        if not months:
+            return _replace(summary, ESTIMACION_MENSUAL_RESTO_YEAR="No hay meses restantes para proyectar en este año.", TARGET_YEAR=str(target_year))
+        lines = []
+        for segment, model in sorted(data.forecasts.segments(segment_column).items()):
+            values = model.project(months)
+            detail = ", ".join(f"{month.strftime('%B').capitalize()} {month.year}: ${value:,.2f}" for month, value in zip(months, values))
+            lines.append(f"- {segment_column} {segment}: {detail} (total ${sum(values):,.2f})")
+        return _replace(summary, ESTIMACION_MENSUAL_RESTO_YEAR="\n" + "\n".join(lines), TARGET_YEAR=str(target_year))
+
+
+def _average_projection(avg_monthly_sales, target_year, current_month):
+    return [f"- {datetime(target_year, month_num, 1).strftime('%B').capitalize()} {target_year}: ${avg_monthly_sales:,.2f}"
+            for month_num in range(current_month + 1, 13)]
+
+
+@register
+class TotalOverduePayments(Metric):
+    name = "total_overdue_payments"
+    column = "Estado Pago"
+
+    def needs(self, params, data):
+        return [((self.column,), [SALES_COLUMN])] if self.column in data.columns else []
+
+    def fill(self, summary, params, data, results):
+        if self.column not in data.columns:
+            return summary.replace("[TOTAL_MONTO_VENCIDO]", "N/A")
+        total = results.total_matching(SALES_COLUMN, self.column, "Vencido")
+        return summary.replace("[TOTAL_MONTO_VENCIDO]", f"{total:,.2f}")
+
+
+@register
+class PercentageVariation(Metric):
+    name = "percentage_variation"
+
+    def _valid(self, params, data):
+        column = params.get("column_to_analyze")
+        return column and params.get("year1") and params.get("year2") and data.is_numeric(column)
+
+    def needs(self, params, data):
+        return [(("year",), [params["column_to_analyze"]])] if self._valid(params, data) else []
+
+    def fill(self, summary, params, data, results):
+        year1, year2 = params.get("year1"), params.get("year2")
+        if not self._valid(params, data):
+            return _replace(summary, **{"PERCENTAGE_VARIATION:.2f": "N/A"}, YEAR1=str(year1 or 'Año1'),
+                            YEAR2=str(year2 or 'Año2')) + ". Faltan datos o columnas para calcular la variación."
+        value_year1 = results.total(params["column_to_analyze"], year=year1)
+        value_year2 = results.total(params["column_to_analyze"], year=year2)
+        if value_year1 == 0:
+            return _replace(summary, **{"PERCENTAGE_VARIATION:.2f": "N/A"}, YEAR1=str(year1), YEAR2=str(year2)) + \
+                ". No se puede calcular la variación porque el valor del año inicial es cero."
+        percentage_var = ((value_year2 - value_year1) / value_year1) * 100
+        return _replace(summary, **{"PERCENTAGE_VARIATION:.2f": f"{percentage_var:.2f}"}, YEAR1=str(year1), YEAR2=str(year2))
+
+
+@register
+class AverageByColumn(Metric):
+    name = "average_by_column"
+
+    def needs(self, params, data):
+        column, group_by = params.get("column_to_average"), params.get("group_by_column")
+        if column and group_by and group_by in data.columns and data.is_numeric(column):
+            return [((group_by,), [column])]
+        return []
+
+    def fill(self, summary, params, data, results):
+        column, group_by = params.get("column_to_average"), params.get("group_by_column")
+        if not (column and group_by and column in data.columns and group_by in data.columns):
+            return summary.replace("[AVERAGE_BY_SUCURSAL]", "N/A") + ". Faltan columnas para calcular el promedio."
+        if not data.is_numeric(column):
+            return summary.replace("[AVERAGE_BY_SUCURSAL]", "N/A") + f". La columna '{column}' no es numérica para calcular el promedio."
+        average_data = results.mean_by((group_by,), column).rename(column).reset_index()
+        average_data[column] = average_data[column].apply(lambda x: f"${x:,.2f}")
+        return summary.replace("[AVERAGE_BY_SUCURSAL]", "\n" + average_data.to_string(index=False))
+
+
+@register
+class TotalForColumnByYear(Metric):
+    name = "total_for_column_by_year"
+
+    def needs(self, params, data):
+        column = params.get("column_to_sum")
+        return [(("year",), [column])] if column and params.get("year") and data.is_numeric(column) else []
+
+    def fill(self, summary, params, data, results):
+        column, year = params.get("column_to_sum"), params.get("year")
+        if not (column and year and column in data.columns):
+            return summary.replace("[TOTAL_MATERIALS_PAINT]", "N/A") + ". Faltan datos o columnas para calcular el total."
+        if not data.is_numeric(column):
+            return summary.replace("[TOTAL_MATERIALS_PAINT]", "N/A") + f". La columna '{column}' no es numérica para sumar."
+        return _replace(summary, TOTAL_MATERIALS_PAINT=f"{results.total(column, year=year):,.2f}", YEAR=str(year))
+
+
+@register
+class PercentageOfTotalSalesByCategory(Metric):
+    name = "percentage_of_total_sales_by_category"
+
+    def _valid(self, params, data):
+        column = params.get("category_column")
+        return column and params.get("category_value") and column in data.columns and SALES_COLUMN in data.columns
+
+    def needs(self, params, data):
+        return [((), [SALES_COLUMN]), ((params["category_column"],), [SALES_COLUMN])] if self._valid(params, data) else []
+
+    def fill(self, summary, params, data, results):
+        category_value = params.get("category_value")
+        if not self._valid(params, data):
+            return _replace(summary, **{"PERCENTAGE_SALES_CATEGORY:.2f": "N/A"}, CATEGORY_VALUE=category_value or "N/A") + \
+                ". Faltan datos o columnas para calcular el porcentaje."
+        total_sales = results.total(SALES_COLUMN)
+        if total_sales == 0:
+            return _replace(summary, **{"PERCENTAGE_SALES_CATEGORY:.2f": "N/A"}, CATEGORY_VALUE=category_value) + \
+                ". No se puede calcular el porcentaje porque el monto total facturado es cero."
+        category_sales = results.total_matching(SALES_COLUMN, params["category_column"], category_value)
+        percentage = (category_sales / total_sales) * 100
+        return _replace(summary, **{"PERCENTAGE_SALES_CATEGORY:.2f": f"{percentage:.2f}"}, CATEGORY_VALUE=category_value)
+
+
+@register
+class Recommendations(Metric):
+    # Sin cálculo: la respuesta vacía deriva la pregunta a la llamada de análisis de Gemini
+    name = "recommendations"
@@ -0,0 +1,389 @@
+import re
+import time
+
+from dataset_profile import DETAIL_COMPACT, DETAIL_FULL, DETAIL_NAME, MAX_LISTED_VALUES
+from text_normalization import normalize_text
+
+# Presupuesto por defecto de tokens de entrada por prompt (plantilla + datos + pregunta)
+DEFAULT_TOKEN_BUDGET = 6000
+# Aproximación de Gemini para español: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+# Columnas que nunca se omiten del prompt (a lo más se resumen)
+CORE_COLUMNS = ["Fecha", "Monto Facturado"]
+# Solo se buscan en la pregunta los valores de columnas con pocos valores distintos
+MAX_MATCHED_VALUES = 50
+
+_DETAIL_LABELS = {DETAIL_FULL: "completo", DETAIL_COMPACT: "resumido", DETAIL_NAME: "solo nombre"}
+
+
+# --- Plantillas de los prompts ---
+# Las plantillas usan str.format: las llaves literales van dobladas.
+INTENT_PROMPT = """Eres un asesor financiero impecable y tu objetivo es proporcionar análisis precisos, gráficos claros y respuestas directas y útiles.
+
+Analiza la siguiente pregunta del usuario y determina si solicita un gráfico, una tabla o una respuesta textual/analítica.
+Si solicita una visualización (gráfico o tabla), extrae el tipo de visualización, las columnas para los ejes X e Y (si es gráfico), una columna para colorear/agrupar (si se pide una segmentación), el período de agregación (día, mes, año, ninguno) y cualquier filtro de fecha o valor.
+Si solicita una tabla, también especifica las columnas que deben mostrarse en `table_columns`.
+Si no es una solicitud de visualización (gráfico/tabla), marca 'is_chart_request' como false y 'chart_type' como 'none'.
+
+**Prioridades de Respuesta:**
+1.  **Respuesta Textual/Análisis:** Si la pregunta busca un dato específico (total, promedio, máximo, mínimo), un ranking, una comparación directa, una estimación, una proyección o un análisis descriptivo, prioriza `is_chart_request: false` y proporciona una `summary_response` detallada.
+2.  **Tabla:** Si la pregunta pide 'listar', 'mostrar una tabla', 'detallar', 'qué clientes/productos/categorías' o una vista de datos estructurada, prioriza `is_chart_request: true` y `chart_type: table`. Especifica las columnas relevantes en `table_columns`.
+3.  **Gráfico:** Si la pregunta pide 'gráfico', 'evolución', 'distribución', 'comparación visual', prioriza `is_chart_request: true` y el `chart_type` adecuado (line, bar, pie, scatter). Si pide un gráfico de 'proyección', 'pronóstico' o 'estimación' de ventas, usa `chart_type: forecast` (historia mensual más proyección); la segmentación va en `color_column`.
+
+**Columnas de datos disponibles y sus tipos (usa estos nombres EXACTOS):**
+{available_columns_str}
+
+**Resumen completo del DataFrame (para entender el contexto y los valores):**
+{df_summary_str}
+
+**Consideraciones para la respuesta JSON (todos los campos son obligatorios):**
+-   `is_chart_request`: Booleano. True si el usuario pide un gráfico o tabla, false en caso contrario.
+-   `chart_type`: String. Tipo de visualización (line, bar, pie, scatter, table, forecast). 'none' if not a visualization or unclear type.
+-   `x_axis`: String. Nombre de la columna para el eje X (ej: 'Fecha'). Vacío si no es gráfico.
+-   `y_axis`: String. Nombre de la columna para el eje Y (ej: 'Monto Facturado'). Vacío si no es gráfico.
+-   `color_column`: String. Nombre de la columna para colorear/agrupar (ej: 'Tipo Cliente'). Vacío si no se pide segmentación o la columna no existe.
+-   `filter_column`: String. Columna para filtro principal (ej: 'Fecha' para año). Vacío si no hay filtro principal.
+-   `filter_value`: String. Valor para filtro principal (ej: '2025', 'Enero'). Vacío si no hay filtro principal.
+-   `start_date`: String. Fecha de inicio del rango (YYYY-MM-DD). Vacío si no hay rango.
+-   `end_date`: String. Fecha de fin del rango (YYYY-MM-DD). Vacío si no hay rango.
+-   `additional_filters`: Array de objetos. Lista de filtros adicionales por columna. Cada objeto tiene 'column' (string) y 'value' (string).
+-   `summary_response`: String. Respuesta conversacional amigable que introduce la visualización o el análisis. Para respuestas textuales, debe contener la información solicitada directamente.
+-   `aggregation_period`: String. Período de agregación para datos de tiempo (day, month, year) o 'none' si no aplica.
+-   `table_columns`: Array de strings. Lista de nombres de columnas a mostrar en una tabla. Solo aplica si chart_type es 'table'.
+-   `calculation_type`: String. Tipo de cálculo a realizar por Python. Enum: 'none', 'total_sales', 'max_client_sales', 'min_month_sales', 'sales_for_period', 'project_remaining_year', 'project_remaining_year_monthly', 'total_overdue_payments', 'percentage_variation', 'average_by_column', 'total_for_column_by_year', 'percentage_of_total_sales_by_category', 'recommendations'.
+-   `calculation_params`: Objeto JSON. Parámetros para el cálculo (ej: {{"year": 2025}} para 'total_sales_for_year').
+-   `additional_calculations`: Array de objetos (opcional). Si la pregunta pide varios números a la vez, los cálculos adicionales al principal, cada uno con 'calculation_type' y 'calculation_params'. Todos los placeholders van en la misma `summary_response`.
+
+**Ejemplos de cómo mapear la intención (en formato JSON válido):**
+-   "evolución de ventas del año 2025": {{"is_chart_request": true, "chart_type": "line", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "Fecha", "filter_value": "2025", "color_column": "", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes la evolución de ventas para el año 2025:", "aggregation_period": "month", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "ventas por mes": {{"is_chart_request": true, "chart_type": "bar", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes un gráfico de barras de las ventas por mes:", "aggregation_period": "month", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "gráfico de barras de montos facturados por Tipo Cliente": {{"is_chart_request": true, "chart_type": "bar", "x_axis": "Tipo Cliente", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "Tipo Cliente", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes un gráfico de barras de los montos facturados por Tipo Cliente:", "aggregation_period": "none", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "creame un grafico con la evolucion de ventas de 2025 separado por particular y seguro": {{"is_chart_request": true, "chart_type": "line", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "Fecha", "filter_value": "2025", "color_column": "Tipo Cliente", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes la evolución de ventas de 2025, separada por particular y seguro:", "aggregation_period": "month", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "ventas entre 2024-03-01 y 2024-06-30": {{"is_chart_request": true, "chart_type": "line", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "2024-03-01", "end_date": "2024-06-30", "additional_filters": [], "summary_response": "Aquí tienes la evolución de ventas entre marzo y junio de 2024:", "aggregation_period": "month", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "ventas de particular en el primer trimestre de 2025": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "2025", "color_column": "", "start_date": "2025-01-01", "end_date": "2025-03-31", "additional_filters": [{{"column": "Tipo Cliente", "value": "particular"}}], "summary_response": "Aquí tienes las ventas de clientes particulares en el primer trimestre de 2025:", "aggregation_period": "month", "table_columns": [], "calculation_type": "sales_for_period", "calculation_params": {{"year": 2025, "month": 1}}}}
+-   "analisis de mis ingresos": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "", "aggregation_period": "none", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "qué cliente vendía más": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "Basado en tus datos, el cliente que generó la mayor cantidad de ventas es [NOMBRE_CLIENTE_MAX_VENTAS] con un total de $[MONTO_MAX_VENTAS].", "aggregation_period": "none", "table_columns": [], "calculation_type": "max_client_sales", "calculation_params": {{}}}}
+-   "dame el total de ventas": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El monto total facturado en todos los datos es de $[TOTAL_MONTO_FACTURADO].", "aggregation_period": "none", "table_columns": [], "calculation_type": "total_sales", "calculation_params": {{}}}}
+-   "cuál fue el mes con menos ingresos": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El mes con menos ingresos fue [MES_MIN_INGRESOS] con un total de $[MONTO_MIN_INGRESOS].", "aggregation_period": "none", "table_columns": [], "calculation_type": "min_month_sales", "calculation_params": {{}}}}
+-   "hazme una estimacion de cual seria la venta para lo que queda de 2025": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "2025", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "Aquí tienes una estimación de las ventas para lo que queda de [TARGET_YEAR]: $[ESTIMACION_RESTO_YEAR]. Ten en cuenta que esta es una proyección basada en datos históricos y no una garantía financiera.", "aggregation_period": "none", "table_columns": [], "calculation_type": "project_remaining_year", "calculation_params": {{"target_year": 2025}}}}
+-   "muéstrame una tabla de los montos facturados por cliente": {{"is_chart_request": true, "chart_type": "table", "x_axis": "Cliente", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "Aquí tienes una tabla con los montos facturados por Cliente:", "aggregation_period": "none", "table_columns": ["Cliente", "Monto Facturado"], "calculation_type": "none", "calculation_params": {{}}}}
+-   "lista las ventas de cada tipo de cliente": {{"is_chart_request": true, "chart_type": "table", "x_axis": "Tipo Cliente", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "Aquí tienes una tabla con las ventas por Tipo Cliente:", "aggregation_period": "none", "table_columns": ["Tipo Cliente", "Monto Facturado"], "calculation_type": "none", "calculation_params": {{}}}}
+-   "ventas mensuales de 2023": {{"is_chart_request": true, "chart_type": "line", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "Fecha", "filter_value": "2023", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "Aquí tienes las ventas mensuales de 2023:", "aggregation_period": "month", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "ventas por año": {{"is_chart_request": true, "chart_type": "bar", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "Aquí tienes las ventas agrupadas por año:", "aggregation_period": "year", "table_columns": [], "calculation_type": "none", "calculation_params": {{}}}}
+-   "total facturado en 2024": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "2024", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El monto total facturado en [YEAR] fue de $[CALCULATED_TOTAL_YEAR].", "aggregation_period": "year", "table_columns": [], "calculation_type": "sales_for_period", "calculation_params": {{"year": 2024}}}}
+-   "ventas de enero 2025": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "Enero", "color_column": "", "start_date": "2025-01-01", "end_date": "2025-01-31", "additional_filters": [], "summary_response": "Las ventas de [MONTH] de [YEAR] fueron de $[CALCULATED_SALES_MONTH_YEAR].", "aggregation_period": "month", "table_columns": [], "calculation_type": "sales_for_period", "calculation_params": {{"year": 2025, "month": 1}}}}
+-   "cómo puedo mejorar las ventas de lo que queda del 2025": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "", "aggregation_period": "none", "table_columns": [], "calculation_type": "recommendations", "calculation_params": {{}}}}
+-   "me puedes hacer una estimacion de cual seria la venta para lo que queda de 2025 por mes, considerando estacionalidades": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "2025", "color_column": "", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes una estimación de las ventas mensuales para lo que queda de [TARGET_YEAR], considerando patrones históricos y estacionalidades: [ESTIMACION_MENSUAL_RESTO_YEAR]. Ten en cuenta que esta es una proyección basada en datos históricos y no una garantía financiera.", "aggregation_period": "month", "table_columns": [], "calculation_type": "project_remaining_year_monthly", "calculation_params": {{"target_year": 2025}}}}
+-   "proyección por sucursal para lo que queda de 2025": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "2025", "color_column": "", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes la proyección mensual por Sucursal para lo que queda de [TARGET_YEAR]: [ESTIMACION_MENSUAL_RESTO_YEAR]. Ten en cuenta que esta es una proyección basada en datos históricos y no una garantía financiera.", "aggregation_period": "month", "table_columns": [], "calculation_type": "project_remaining_year_monthly", "calculation_params": {{"target_year": 2025, "segment_column": "Sucursal"}}}}
+-   "gráfico de proyección de ventas por Tipo Cliente": {{"is_chart_request": true, "chart_type": "forecast", "x_axis": "Fecha", "y_axis": "Monto Facturado", "filter_column": "", "filter_value": "", "color_column": "Tipo Cliente", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "Aquí tienes la historia y la proyección de ventas por Tipo Cliente:", "aggregation_period": "month", "table_columns": [], "calculation_type": "none", "calculation_params": {{"forecast_months": 12}}}}
+-   "cuanta facturacion esta en estado de pago vencido": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Estado Pago", "filter_value": "Vencido", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El monto total facturado con estado de pago vencido es de $[TOTAL_MONTO_VENCIDO].", "aggregation_period": "none", "table_columns": [], "calculation_type": "total_overdue_payments", "calculation_params": {{}}}}
+-   "puedes darme insights de mejora para los proximos meses": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "", "aggregation_period": "none", "table_columns": [], "calculation_type": "recommendations", "calculation_params": {{}}}}
+-   "cual es la variacion porcentual en cuanto a costos financieros entre año 2023 y 2024": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "La variación porcentual en los costos financieros entre [YEAR1] y [YEAR2] fue del [PERCENTAGE_VARIATION:.2f]%.", "aggregation_period": "none", "table_columns": [], "calculation_type": "percentage_variation", "calculation_params": {{"column_to_analyze": "Costos Financieros", "year1": 2023, "year2": 2024}}}}
+-   "cual fue el promedio de Monto Facturado por Sucursal": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El promedio de Monto Facturado por Sucursal es: [AVERAGE_BY_SUCURSAL].", "aggregation_period": "none", "table_columns": [], "calculation_type": "average_by_column", "calculation_params": {{"column_to_average": "Monto Facturado", "group_by_column": "Sucursal"}}}}
+-   "cual es el total de Materiales y Pintura para el año 2024": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "Fecha", "filter_value": "2024", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El total de Materiales y Pintura para el año [YEAR] fue de $[TOTAL_MATERIALS_PAINT].", "aggregation_period": "year", "table_columns": [], "calculation_type": "total_for_column_by_year", "calculation_params": {{"column_to_sum": "Materiales y Pintura", "year": 2024}}}}
+-   "que porcentaje de venta corresponde a particular": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El porcentaje de venta que corresponde a clientes de tipo [CATEGORY_VALUE] es del [PERCENTAGE_SALES_CATEGORY:.2f]%.", "aggregation_period": "none", "table_columns": [], "calculation_type": "percentage_of_total_sales_by_category", "calculation_params": {{"category_column": "Tipo Cliente", "category_value": "Particular"}}}}
+-   "dame el porcentaje de ventas de pesado": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": [], "additional_filters": [], "summary_response": "El porcentaje de ventas de vehículos [CATEGORY_VALUE] es del [PERCENTAGE_SALES_CATEGORY:.2f]%.", "aggregation_period": "none", "table_columns": [], "calculation_type": "percentage_of_total_sales_by_category", "calculation_params": {{"category_column": "Tipo Vehículo", "category_value": "Pesado"}}}}
+-   "dame el total de ventas, el promedio por Sucursal y la variación de ventas entre 2023 y 2024": {{"is_chart_request": false, "chart_type": "none", "x_axis": "", "y_axis": "", "filter_column": "", "filter_value": "", "color_column": "", "start_date": "", "end_date": "", "additional_filters": [], "summary_response": "El total de ventas es $[TOTAL_MONTO_FACTURADO]. El promedio de Monto Facturado por Sucursal es: [AVERAGE_BY_SUCURSAL]. La variación entre [YEAR1] y [YEAR2] es del [PERCENTAGE_VARIATION:.2f]%.", "aggregation_period": "none", "table_columns": [], "calculation_type": "total_sales", "calculation_params": {{}}, "additional_calculations": [{{"calculation_type": "average_by_column", "calculation_params": {{"column_to_average": "Monto Facturado", "group_by_column": "Sucursal"}}}}, {{"calculation_type": "percentage_variation", "calculation_params": {{"column_to_analyze": "Monto Facturado", "year1": 2023, "year2": 2024}}}}]}}
+
+**Pregunta del usuario:** "{pregunta}"
+"""
+
+ANALYSIS_PROMPT = """Eres un asesor financiero estratégico e impecable. Tu misión es proporcionar análisis de alto nivel, identificar tendencias, oportunidades y desafíos, y ofrecer recomendaciones estratégicas y accionables basadas en los datos disponibles.
+
+**Resumen completo del DataFrame (para tu análisis):**
+{df_summary_str}
+
+**Columnas de datos disponibles y sus tipos (usa estos nombres EXACTOS):**
+{available_columns_str}
+
+Basándote **exclusivamente** en la información proporcionada en el resumen del DataFrame y en tu rol de analista financiero, por favor, responde a la siguiente pregunta del usuario.
+
+Al formular tu respuesta, considera lo siguiente:
+1.  **Análisis de Tendencias:** Identifica patrones de crecimiento, estancamiento o declive en los Montos Facturados.
+2.  **Identificación de Oportunidades/Desafíos:** Basado en los datos (ej. Tipo Cliente con menos ventas, meses de bajo rendimiento, canales de venta, estado de pago), señala áreas de mejora o de potencial crecimiento.
+3.  **Recomendaciones Estratégicas y Accionables:** Ofrece consejos prácticos y concretos que el usuario pueda implementar. Estas recomendaciones deben ser generales pero relevantes al contexto financiero y a la estructura de los datos. Sé proactivo en ofrecer ideas si la pregunta es general como "dame insights de mejora".
+4.  **Tono:** Mantén un tono profesional, claro, conciso y empático.
+5.  **Idioma:** Responde siempre en español.
+6.  **Estructura:** Organiza tu respuesta con encabezados claros como "Análisis General", "Oportunidades Clave" y "Recomendaciones Estratégicas".
+
+---
+Pregunta del usuario:
+{pregunta}
+"""
+
+CALCULATION_TYPE_SCHEMA = {
+    "type": "STRING",
+    "enum": ["none", "total_sales", "max_client_sales", "min_month_sales", "sales_for_period", "project_remaining_year", "project_remaining_year_monthly", "total_overdue_payments", "percentage_variation", "average_by_column", "total_for_column_by_year", "percentage_of_total_sales_by_category", "recommendations"],
+    "description": "Tipo de cálculo que Python debe realizar para la respuesta textual."
+}
+
+CALCULATION_PARAMS_SCHEMA = {
+    "type": "OBJECT",
+    "description": "Parámetros adicionales necesarios para el cálculo (ej: {'year': 2025, 'month': 1}).",
+    "properties": {
+        "year": {"type": "INTEGER", "description": "Año para el cálculo."},
+        "month": {"type": "INTEGER", "description": "Mes para el cálculo."},
+        "target_year": {"type": "INTEGER", "description": "Año objetivo para proyecciones."},
+        "forecast_months": {"type": "INTEGER", "description": "Número de meses a pronosticar."},
+        "segment_column": {"type": "STRING", "description": "Columna para proyectar por segmento (ej: 'Sucursal')."},
+        "column_to_analyze": {"type": "STRING", "description": "Columna para el análisis de variación."},
+        "year1": {"type": "INTEGER", "description": "Primer año para la variación."},
+        "year2": {"type": "INTEGER", "description": "Segundo año para la variación."},
+        "column_to_average": {"type": "STRING", "description": "Columna para calcular el promedio."},
+        "group_by_column": {"type": "STRING", "description": "Columna para agrupar el promedio."},
+        "column_to_sum": {"type": "STRING", "description": "Columna para sumar."},
+        "category_column": {"type": "STRING", "description": "Columna de categoría para porcentaje de ventas."},
+        "category_value": {"type": "STRING", "description": "Valor de la categoría para porcentaje de ventas."}
+    }
+}
+
+INTENT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "is_chart_request": {
+            "type": "BOOLEAN",
+            "description": "True si el usuario pide un gráfico o tabla, false en caso contrario."
+        },
+        "chart_type": {
+            "type": "STRING",
+            "enum": ["line", "bar", "pie", "scatter", "table", "forecast", "none"],
+            "description": "Tipo de visualización (line, bar, pie, scatter, table, forecast). 'none' if not a visualization or unclear type."
+        },
+        "x_axis": {
+            "type": "STRING",
+            "description": "Nombre de la columna para el eje X (ej: 'Fecha'). Vacío si no es gráfico."
+        },
+        "y_axis": {
+            "type": "STRING",
+            "description": "Nombre de la columna para el eje Y (ej: 'Monto Facturado'). Vacío si no es gráfico."
+        },
+        "color_column": {
+            "type": "STRING",
+            "description": "Nombre de la columna para colorear/agrupar (ej: 'Tipo Cliente'). Vacío si no se pide segmentación o la columna no existe."
+        },
+        "filter_column": {
+            "type": "STRING",
+            "description": "Columna para filtro principal (ej: 'Fecha' para año). Vacío si no hay filtro principal."
+        },
+        "filter_value": {
+            "type": "STRING",
+            "description": "Valor para filtro principal (ej: '2025', 'Enero'). Vacío si no hay filtro principal."
+        },
+        "start_date": {
+            "type": "STRING",
+            "description": "Fecha de inicio del rango (YYYY-MM-DD). Vacío si no hay rango."
+        },
+        "end_date": {
+            "type": "STRING",
+            "description": "Fecha de fin del rango (YYYY-MM-DD). Vacío si no hay rango."
+        },
+        "additional_filters": {
+            "type": "ARRAY",
+            "description": "Lista de filtros adicionales por columna.",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "column": {"type": "STRING"},
+                    "value": {"type": "STRING"}
+                }
+            }
+        },
+        "summary_response": {
+            "type": "STRING",
+            "description": "Respuesta conversacional si se genera un gráfico o tabla. Vacío si no es gráfico/tabla."
+        },
+        "aggregation_period": {
+            "type": "STRING",
+            "enum": ["day", "month", "year", "none"],
+            "description": "Período de agregación para datos de tiempo (day, month, year) o 'none' if not applicable."
+        },
+        "table_columns": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"},
+            "description": "Lista de nombres de columnas a mostrar en una tabla. Solo aplica si chart_type es 'table'."
+        },
+        "calculation_type": CALCULATION_TYPE_SCHEMA,
+        "calculation_params": CALCULATION_PARAMS_SCHEMA,
+        "additional_calculations": {
+            "type": "ARRAY",
+            "description": "Cálculos adicionales cuando la pregunta pide varios números a la vez.",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "calculation_type": CALCULATION_TYPE_SCHEMA,
+                    "calculation_params": CALCULATION_PARAMS_SCHEMA
+                }
+            }
+        }
+    },
+    "required": ["is_chart_request", "chart_type", "x_axis", "y_axis", "color_column",
+                 "filter_column", "filter_value", "start_date", "end_date",
+                 "additional_filters", "summary_response", "aggregation_period",
+                 "table_columns", "calculation_type", "calculation_params"]
+}
+
+
+def estimate_tokens(text):
+    """Tokens aproximados de un texto (sin llamar al tokenizador de Gemini)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _mentions(text, phrase):
+    return bool(phrase) and re.search(rf"\b{re.escape(phrase)}\b", text) is not None
+
+
+class PromptSizeStats:
+    """Tamaño de los prompts enviados a Gemini en este proceso."""
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.by_kind = {}
+
+    def record(self, stats):
+        self.calls += 1
+        self.tokens += stats["tokens"]
+        self.by_kind[stats["kind"]] = self.by_kind.get(stats["kind"], 0) + 1
+
+    @property
+    def average_tokens(self):
+        return self.tokens / self.calls if self.calls else 0.0
+
+
+STATS = PromptSizeStats()
+
+
+class PromptBuilder:
+    """Arma los prompts de Gemini respetando un presupuesto de tokens.
+
+    Ordena las columnas por relevancia para la pregunta (mencionadas, núcleo,
+    numéricas, categorías chicas, texto libre) y, mientras el prompt exceda el
+    presupuesto, baja el detalle de las menos relevantes: valores completos,
+    luego resumidos, luego solo nombre y tipo y, por último, las omite.
+    """
+
+    def __init__(self, profile, budget_tokens=DEFAULT_TOKEN_BUDGET, stats=STATS):
+        self.profile = profile
+        self.budget_tokens = budget_tokens
+        self.stats = stats
+
+    def intent_payload(self, question):
+        """(payload de la llamada de intención, estadísticas del prompt)."""
+        text, stats = self.build("intent", INTENT_PROMPT, question)
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+            "generationConfig": {
+                "responseMimeType": "application/json",
+                "responseSchema": INTENT_RESPONSE_SCHEMA
+            }
+        }
+        return payload, stats
+
+    def analysis_payload(self, question):
+        """(payload de la llamada de análisis, estadísticas del prompt)."""
+        text, stats = self.build("analysis", ANALYSIS_PROMPT, question)
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+            "generationConfig": {"temperature": 0.5}
+        }
+        return payload, stats
+
+    def build(self, kind, template, question):
+        start = time.perf_counter()
+        fixed_text = template.format(available_columns_str="", df_summary_str="", pregunta=question)
+        # El encabezado del resumen (filas, columnas) se incluye siempre
+        budget_chars = self.budget_tokens * CHARS_PER_TOKEN - len(fixed_text) - len(self.profile.render_summary({}))
+        details = self.column_details(question, budget_chars)
+
+        text = template.format(available_columns_str=self.profile.render_available_columns(details),
+                               df_summary_str=self.profile.render_summary(details),
+                               pregunta=question)
+        stats = {
+            "kind": kind,
+            "tokens": estimate_tokens(text),
+            "chars": len(text),
+            "budget_tokens": self.budget_tokens,
+            "over_budget": estimate_tokens(text) > self.budget_tokens,
+            "fixed_tokens": estimate_tokens(fixed_text),
+            "columns": {name: _DETAIL_LABELS[level] for name, level in details.items()},
+            "dropped_columns": [col.name for col in self.profile.columns if col.name not in details],
+            "build_ms": (time.perf_counter() - start) * 1000,
+        }
+        if self.stats is not None:
+            self.stats.record(stats)
+        return text, stats
+
+    # --- Selección del detalle por columna ---
+    def mentioned_columns(self, question):
+        """Columnas cuyo nombre o alguno de sus valores aparece en la pregunta."""
+        text = normalize_text(question)
+        mentioned = set()
+        for col in self.profile.columns:
+            if _mentions(text, normalize_text(col.name)):
+                mentioned.add(col.name)
+            elif col.kind == "text" and len(col.value_counts) <= MAX_MATCHED_VALUES and \
+                    any(_mentions(text, normalize_text(str(value))) for value in col.value_counts):
+                mentioned.add(col.name)
+        return mentioned
+
+    def _rank(self, col, mentioned):
+        if col.name in mentioned:
+            return 0
+        if col.name in CORE_COLUMNS:
+            return 1
+        if col.kind != "text":
+            return 2
+        if len(col.value_counts) < MAX_LISTED_VALUES:
+            return 3
+        return 4
+
+    def column_details(self, question, budget_chars):
+        """{columna: nivel DETAIL_*} que cabe en `budget_chars`; las columnas omitidas no aparecen."""
+        mentioned = self.mentioned_columns(question)
+        ranked = sorted(self.profile.columns,
+                        key=lambda col: (self._rank(col, mentioned), len(col.value_counts)))
+        protected = {col.name for col in ranked if self._rank(col, mentioned) <= 1}
+
+        details = {}
+        for col in ranked:
+            # Identificadores (todos los valores distintos): sus frecuencias no aportan nada
+            unique = col.kind == "text" and col.value_counts and max(col.value_counts.values()) <= 1
+            details[col.name] = DETAIL_NAME if unique and col.name not in mentioned else DETAIL_FULL
+
+        def cost(name, level):
+            # Caracteres que aporta la columna en ambas secciones (+1 por cada salto de línea)
+            return sum(len(line) + 1 for line in self.profile.column_lines(name)[level] if line)
+
+        # Orden de recorte: resumir todo, luego dejar solo el nombre y omitir las columnas
+        # no protegidas (de la menos a la más relevante) y al final dejar solo el nombre de las protegidas
+        least_relevant = [col.name for col in reversed(ranked)]
+        steps = [(name, DETAIL_COMPACT) for name in least_relevant]
+        steps += [(name, DETAIL_NAME) for name in least_relevant if name not in protected]
+        steps += [(name, None) for name in least_relevant if name not in protected]
+        steps += [(name, DETAIL_NAME) for name in least_relevant if name in protected]
+
+        used = sum(cost(name, level) for name, level in details.items())
+        for name, target in steps:
+            if used <= budget_chars:
+                break
+            level = details.get(name)
+            if level is None:
+                continue
+            if target is None:
+                used -= cost(name, level)
+                del details[name]
+            elif level > target:
+                used += cost(name, target) - cost(name, level)
+                details[name] = target
+        return details
+
+
+def describe_prompt(stats):
+    """Resumen de una línea del tamaño de un prompt, para mostrar en la interfaz."""
+    text = f"Prompt de {'intención' if stats['kind'] == 'intent' else 'análisis'}: ~{stats['tokens']:,} tokens " \
+           f"(presupuesto {stats['budget_tokens']:,}, {stats['chars']:,} caracteres)"
+    if stats["dropped_columns"]:
+        text += f"; columnas omitidas: {', '.join(stats['dropped_columns'])}"
+    if stats["over_budget"]:
+        text += ". ⚠️ Excede el presupuesto aun con el detalle mínimo"
+    return text
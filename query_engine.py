@@ -0,0 +1,562 @@
+import functools
+import json
+import threading
+
+import pandas as pd
+import requests
+
+from chart_render import DEFAULT_MAX_POINTS, downsample
+from cube import AggregateCube
+from filter_engine import DatasetIndex, FilterPlan
+from forecasting import FORECAST_DIMENSIONS, forecast_frame
+from gemini_client import DEFAULT_MODEL, GeminiAPIError, GeminiBusyError
+from intent_parser import IntentParser
+from metrics import MetricExecutor, needs_analysis
+from prompt_builder import DEFAULT_TOKEN_BUDGET, PromptBuilder, describe_prompt
+from result_table import ResultTable
+from telemetry import QueryTrace
+
+# Lo que se construye una vez por versión de datos (huella) y vive en el DatasetStore junto con ella:
+# cubo de agregados, índices para filtrar (orden por Fecha, códigos de valores) y vista paginada de los datos completos
+VERSION_BUILDS = {"cubo": AggregateCube.build, "índice": DatasetIndex.build, "vista previa": ResultTable}
+ANSWER_PREFIX = "🤖 Respuesta de la IA:\n\n"
+# Filas de cada tabla que se incluyen al serializar un resultado (to_dict)
+DEFAULT_MAX_ROWS = 500
+
+
+class QueryAborted(Exception):
+    """La consulta terminó después de informar un error (lo que en la app era un st.stop())."""
+
+
+class DataVersion:
+    """Versión de datos fija para una consulta: huella, DataFrame compartido y perfil."""
+
+    def __init__(self, fingerprint, df, profile):
+        self.fingerprint = fingerprint
+        self.df = df
+        self.profile = profile
+
+
+class ChartSpec:
+    """Gráfico listo para dibujar: datos (ya reducidos) y parámetros de Plotly Express."""
+
+    def __init__(self, chart_type, df, title, x=None, y=None, color=None, labels=None, line_dash=None,
+                 render_mode=None, sample=None):
+        self.chart_type = chart_type  # "line", "bar", "pie", "scatter" o "forecast"
+        self.df = df
+        self.title = title
+        self.x = x
+        self.y = y
+        self.color = color
+        self.labels = labels or {}
+        self.line_dash = line_dash
+        self.render_mode = render_mode
+        self.sample = sample  # ChartSample si los datos se redujeron para el navegador
+
+    def figure(self):
+        """Figura de Plotly (import local: el motor no necesita plotly para responder)."""
+        import plotly.express as px
+
+        if self.chart_type == "pie":
+            return px.pie(self.df, names=self.x, values=self.y, title=self.title)
+        if self.chart_type == "bar":
+            return px.bar(self.df, x=self.x, y=self.y, color=self.color, title=self.title, labels=self.labels)
+        if self.chart_type == "scatter":
+            return px.scatter(self.df, x=self.x, y=self.y, color=self.color, title=self.title, labels=self.labels,
+                              render_mode=self.render_mode)
+        kwargs = {"render_mode": self.render_mode} if self.render_mode else {}
+        return px.line(self.df, x=self.x, y=self.y, color=self.color, line_dash=self.line_dash, title=self.title,
+                       labels=self.labels, **kwargs)
+
+    def to_dict(self, max_rows=None):
+        spec = {"chart_type": self.chart_type, "title": self.title, "x": self.x, "y": self.y, "color": self.color,
+                "line_dash": self.line_dash, "labels": self.labels, "render_mode": self.render_mode}
+        spec.update(frame_to_dict(self.df, max_rows))
+        if self.sample is not None:
+            spec["original_points"] = self.sample.original_points
+            spec["note"] = self.sample.note()
+        return spec
+
+
+def frame_to_dict(df, max_rows=None):
+    """Columnas y filas de un DataFrame en tipos JSON (fechas ISO, NaN como null)."""
+    rows = df if max_rows is None else df.head(max_rows)
+    records = json.loads(rows.to_json(orient="split", index=False, date_format="iso", force_ascii=False))
+    return {"columns": records["columns"], "rows": records["data"], "total_rows": len(df),
+            "truncated": len(rows) < len(df)}
+
+
+class QueryResult:
+    """Bloques de una respuesta, en el orden en que se muestran.
+
+    Cada bloque es (tipo, valor): "success", "info", "warning", "error",
+    "caption", "subheader" y "text" llevan texto; "table" un DataFrame;
+    "chart" un ChartSpec y "exception" la excepción. `on_block` recibe cada
+    bloque apenas se agrega (la app los dibuja a medida que llegan) y
+    `on_partial` el texto acumulado de una respuesta en streaming (None
+    mientras se espera el primer fragmento).
+    """
+
+    def __init__(self, question, on_block=None, on_partial=None):
+        self.question = question
+        self.blocks = []
+        self.data_fingerprint = None
+        self.raw_response = None  # última respuesta de Gemini, para mostrarla si no se pudo interpretar
+        self.on_block = on_block
+        self.on_partial = on_partial
+
+    def add(self, kind, value):
+        self.blocks.append((kind, value))
+        if self.on_block is not None:
+            self.on_block(kind, value)
+
+    def stop(self, message, detail=None):
+        self.add("error", message)
+        if detail is not None:
+            self.add("text", detail)
+        raise QueryAborted(message)
+
+    @property
+    def kind(self):
+        """"error", "chart", "table" o "text", según el bloque principal de la respuesta."""
+        kinds = [kind for kind, _ in self.blocks]
+        for kind in ("chart", "table"):
+            if kind in kinds:
+                return kind
+        if ("error" in kinds or "exception" in kinds) and "success" not in kinds:
+            return "error"
+        return "text"
+
+    @property
+    def answer(self):
+        """Texto principal (p. ej. para un bot de chat): el último mensaje "success", sin prefijo."""
+        for kind, value in reversed(self.blocks):
+            if kind == "success":
+                return value[len(ANSWER_PREFIX):] if value.startswith(ANSWER_PREFIX) else value
+        return None
+
+    def to_dict(self, max_rows=DEFAULT_MAX_ROWS, trace=None):
+        blocks = []
+        for kind, value in self.blocks:
+            if kind == "table":
+                blocks.append({"type": "table", **frame_to_dict(value, max_rows)})
+            elif kind == "chart":
+                blocks.append({"type": "chart", **value.to_dict(max_rows=None)})
+            elif kind == "exception":
+                blocks.append({"type": "exception", "text": f"{type(value).__name__}: {value}"})
+            else:
+                blocks.append({"type": kind, "text": value})
+        result = {"question": self.question, "kind": self.kind, "answer": self.answer,
+                  "data_version": self.data_fingerprint, "blocks": blocks}
+        if trace is not None:
+            result["trace"] = trace.record()
+        return result
+
+
+class QueryEngine:
+    """Responde preguntas sobre los datos sin depender de Streamlit.
+
+    Recibe los objetos compartidos que ya usa la app (caché de la hoja,
+    almacén de versiones, perfiles, caché de respuestas, cliente de Gemini y
+    motor de proyecciones); cada `ask` usa una versión de datos fija aunque
+    otra se active mientras tanto. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, sheet_cache, dataset_store, profile_store, response_cache, gemini_client, forecast_engine,
+                 api_key=None, model=DEFAULT_MODEL, local_intent_parser=True, streaming=True,
+                 token_budget=DEFAULT_TOKEN_BUDGET, chart_max_points=DEFAULT_MAX_POINTS, trace_log=None):
+        self.sheet_cache = sheet_cache
+        self.dataset_store = dataset_store
+        self.profile_store = profile_store
+        self.response_cache = response_cache
+        self.gemini_client = gemini_client
+        self.forecast_engine = forecast_engine
+        self.api_key = api_key
+        self.model = model
+        self.local_intent_parser = local_intent_parser
+        self.streaming = streaming
+        self.token_budget = token_budget
+        self.chart_max_points = chart_max_points
+        self.trace_log = trace_log
+
+    # --- Datos ---
+    def prepare_version(self, fingerprint, df, append_of=None):
+        """Publica una versión y construye sus cachés (lo usa el hilo de actualización antes de activarla)."""
+        self.dataset_store.publish(fingerprint, df)
+        self.profile_store.get(fingerprint, df, append_of=append_of)
+        for name in VERSION_BUILDS:
+            self.derived(fingerprint, name)
+
+    def derived(self, fingerprint, name):
+        build = VERSION_BUILDS[name]
+        if name == "vista previa":
+            # La vista previa filtra con el índice de la versión en vez de ordenar las fechas otra vez
+            build = functools.partial(ResultTable, index=self.derived(fingerprint, "índice"))
+        return self.dataset_store.derived(fingerprint, name, build)
+
+    def load(self, force_refresh=False, trace=None):
+        """Versión de datos activa (DataVersion); puede lanzar los errores de carga de data_loader."""
+        trace = trace or QueryTrace()
+        downloads_before = self.sheet_cache.downloads
+        with trace.span("datos"):
+            self.sheet_cache.get(force_refresh=force_refresh)
+            # Versión fija para toda la consulta, aunque el hilo de actualización active otra mientras tanto
+            df, fingerprint = self.sheet_cache.current()
+            df = self.dataset_store.publish(fingerprint, df)
+        trace.cache_hits["datos"] = self.sheet_cache.background or self.sheet_cache.downloads == downloads_before
+        if not trace.cache_hits["datos"]:
+            for stage, seconds in self.sheet_cache.last_timings.items():
+                trace.add(stage, seconds)
+        with trace.span("perfil"):
+            profile = self.profile_store.get(fingerprint, df, append_of=self.sheet_cache.append_of)
+        return DataVersion(fingerprint, df, profile)
+
+    # --- Consultas ---
+    def ask(self, question, data=None, trace=None, session_id=None, cancel_event=None, on_block=None, on_partial=None,
+            chart_data=None):
+        """Responde `question` y devuelve un QueryResult (los errores esperables van como bloques).
+
+        Con `chart_data` (de `intent`) no se vuelve a resolver la intención.
+        """
+        trace = trace or QueryTrace(question)
+        trace.set_question(question)
+        result = QueryResult(question, on_block, on_partial)
+        cancel_event = cancel_event or threading.Event()
+        try:
+            data = data or self.load(trace=trace)
+            result.data_fingerprint = data.fingerprint
+            if chart_data is None:
+                chart_data = self._intent(question, data, trace, result)
+            if chart_data.get("is_chart_request"):
+                self._chart(chart_data, data, trace, result, session_id)
+            else:
+                self._calculation(question, chart_data, data, trace, result, cancel_event)
+        except QueryAborted:
+            pass
+        except Exception as e:
+            self._report_error(e, result)
+        finally:
+            # También se registran las consultas que terminan con error
+            if self.trace_log is not None:
+                self.trace_log.append(trace)
+        return result
+
+    def intent(self, question, data, trace=None):
+        """(JSON de intención o None, QueryResult con lo informado al resolverla) sin responder la pregunta."""
+        trace = trace or QueryTrace(question)
+        result = QueryResult(question)
+        result.data_fingerprint = data.fingerprint
+        try:
+            return self._intent(question, data, trace, result), result
+        except QueryAborted:
+            pass
+        except Exception as e:
+            self._report_error(e, result)
+        return None, result
+
+    def _report_error(self, e, result):
+        if isinstance(e, requests.exceptions.Timeout):
+            result.add("error", "❌ La solicitud a la API de la IA ha excedido el tiempo de espera (timeout). Esto puede ser un problema de red o que el servidor de la IA esté tardando en responder.")
+        elif isinstance(e, requests.exceptions.ConnectionError):
+            result.add("error", "❌ Error de conexión a la API de la IA. Verifica tu conexión a internet o si la URL de la API es correcta.")
+        elif isinstance(e, GeminiBusyError):
+            result.add("error", f"❌ {e}")
+        elif isinstance(e, json.JSONDecodeError):
+            result.add("error", "❌ Error al procesar la respuesta JSON del modelo. Intente de nuevo o reformule la pregunta.")
+            result.add("text", result.raw_response.text if result.raw_response is not None else "No se pudo obtener una respuesta.")
+        else:
+            result.add("error", "❌ Falló la conexión con la API de la IA o hubo un error inesperado.")
+            result.add("exception", e)
+
+    def _require_api_key(self, result):
+        if not self.api_key:
+            result.stop("❌ GOOGLE_GEMINI_API_KEY no está configurada; esta pregunta necesita la API de Gemini.")
+        return self.api_key
+
+    def _intent(self, question, data, trace, result):
+        """JSON de intención: parser local, caché de respuestas o Gemini, en ese orden."""
+        # Preguntas formulaicas: el parser local produce el mismo JSON sin llamar a Gemini
+        with trace.span("parser local"):
+            chart_data = IntentParser.from_profile(data.profile).parse(question) if self.local_intent_parser else None
+        trace.cache_hits["parser local"] = chart_data is not None
+        # Respuesta en caché para la misma pregunta sobre la misma versión de datos
+        if chart_data is None:
+            with trace.span("caché intención"):
+                chart_data = self.response_cache.get("intent", question, data.fingerprint, self.model)
+            trace.cache_hits["intención"] = chart_data is not None
+        if chart_data is not None:
+            return chart_data
+
+        api_key = self._require_api_key(result)
+        # Los prompts se arman dentro del presupuesto de tokens (ver prompt_builder.py)
+        with trace.span("prompt intención"):
+            chart_detection_payload, prompt_stats = PromptBuilder(data.profile, self.token_budget).intent_payload(question)
+        trace.prompt_tokens += prompt_stats["tokens"]
+        result.add("caption", describe_prompt(prompt_stats))
+        with trace.span("gemini intención"):
+            chart_response = self.gemini_client.generate_content(chart_detection_payload, api_key)
+        result.raw_response = chart_response
+        if chart_response.status_code != 200:
+            result.stop(f"❌ Error al consultar la API de la IA para detección de visualización: {chart_response.status_code}",
+                        chart_response.text)
+        chart_response_json = chart_response.json()
+        if not (chart_response_json and "candidates" in chart_response_json and
+                len(chart_response_json["candidates"]) > 0 and
+                "content" in chart_response_json["candidates"][0] and
+                "parts" in chart_response_json["candidates"][0]["content"] and
+                len(chart_response_json["candidates"][0]["content"]["parts"]) > 0):
+            result.stop("❌ La respuesta del modelo no contiene la estructura esperada para la detección de visualización.",
+                        f"Respuesta completa: {chart_response.text}")
+        chart_data_raw = chart_response_json["candidates"][0]["content"]["parts"][0]["text"]
+        try:
+            chart_data = json.loads(chart_data_raw)
+        except json.JSONDecodeError as e:
+            result.stop(f"❌ Error al procesar la respuesta JSON del modelo. El modelo devolvió JSON inválido: {e}",
+                        f"Respuesta cruda del modelo: {chart_data_raw}")
+        self.response_cache.put("intent", question, data.fingerprint, self.model, chart_data)
+        return chart_data
+
+    def _chart(self, chart_data, data, trace, result, session_id=None):
+        """Gráficos y tablas: filtros, agregación y ChartSpec."""
+        result.add("success", chart_data.get("summary_response", "Aquí tienes la visualización solicitada:"))
+
+        # --- Filtros (año/mes, rango de fechas y adicionales) en una sola pasada ---
+        filter_plan = FilterPlan.from_chart_data(chart_data, data.df.columns)
+        for warning in filter_plan.warnings:
+            result.add("warning", warning)
+        with trace.span("filtrado"):
+            filtered_df = filter_plan.apply(self.derived(data.fingerprint, "índice"))
+        trace.rows_scanned += len(filtered_df)
+        if session_id is not None:
+            self.dataset_store.track(session_id, "filtrado", filtered_df)
+
+        # Asegurarse de que haya datos después de filtrar
+        if filtered_df.empty:
+            result.add("warning", "No hay datos para generar la visualización con los filtros especificados.")
+            return
+
+        chart_type = chart_data["chart_type"]
+        x_col = chart_data.get("x_axis")
+        y_col = chart_data.get("y_axis")
+        color_col = chart_data.get("color_column") or None  # una cadena vacía equivale a sin segmentación
+        aggregation_period = chart_data.get("aggregation_period", "none")
+        table_columns = chart_data.get("table_columns", [])
+
+        # Validar que las columnas existan en el DataFrame antes de usarlas
+        if chart_type != "table":
+            if x_col and x_col not in filtered_df.columns:
+                result.stop(f"La columna '{x_col}' para el eje X no se encontró en los datos. Por favor, revisa el nombre de la columna en tu hoja de cálculo.")
+            if y_col and y_col not in filtered_df.columns:
+                result.stop(f"La columna '{y_col}' para el eje Y no se encontró en los datos. Por favor, revisa el nombre de la columna en tu hoja de cálculo.")
+
+        # Si color_col no es None y no está en las columnas, advertir y establecer a None
+        if color_col is not None and color_col not in filtered_df.columns:
+            result.add("warning", f"La columna '{color_col}' para segmentación no se encontró en los datos. El gráfico no se segmentará. Por favor, revisa el nombre de la columna en tu hoja de cálculo.")
+            color_col = None
+
+        # --- Lógica de Agregación y Visualización ---
+        trace.begin("agregación y gráfico")
+        chart = None
+        if chart_type in ["line", "bar"]:
+            chart = self._line_or_bar(chart_type, filtered_df, x_col, y_col, color_col, aggregation_period, result)
+
+        elif chart_type == "pie":
+            if x_col and y_col and x_col in filtered_df.columns and y_col in filtered_df.columns:
+                if pd.api.types.is_numeric_dtype(filtered_df[y_col]):
+                    grouped_pie_df = filtered_df.groupby(x_col, observed=True)[y_col].sum().reset_index()
+                    chart = ChartSpec("pie", grouped_pie_df, f"Proporción de {y_col} por {x_col}", x=x_col, y=y_col)
+                else:
+                    result.add("warning", f"La columna '{y_col}' no es numérica para el gráfico de pastel. Mostrando el DataFrame filtrado.")
+                    result.add("table", filtered_df)
+            else:
+                result.add("warning", "Columnas necesarias para el gráfico de pastel no encontradas. Mostrando el DataFrame filtrado.")
+                result.add("table", filtered_df)
+
+        elif chart_type == "scatter":
+            if x_col and y_col and x_col in filtered_df.columns and y_col in filtered_df.columns:
+                chart_sample = downsample(filtered_df, x_col, y_col, color_col, kind="scatter",
+                                          max_points=self.chart_max_points)
+                chart = ChartSpec("scatter", chart_sample.df, f"Relación entre {x_col} y {y_col}", x=x_col, y=y_col,
+                                  color=color_col, labels={x_col: x_col, y_col: y_col},
+                                  render_mode=chart_sample.render_mode, sample=chart_sample)
+            else:
+                result.add("warning", "Columnas necesarias para el gráfico de dispersión no encontradas. Mostrando el DataFrame filtrado.")
+                result.add("table", filtered_df)
+
+        elif chart_type == "forecast":
+            # Historia mensual y proyección del total o de cada segmento (modelos cacheados por versión)
+            forecast_column = color_col if color_col in FORECAST_DIMENSIONS else None
+            if color_col and forecast_column is None:
+                result.add("warning", f"La proyección por '{color_col}' no está disponible; se muestra la proyección del total.")
+            forecast_months = (chart_data.get("calculation_params") or {}).get("forecast_months") or 12
+            forecasts = self.forecast_engine.for_version(data.fingerprint, data.df)
+            forecast_df = forecast_frame(forecasts, forecast_column, horizon=int(forecast_months))
+            if not forecast_df.empty:
+                chart = ChartSpec("forecast", forecast_df,
+                                  f"Proyección de Monto Facturado a {forecast_months} meses" + (f" por {forecast_column}" if forecast_column else ""),
+                                  x="Fecha", y="Monto Facturado", color="Serie", line_dash="Tipo")
+
+        elif chart_type == "table":
+            self._table(chart_data, filtered_df, x_col, y_col, color_col, table_columns, result)
+
+        trace.end("agregación y gráfico")
+        if chart is not None:
+            result.add("chart", chart)
+            if chart.sample is not None:
+                trace.attributes["chart_points"] = [chart.sample.points, chart.sample.original_points]
+                if chart.sample.downsampled:
+                    result.add("caption", chart.sample.note())
+        elif chart_type != "table":
+            result.add("warning", "No se pudo generar la visualización solicitada o los datos no son adecuados.")
+
+    def _line_or_bar(self, chart_type, filtered_df, x_col, y_col, color_col, aggregation_period, result):
+        group_cols = []
+        x_col_for_plot = x_col
+
+        if x_col == "Fecha" and aggregation_period != "none":
+            if aggregation_period == "month":
+                filtered_df['Fecha_Agrupada'] = filtered_df['Fecha'].dt.to_period('M').dt.to_timestamp()
+            elif aggregation_period == "year":
+                filtered_df['Fecha_Agrupada'] = filtered_df['Fecha'].dt.to_period('Y').dt.to_timestamp()
+            elif aggregation_period == "day":
+                filtered_df['Fecha_Agrupada'] = filtered_df['Fecha'].dt.normalize()
+
+            group_cols.append('Fecha_Agrupada')
+            x_col_for_plot = 'Fecha_Agrupada'
+        elif x_col:
+            group_cols.append(x_col)
+
+        if color_col:
+            group_cols.append(color_col)
+
+        if y_col and pd.api.types.is_numeric_dtype(filtered_df[y_col]):
+            if group_cols:
+                aggregated_df = filtered_df.groupby(group_cols, as_index=False, observed=True)[y_col].sum()
+            else:
+                aggregated_df = filtered_df
+
+            if x_col_for_plot == 'Fecha_Agrupada':
+                aggregated_df = aggregated_df.sort_values(by='Fecha_Agrupada')
+            elif x_col and x_col in aggregated_df.columns:
+                aggregated_df = aggregated_df.sort_values(by=x_col)
+        else:
+            result.add("warning", f"La columna '{y_col}' no es numérica y no se puede sumar para el gráfico. Mostrando datos sin agregar.")
+            aggregated_df = filtered_df
+            x_col_for_plot = x_col
+
+        # Series con muchos puntos (p. ej. por día en varios años o sin agregar): reducir antes de enviar.
+        # Las barras agregadas no: cada fila es una barra distinta y quitarla cambia la respuesta
+        reducible = chart_type == "line" or aggregated_df is filtered_df
+        chart_sample = downsample(aggregated_df, x_col_for_plot, y_col, color_col, kind=chart_type,
+                                  max_points=self.chart_max_points if reducible else 0)
+        labels = {x_col_for_plot: x_col, y_col: y_col}
+        if chart_type == "line":
+            return ChartSpec("line", chart_sample.df, f"Evolución de {y_col} por {x_col}", x=x_col_for_plot, y=y_col,
+                             color=color_col, labels=labels, render_mode=chart_sample.render_mode, sample=chart_sample)
+        return ChartSpec("bar", chart_sample.df, f"Distribución de {y_col} por {x_col}", x=x_col_for_plot, y=y_col,
+                         color=color_col, labels=labels, sample=chart_sample)
+
+    def _table(self, chart_data, filtered_df, x_col, y_col, color_col, table_columns, result):
+        result.add("subheader", chart_data.get("summary_response", "Aquí tienes la tabla solicitada:"))
+
+        if table_columns:
+            valid_table_columns = [col for col in table_columns if col in filtered_df.columns]
+            if len(valid_table_columns) == len(table_columns):
+                result.add("table", filtered_df[valid_table_columns])
+            else:
+                result.add("warning", f"Algunas columnas solicitadas para la tabla no se encontraron: {', '.join(set(table_columns) - set(filtered_df.columns))}. Mostrando el DataFrame filtrado completo.")
+                result.add("table", filtered_df)
+        elif x_col and y_col and x_col in filtered_df.columns and y_col in filtered_df.columns:
+            table_group_cols = [x_col]
+            if color_col and color_col in filtered_df.columns:
+                table_group_cols.append(color_col)
+
+            if pd.api.types.is_numeric_dtype(filtered_df[y_col]):
+                result.add("table", filtered_df.groupby(table_group_cols, as_index=False, observed=True)[y_col].sum())
+            else:
+                result.add("warning", f"La columna '{y_col}' no es numérica para agregar en la tabla. Mostrando el DataFrame filtrado completo.")
+                result.add("table", filtered_df)
+        else:
+            result.add("table", filtered_df)
+
+    def _calculation(self, question, chart_data, data, trace, result, cancel_event):
+        """Preguntas de texto: métricas sobre el cubo y, si hace falta, análisis de Gemini."""
+        final_summary_response = chart_data.get("summary_response", "")
+        calculation_type = chart_data.get("calculation_type", "none")
+        calculation_params = chart_data.get("calculation_params", {})
+
+        # Cubo de agregados (una vez por versión de datos): los cálculos leen celdas, no filas
+        with trace.span("cubo"):
+            cube = self.derived(data.fingerprint, "cubo")
+
+        # --- Realizar cálculos (metrics.py): todas las métricas de la pregunta en una sola pasada ---
+        calculations = [(calculation_type, calculation_params)] + \
+            [(extra.get("calculation_type", "none"), extra.get("calculation_params") or {})
+             for extra in chart_data.get("additional_calculations") or []]
+        metric_executor = MetricExecutor(cube, data.df, self.forecast_engine.for_version(data.fingerprint, data.df))
+        with trace.span("cálculos"):
+            final_summary_response, metric_messages = metric_executor.run(calculations, final_summary_response)
+        trace.rows_scanned += metric_executor.rows_scanned
+        for level, message in metric_messages:
+            result.add("error" if level == "error" else "warning", message)
+
+        # Si la summary_response de Gemini estaba vacía (indicando que se necesita un análisis profundo)
+        # o si no se pudo reemplazar un placeholder, hacer la segunda llamada a Gemini.
+        if not needs_analysis(final_summary_response):
+            result.add("success", ANSWER_PREFIX + final_summary_response)
+            return
+
+        # El análisis depende de la pregunta y del resumen (versión de datos)
+        with trace.span("caché análisis"):
+            content = self.response_cache.get("analysis", question, data.fingerprint, self.model)
+        trace.cache_hits["análisis"] = content is not None
+        if content is not None:
+            result.add("success", ANSWER_PREFIX + content)
+            return
+
+        api_key = self._require_api_key(result)
+        with trace.span("prompt análisis"):
+            text_generation_payload, prompt_stats = PromptBuilder(data.profile, self.token_budget).analysis_payload(question)
+        trace.prompt_tokens += prompt_stats["tokens"]
+        result.add("caption", describe_prompt(prompt_stats))
+        if self.streaming:
+            self._stream_analysis(question, text_generation_payload, api_key, data, trace, result, cancel_event)
+            return
+
+        with trace.span("gemini análisis"):
+            response = self.gemini_client.generate_content(text_generation_payload, api_key)
+        if response.status_code != 200:
+            result.stop(f"❌ Error al consultar la API de la IA para análisis: {response.status_code}", response.text)
+        response_data = response.json()
+        if not (response_data and "candidates" in response_data and len(response_data["candidates"]) > 0):
+            result.stop("❌ No se recibió una respuesta válida de la IA para el análisis.", response.text)
+        content = response_data["candidates"][0]["content"]["parts"][0]["text"]
+        self.response_cache.put("analysis", question, data.fingerprint, self.model, content)
+        result.add("success", ANSWER_PREFIX + content)
+
+    def _stream_analysis(self, question, payload, api_key, data, trace, result, cancel_event):
+        # Streaming: `on_partial` recibe el texto a medida que llega; al final queda un solo bloque con la respuesta
+        streamed_chunks = []
+        if result.on_partial is not None:
+            result.on_partial(None)
+        trace.begin("gemini análisis")
+        trace.begin("gemini análisis (primer fragmento)")
+        try:
+            for chunk in self.gemini_client.stream_generate_content(payload, api_key, cancel_event=cancel_event):
+                trace.end("gemini análisis (primer fragmento)")
+                streamed_chunks.append(chunk)
+                if result.on_partial is not None:
+                    result.on_partial(ANSWER_PREFIX + "".join(streamed_chunks))
+        except GeminiAPIError as e:
+            trace.end("gemini análisis")
+            result.stop(f"❌ Error al consultar la API de la IA para análisis: {e.status_code}", e.text)
+        trace.end("gemini análisis")
+        content = "".join(streamed_chunks)
+        if content:
+            result.add("success", ANSWER_PREFIX + content)
+        if cancel_event.is_set():
+            result.add("caption", "Respuesta interrumpida por una nueva consulta.")
+        elif content:
+            self.response_cache.put("analysis", question, data.fingerprint, self.model, content)
+        else:
+            result.stop("❌ No se recibió una respuesta válida de la IA para el análisis.")
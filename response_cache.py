@@ -0,0 +1,94 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from text_normalization import normalize_text
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "gemini_responses.sqlite")
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def normalize_question(text):
+    return normalize_text(text)
+
+
+class ResponseCache:
+    """Caché LRU persistente (SQLite) de respuestas de Gemini.
+
+    La clave combina el tipo de llamada, la pregunta normalizada, la versión de
+    los datos y el modelo, de modo que un cambio en la hoja invalida las respuestas.
+    Las entradas vencen por TTL y las menos usadas se eliminan al superar `max_entries`.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                kind TEXT NOT NULL,
+                                value TEXT NOT NULL,
+                                created_at REAL NOT NULL,
+                                last_access REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:  # commit/rollback
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(kind, question, data_version, model):
+        raw = "\x1f".join([kind, normalize_question(question), str(data_version), model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, kind, question, data_version, model):
+        key = self.make_key(kind, question, data_version, model)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, kind, question, data_version, model, value):
+        key = self.make_key(kind, question, data_version, model)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, kind, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                         (key, kind, json.dumps(value, ensure_ascii=False), now, now))
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute("""DELETE FROM responses WHERE key IN (
+                                SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)""",
+                         (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": entries,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,91 @@
+import math
+import re
+
+import numpy as np
+
+from filter_engine import DatasetIndex
+
+DEFAULT_PAGE_SIZE = 50
+PAGE_SIZES = [10, 25, 50, 100, 500]
+# Tope de filas por página: lo que se serializa al navegador en cada ejecución
+MAX_PAGE_SIZE = max(PAGE_SIZES)
+
+
+class TablePage:
+    """Una página de resultados: las filas a mostrar y su posición dentro del total."""
+
+    def __init__(self, rows, number, n_pages, start, matched, total):
+        self.rows = rows
+        self.number = number
+        self.n_pages = n_pages
+        self.start = start
+        self.matched = matched
+        self.total = total
+
+    def caption(self):
+        if not self.matched:
+            return f"Sin filas que coincidan con el filtro (de {self.total:,})."
+        text = f"Mostrando {self.start + 1:,}–{self.start + len(self.rows):,} de {self.matched:,} filas"
+        if self.matched < self.total:
+            text += f" (filtradas de {self.total:,})"
+        return text + f" · página {self.number} de {self.n_pages}"
+
+
+class ResultTable:
+    """Resultado que se queda en el servidor; al navegador solo viaja la página pedida.
+
+    El orden y el filtro se resuelven sobre posiciones (sin copiar el
+    DataFrame): cada orden por columna se calcula una vez y el filtro de texto
+    se evalúa sobre los valores distintos de la columna, como en FilterPlan.
+    """
+
+    def __init__(self, df, index=None):
+        self.df = df
+        self._index = index  # DatasetIndex de `df`, si ya existe uno (p. ej. el de la versión de datos)
+        self._orders = {}
+
+    @property
+    def index(self):
+        """DatasetIndex de la tabla; sin uno dado, se construye con el primer filtro (casi todas solo se paginan)."""
+        if self._index is None:
+            self._index = DatasetIndex(self.df)
+        return self._index
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def columns(self):
+        return list(self.df.columns)
+
+    def sort_order(self, column, ascending=True):
+        """Posiciones de las filas ordenadas por `column` (nulos al final)."""
+        key = (column, ascending)
+        order = self._orders.get(key)
+        if order is None:
+            values = self.df[column].reset_index(drop=True)
+            order = values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+            self._orders[key] = order
+        return order
+
+    def positions(self, sort_by=None, ascending=True, filter_column=None, filter_text=""):
+        """Posiciones visibles según el orden y el filtro de texto (contiene, sin distinguir tildes)."""
+        positions = self.sort_order(sort_by, ascending) if sort_by in self.df.columns else np.arange(len(self.df))
+        if filter_column in self.df.columns and filter_text.strip():
+            pattern = filter_text.strip()
+            if not self.index.is_text(filter_column):
+                # En columnas numéricas o de fecha el texto se busca literal, no como expresión regular
+                pattern = re.escape(pattern)
+            mask = self.index.rows_matching(filter_column, pattern)
+            positions = positions[mask[positions]]
+        return positions
+
+    def page(self, number, page_size=DEFAULT_PAGE_SIZE, positions=None):
+        """TablePage `number` (desde 1; se ajusta al rango válido) sobre `positions`."""
+        positions = np.arange(len(self.df)) if positions is None else positions
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        n_pages = max(1, math.ceil(len(positions) / page_size))
+        number = min(max(1, number), n_pages)
+        start = (number - 1) * page_size
+        rows = self.df.take(positions[start:start + page_size])
+        return TablePage(rows, number, n_pages, start, len(positions), len(self.df))
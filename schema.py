@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# --- Esquema declarado de la hoja (nombre de columna -> tipo lógico) ---
+# date: fecha; money: monto en formato chileno ($1.234.567 / 1.234,5);
+# percent: porcentaje (5, 5,5 o 5%); category: texto de baja cardinalidad;
+# text: texto libre que se mantiene como string.
+COLUMN_SCHEMA = {
+    "Fecha": "date",
+    "Cliente": "category",
+    "Tipo Cliente": "category",
+    "Tipo Vehículo": "category",
+    "Factura N°": "text",
+    "Monto Facturado": "money",
+    "Materiales y Pintura": "money",
+    "Costos Financieros": "money",
+    "Sucursal": "category",
+    "Ejecutivo": "category",
+    "Estado Pago": "category",
+    "Forma de Pago": "category",
+    "Descuento Aplicado (%)": "percent",
+    "Observaciones": "text",
+}
+
+MONEY_COLUMNS = [col for col, kind in COLUMN_SCHEMA.items() if kind == "money"]
+NUMERIC_COLUMNS = [col for col, kind in COLUMN_SCHEMA.items() if kind in ("money", "percent")]
+CATEGORY_COLUMNS = [col for col, kind in COLUMN_SCHEMA.items() if kind == "category"]
+
+# Separador decimal: el último punto o coma seguido de una cantidad de dígitos distinta de 3
+# ("1.234,5", "12.5"). Cualquier otro punto o coma es separador de miles ("$1.234.567").
+_DECIMAL_SEPARATOR = r"[.,](\d{1,2}|\d{4,})$"
+
+
+def parse_numbers(values):
+    """Convierte texto con formato chileno a float de forma vectorizada.
+
+    "$1.234.567" -> 1234567, "1.234,5" -> 1234.5, "5,5%" -> 5.5, "1,234,567.89" -> 1234567.89,
+    "(1.000)" -> -1000 (negativo contable). Los valores no interpretables
+    ("12abc34", "N/A") quedan como NaN.
+    """
+    s = pd.Series(values, dtype="string").str.strip()
+    s = s.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    s = s.str.replace(r"(?i)clp|[$%\s]", "", regex=True)
+    # Después de quitar moneda, porcentaje y espacios solo pueden quedar dígitos, separadores y el signo
+    s = s.where(s.str.fullmatch(r"-?[\d.,]*\d[\d.,]*").fillna(False))
+    s = s.str.replace(_DECIMAL_SEPARATOR, r";\1", regex=True)
+    s = s.str.replace(r"[.,]", "", regex=True).str.replace(";", ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").astype("float64")
+
+
+def parse_numeric_columns(df, columns):
+    """Parsea todas las columnas numéricas en una sola pasada.
+
+    Las columnas se apilan en un único arreglo y solo se parsean los valores
+    distintos (los montos repetidos son frecuentes), para luego volver a expandirlos.
+    """
+    pending = [col for col in columns if col in df.columns and not pd.api.types.is_numeric_dtype(df[col])]
+    if not pending:
+        return df
+    stacked = df[pending].astype(str).to_numpy().ravel(order="F")
+    codes, uniques = pd.factorize(stacked)
+    parsed_uniques = parse_numbers(uniques).to_numpy()
+    parsed = np.where(codes >= 0, parsed_uniques[codes], np.nan).reshape(len(df), len(pending), order="F")
+    for i, col in enumerate(pending):
+        df[col] = parsed[:, i]
+    return df
+
+
+def apply_schema(df):
+    """Aplica COLUMN_SCHEMA al DataFrame crudo de la hoja (in place) y lo devuelve."""
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+    parse_numeric_columns(df, NUMERIC_COLUMNS)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = to_stripped_category(df[col])
+    return df
+
+
+def to_stripped_category(series):
+    """Convierte a category limpiando espacios solo sobre los valores distintos."""
+    categorical = series.astype("category")
+    stripped = categorical.cat.categories.astype(str).str.strip()
+    if stripped.has_duplicates:
+        # "Pagado" y "Pagado " deben quedar en la misma categoría
+        return series.astype(str).str.strip().astype("category")
+    return categorical.cat.rename_categories(stripped)
+
+
+def remove_unused_categories(df):
+    """Descarta categorías que quedaron sin filas (p. ej. después de un dropna)."""
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
+    return df
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él no hay snapshot local
+    pa = None
+    pq = None
+
+# Incrementar cuando cambie la limpieza o los tipos del DataFrame: invalida snapshots antiguos.
+SNAPSHOT_SCHEMA_VERSION = 2
+DEFAULT_SNAPSHOT_PATH = os.path.join(".cache", "fenix_snapshot.parquet")
+
+_METADATA_KEY = b"fenix_snapshot"
+
+
+def snapshots_available():
+    return pq is not None
+
+
+def row_hashes(df):
+    """Hash por fila (independiente del índice), útil para detectar filas anexadas."""
+    return pd.util.hash_pandas_object(df, index=False).values
+
+
+def dataframe_fingerprint(df, hashes=None):
+    """Huella estable del contenido del DataFrame (independiente del índice)."""
+    if hashes is None:
+        hashes = row_hashes(df)
+    digest = hashlib.sha1(hashes.tobytes())
+    digest.update("|".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def save_snapshot(df, path=DEFAULT_SNAPSHOT_PATH, source_version=None, fingerprint=None):
+    """Guarda el DataFrame limpio en Parquet junto con versión de esquema y huella."""
+    if not snapshots_available():
+        return None
+    meta = {
+        "schema_version": SNAPSHOT_SCHEMA_VERSION,
+        "fingerprint": fingerprint or dataframe_fingerprint(df),
+        "source_version": source_version,
+        "saved_at": time.time(),
+        "rows": len(df),
+    }
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           _METADATA_KEY: json.dumps(meta).encode("utf-8")})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Escritura atómica: nunca se deja un snapshot a medio escribir
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return meta
+
+
+def read_snapshot_metadata(path=DEFAULT_SNAPSHOT_PATH):
+    if not snapshots_available() or not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    if _METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[_METADATA_KEY])
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    """Devuelve (df, meta) o None si no hay snapshot compatible."""
+    meta = read_snapshot_metadata(path)
+    if meta is None or meta.get("schema_version") != SNAPSHOT_SCHEMA_VERSION:
+        return None
+    table = pq.read_table(path, memory_map=True)
+    return table.to_pandas(), meta
@@ -0,0 +1,142 @@
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from text_normalization import normalize_text
+
+DEFAULT_TRACE_PATH = os.path.join(".cache", "query_traces.jsonl")
+# Tamaño desde el que el registro pasa a `<path>.1` y se empieza uno nuevo (~40 mil consultas)
+DEFAULT_TRACE_MAX_MB = 20
+PERCENTILES = (50, 95)
+
+
+def question_hash(question):
+    """Hash corto de la pregunta normalizada (el log no guarda el texto de las preguntas)."""
+    return hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest()[:16]
+
+
+class QueryTrace:
+    """Tiempos por etapa de una consulta, más tamaño de prompts, filas recorridas y aciertos de caché.
+
+    Las etapas se miden con `span`; si una etapa se repite en la misma consulta
+    sus tiempos se suman. Las etapas pueden anidarse (p. ej. "limpieza" dentro
+    de "datos"), por eso el total es el tiempo transcurrido desde que se creó
+    la traza y no la suma de las etapas.
+    """
+
+    def __init__(self, question=None):
+        self.question_hash = question_hash(question) if question else None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans = {}  # etapa -> ms, en orden de ejecución
+        self.prompt_tokens = 0
+        self.rows_scanned = 0
+        self.cache_hits = {}  # p. ej. {"intención": True, "análisis": False}
+        self.attributes = {}
+        self._open = {}
+
+    def set_question(self, question):
+        self.question_hash = question_hash(question)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def begin(self, stage):
+        """Como `span`, para bloques largos que no conviene reindentar; se cierra con `end`."""
+        self._open[stage] = time.perf_counter()
+
+    def end(self, stage):
+        start = self._open.pop(stage, None)
+        if start is not None:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds * 1000
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+    def record(self):
+        return {"ts": self.started_at, "question_hash": self.question_hash,
+                "spans_ms": {stage: round(ms, 3) for stage, ms in self.spans.items()},
+                "total_ms": round(self.total_ms, 3), "prompt_tokens": self.prompt_tokens,
+                "rows_scanned": self.rows_scanned, "cache_hits": self.cache_hits, **self.attributes}
+
+
+class TraceLog:
+    """Registro JSONL de las consultas (una línea por consulta), compartido por las sesiones del proceso.
+
+    Al pasar de `max_mb` el archivo se renombra a `<path>.1` (reemplazando el
+    anterior), así que en disco nunca hay más de dos archivos.
+    """
+
+    def __init__(self, path=DEFAULT_TRACE_PATH, max_mb=DEFAULT_TRACE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 ** 2) if max_mb else None
+        self._lock = threading.Lock()
+
+    @property
+    def rotated_path(self):
+        return self.path + ".1"
+
+    def append(self, trace):
+        line = json.dumps(trace.record(), ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                size = f.tell()
+            if self.max_bytes and size >= self.max_bytes:
+                os.replace(self.path, self.rotated_path)
+
+    def read(self, limit=None):
+        """Últimos `limit` registros (todos si es None); las líneas dañadas se omiten.
+
+        Solo se guardan en memoria las últimas `limit` líneas; si el archivo
+        actual no alcanza, se completa con el final del rotado.
+        """
+        with self._lock:
+            lines = self._tail(self.path, limit)
+            if not limit or len(lines) < limit:
+                lines = self._tail(self.rotated_path, limit - len(lines) if limit else None) + lines
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return records
+
+    @staticmethod
+    def _tail(path, limit):
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return list(collections.deque(f, maxlen=limit))
+
+
+def latency_percentiles(records, percentiles=PERCENTILES):
+    """DataFrame con n y percentiles (ms) por etapa, más el total por consulta."""
+    samples = {}
+    for record in records:
+        for stage, ms in record.get("spans_ms", {}).items():
+            samples.setdefault(stage, []).append(ms)
+        if "total_ms" in record:
+            samples.setdefault("total", []).append(record["total_ms"])
+    rows = [{"etapa": stage, "n": len(values),
+             **{f"p{p} (ms)": float(np.percentile(values, p)) for p in percentiles}}
+            for stage, values in samples.items()]
+    return pd.DataFrame(rows, columns=["etapa", "n"] + [f"p{p} (ms)" for p in percentiles])
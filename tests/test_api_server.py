@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from api_server import QueryServer
+
+
+class SlowResult:
+    def to_dict(self, max_rows=None, trace=None):
+        return {"kind": "success", "blocks": []}
+
+
+class SlowEngine:
+    """Motor cuyas consultas esperan a que la prueba las deje terminar."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def ask(self, question, trace=None):
+        self.release.wait(10)
+        return SlowResult()
+
+
+@pytest.fixture
+def server():
+    server = QueryServer(("127.0.0.1", 0), SlowEngine(), workers=1, max_pending=0, request_timeout=0.05)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.engine.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_timed_out_query_keeps_its_slot_until_it_finishes(server):
+    assert server.run_query("ventas", 10)[0] == 504
+    # La consulta sigue corriendo: su cupo no se libera con el 504
+    assert server.stats["in_flight"] == 1
+    assert server.run_query("ventas", 10)[0] == 503
+    server.engine.release.set()
+    deadline = time.monotonic() + 5
+    while server.stats["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.stats["in_flight"] == 0
+    assert server.run_query("ventas", 10)[0] == 200
+
+
+def test_negative_max_rows_is_rejected(server):
+    host, port = server.server_address[:2]
+    response = requests.post(f"http://{host}:{port}/query", json={"question": "ventas", "max_rows": -1}, timeout=5)
+    assert response.status_code == 400
+    assert server.stats["in_flight"] == 0
@@ -0,0 +1,18 @@
+from batch_questions import run_batch
+from bench.bench_batch import build_engine
+from bench.synthetic import generate_sheet_values
+
+
+def test_text_duplicate_of_intent_duplicate_points_at_the_answer(tmp_path):
+    engine = build_engine(generate_sheet_values(500), 0, str(tmp_path / "cache.sqlite"))
+    try:
+        # La 3.ª repite el texto de la 2.ª, que comparte la intención de la 1.ª
+        questions = ["ventas totales", "dame el total de ventas", "dame el total de ventas"]
+        for workers in (1, 4):
+            run = run_batch(engine, questions, workers=workers)
+            assert [item.same_as for item in run.items] == [None, 0, 0]
+            assert all(run.result(item) is run.items[0].result for item in run.items)
+            assert run.summary()["respondidas"] == 1
+            assert len(run.to_dict()["questions"]) == 3
+    finally:
+        engine.forecast_engine.close()
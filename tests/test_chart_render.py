@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from chart_render import downsample, minmax_indices
+
+
+def test_minmax_skips_all_nan_buckets():
+    y = np.concatenate([np.full(50, np.nan), np.arange(50, dtype="float64")])
+    indices = minmax_indices(y, 10)
+    assert indices.dtype == np.int64
+    assert not np.isnan(y[indices]).any()
+    # Los 5 tramos con números aportan su mínimo y su máximo
+    assert len(indices) == 10 and indices.min() == 50 and indices.max() == 99
+
+
+def test_minmax_all_nan():
+    assert len(minmax_indices(np.full(100, np.nan), 10)) == 0
+
+
+def test_downsample_scatter_with_gaps():
+    y = np.where(np.arange(10_000) % 3 == 0, np.nan, np.sin(np.arange(10_000) / 100))
+    df = pd.DataFrame({"x": np.arange(10_000), "y": y})
+    sample = downsample(df, "x", "y", kind="scatter", max_points=500)
+    assert len(sample.df) <= 500
+    assert sample.df["y"].max() == np.nanmax(y) and sample.df["y"].min() == np.nanmin(y)
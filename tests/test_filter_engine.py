@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+from bench.synthetic import generate_sheet_values
+from data_loader import clean_sheet_values
+from filter_engine import DatasetIndex, FilterPlan
+
+MONTHS = {"enero": 1, "marzo": 3, "diciembre": 12}
+
+
+@pytest.fixture(scope="module")
+def df():
+    # Desordenada por fecha, como la hoja real: el índice no debe depender del orden de las filas
+    return clean_sheet_values(generate_sheet_values(3000)).sample(frac=1, random_state=0)
+
+
+def baseline_filter(df, chart_data):
+    """Los filtros encadenados originales (filtro principal, rango de fechas, filtros adicionales)."""
+    filtered = df
+    filter_column, filter_value = chart_data.get("filter_column"), chart_data.get("filter_value")
+    if filter_column and filter_value:
+        if filter_column == "Fecha":
+            try:
+                filtered = filtered[filtered["Fecha"].dt.year == int(filter_value)]
+            except ValueError:
+                if filter_value.lower() in MONTHS:
+                    filtered = filtered[filtered["Fecha"].dt.month == MONTHS[filter_value.lower()]]
+        elif filter_column in filtered.columns:
+            filtered = filtered[filtered[filter_column].astype(str).str.contains(filter_value, case=False, na=False)]
+    if chart_data.get("start_date"):
+        filtered = filtered[filtered["Fecha"] >= pd.to_datetime(chart_data["start_date"])]
+    if chart_data.get("end_date"):
+        filtered = filtered[filtered["Fecha"] <= pd.to_datetime(chart_data["end_date"])]
+    for add_filter in chart_data.get("additional_filters") or []:
+        col, val = add_filter.get("column"), add_filter.get("value")
+        if col and val and col in filtered.columns:
+            filtered = filtered[filtered[col].astype(str).str.contains(val, case=False, na=False)]
+    return filtered
+
+
+CASES = {
+    "año": {"filter_column": "Fecha", "filter_value": "2023"},
+    "mes": {"filter_column": "Fecha", "filter_value": "Marzo"},
+    "texto": {"filter_column": "Tipo Cliente", "filter_value": "particular"},
+    "rango": {"start_date": "2024-03-01", "end_date": "2024-06-30"},
+    "rango abierto": {"start_date": "2024-10-15", "end_date": []},
+    "año y rango": {"filter_column": "Fecha", "filter_value": "2024", "start_date": "2023-11-01", "end_date": "2024-02-29"},
+    "mes y adicional": {"filter_column": "Fecha", "filter_value": "diciembre",
+                        "additional_filters": [{"column": "Estado Pago", "value": "Vencido"}]},
+    "varios": {"filter_column": "Sucursal", "filter_value": "centro", "start_date": "2022-01-01",
+               "additional_filters": [{"column": "Tipo Cliente", "value": "Seguro"},
+                                      {"column": "Tipo Vehículo", "value": "pesado"}]},
+    "rango vacío": {"start_date": "2024-06-30", "end_date": "2024-03-01"},
+    "sin filtros": {},
+}
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_matches_chained_filters(df, name):
+    plan = FilterPlan.from_chart_data(CASES[name], df.columns)
+    expected = baseline_filter(df, CASES[name])
+    pd.testing.assert_frame_equal(plan.apply(DatasetIndex(df)), expected)
+    assert plan.warnings == []
+
+
+def test_matches_plurals_and_accents(df):
+    # Más permisivo que str.contains: "particulares" y "vehiculo pesado" encuentran sus valores
+    chart_data = {"filter_column": "Tipo Cliente", "filter_value": "particulares",
+                  "additional_filters": [{"column": "Tipo Vehículo", "value": "PESADO"}]}
+    filtered = FilterPlan.from_chart_data(chart_data, df.columns).apply(DatasetIndex(df))
+    expected = df[(df["Tipo Cliente"] == "Particular") & (df["Tipo Vehículo"] == "Pesado")]
+    pd.testing.assert_frame_equal(filtered, expected)
+
+
+def test_warnings_leave_the_data_unfiltered(df):
+    chart_data = {"filter_column": "No Existe", "filter_value": "x", "start_date": "no es fecha",
+                  "additional_filters": [{"column": "Otra", "value": "y"}]}
+    plan = FilterPlan.from_chart_data(chart_data, df.columns)
+    assert len(plan.warnings) == 3
+    assert len(plan.apply(DatasetIndex(df))) == len(df)
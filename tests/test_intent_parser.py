@@ -0,0 +1,41 @@
+import pytest
+
+from bench.intent_hit_rate import synthetic_category_values
+from intent_parser import IntentParser, IntentParserStats
+
+# Preguntas que el parser respondería con una suma equivocada: deben quedar para Gemini
+NOT_LOCAL = [
+    "cuantas facturas hubo en 2024",
+    "cantidad de ventas en 2024",
+    "margen de ventas 2024",
+    "ventas netas de 2024",
+    "ventas máximas en 2024",
+    "cuánto vendió cada ejecutivo",
+    "ventas de la sucursal centro en 2024",
+    "gráfico de ventas del 2024 excluyendo seguro",
+    "ventas de 2025 hasta marzo",
+    "ventas desde marzo 2024",
+    "ventas a partir de 2024",
+    "grafico de ventas por mes desde 2023",
+    "ventas de 2024 menos las de seguro",
+    "ventas antes de junio 2024",
+]
+
+
+@pytest.fixture(params=[False, True], ids=["sin valores", "con valores"])
+def parser(request):
+    return IntentParser(synthetic_category_values() if request.param else None, stats=IntentParserStats())
+
+
+@pytest.mark.parametrize("question", NOT_LOCAL)
+def test_defers_to_gemini(parser, question):
+    assert parser.parse(question) is None
+
+
+def test_still_resolves_sums(parser):
+    assert parser.parse("¿Cuál es el cliente que genera mayor cantidad de ventas?")["calculation_type"] == "max_client_sales"
+    assert parser.parse("total de ventas de 2024")["calculation_type"] == "sales_for_period"
+    assert parser.parse("gráfico de ventas de cada sucursal")["x_axis"] == "Sucursal"
+    assert parser.parse("cuál fue el mes con menos ingresos")["calculation_type"] == "min_month_sales"
+    assert parser.parse("ventas entre 2024-03-01 y 2024-06-30")["end_date"] == "2024-06-30"
+    assert parser.parse("variación de costos financieros entre el año 2023 y 2024")["calculation_type"] == "percentage_variation"
@@ -0,0 +1,203 @@
+from datetime import datetime
+
+import pytest
+from dateutil.relativedelta import relativedelta
+from statsmodels.tsa.seasonal import seasonal_decompose
+
+from bench.synthetic import generate_sheet_values
+from cube import AggregateCube
+from data_loader import clean_sheet_values
+from forecasting import ForecastEngine, VersionForecasts
+from metrics import METRICS, MetricExecutor
+
+# Cada caso se compara con el cálculo directo en pandas de la cadena de calculation_type original
+
+
+@pytest.fixture(scope="module")
+def df():
+    return clean_sheet_values(generate_sheet_values(3000))
+
+
+@pytest.fixture(scope="module")
+def forecast_engine():
+    engine = ForecastEngine(max_workers=1)
+    yield engine
+    engine.close()
+
+
+def run(df, forecast_engine, calculation_type, params, summary):
+    executor = MetricExecutor(AggregateCube.build(df), df, VersionForecasts(forecast_engine, df))
+    return executor.run([(calculation_type, params)], summary)
+
+
+def money(value):
+    return f"{value:,.2f}"
+
+
+def test_total_sales(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "total_sales", {}, "Total: $[TOTAL_MONTO_FACTURADO].")
+    assert summary == f"Total: ${money(df['Monto Facturado'].sum())}."
+
+
+def test_max_client_sales(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "max_client_sales", {}, "[NOMBRE_CLIENTE_MAX_VENTAS] con $[MONTO_MAX_VENTAS].")
+    by_client = df.groupby("Cliente", observed=True)["Monto Facturado"].sum()
+    assert summary == f"{by_client.idxmax()} con ${money(by_client.max())}."
+
+
+def test_min_month_sales(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "min_month_sales", {}, "[MES_MIN_INGRESOS]: $[MONTO_MIN_INGRESOS].")
+    monthly = df.set_index("Fecha").resample("MS")["Monto Facturado"].sum()
+    assert summary == f"{monthly.idxmin().strftime('%B %Y')}: ${money(monthly.min())}."
+
+
+@pytest.mark.parametrize("params", [{"year": 2023}, {"year": 2024, "month": 3}, {"year": 2019}])
+def test_sales_for_period(df, forecast_engine, params):
+    template = "[MONTH] [YEAR]: $[CALCULATED_SALES_MONTH_YEAR]." if "month" in params else "[YEAR]: $[CALCULATED_TOTAL_YEAR]."
+    summary, _ = run(df, forecast_engine, "sales_for_period", params, template)
+    rows = df[df["Fecha"].dt.year == params["year"]]
+    if "month" in params:
+        rows = rows[rows["Fecha"].dt.month == params["month"]]
+        month = datetime(params["year"], params["month"], 1).strftime("%B").capitalize()
+        assert summary == f"{month} {params['year']}: ${money(rows['Monto Facturado'].sum())}."
+    else:
+        assert summary == f"{params['year']}: ${money(rows['Monto Facturado'].sum())}."
+
+
+def test_sales_for_period_without_year(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "sales_for_period", {}, "[YEAR]: $[CALCULATED_TOTAL_YEAR].")
+    assert summary == "N/A: $N/A."
+
+
+def test_project_remaining_year(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "project_remaining_year", {"target_year": 2024}, "[TARGET_YEAR]: $[ESTIMACION_RESTO_YEAR].")
+    current_month = datetime.now().month
+    rows = df[(df["Fecha"].dt.year == 2024) & (df["Fecha"].dt.month <= current_month)]
+    monthly = rows.groupby(rows["Fecha"].dt.to_period("M"))["Monto Facturado"].sum()
+    assert summary == f"2024: ${money(monthly.mean() * (12 - current_month))}."
+
+
+def test_project_remaining_year_without_data(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "project_remaining_year", {"target_year": 2030}, "[TARGET_YEAR]: [ESTIMACION_RESTO_YEAR]")
+    assert summary == "2030: No hay suficientes datos para una estimación."
+
+
+def test_project_remaining_year_monthly(df, forecast_engine):
+    summary, messages = run(df, forecast_engine, "project_remaining_year_monthly", {"target_year": 2026},
+                            "[TARGET_YEAR]:[ESTIMACION_MENSUAL_RESTO_YEAR]")
+    ts_data = df.set_index("Fecha")["Monto Facturado"].resample("MS").sum().fillna(0)
+    decomposition = seasonal_decompose(ts_data, model="additive", period=12, extrapolate_trend="freq")
+    now = datetime.now()
+    lines = []
+    for i in range(12 - now.month):
+        future = now + relativedelta(months=i + 1)
+        # La hoja sintética empieza en enero: la posición en la serie coincide con el mes calendario
+        value = decomposition.trend.iloc[-1] + decomposition.seasonal.iloc[(future.month - 1) % 12]
+        lines.append(f"- {future.strftime('%B').capitalize()} {future.year}: ${max(0, value):,.2f}")
+    expected = "\n" + "\n".join(lines) if lines else "No hay meses restantes para proyectar en este año."
+    assert summary == "2026:" + expected
+    assert messages == []
+
+
+def test_project_remaining_year_monthly_short_history(df, forecast_engine):
+    recent = df[df["Fecha"].dt.year == 2024]
+    summary, messages = run(recent, forecast_engine, "project_remaining_year_monthly", {"target_year": 2026},
+                            "[ESTIMACION_MENSUAL_RESTO_YEAR]")
+    mean = recent.set_index("Fecha")["Monto Facturado"].resample("MS").sum().mean()
+    expected = [f"- {datetime(2026, month, 1).strftime('%B').capitalize()} 2026: ${mean:,.2f}"
+                for month in range(datetime.now().month + 1, 13)]
+    assert summary == "\n" + "\n".join(expected)
+    assert [level for level, _ in messages] == ["warning"]
+
+
+def test_project_remaining_year_monthly_by_segment(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "project_remaining_year_monthly",
+                     {"target_year": 2026, "segment_column": "Tipo Cliente"}, "[ESTIMACION_MENSUAL_RESTO_YEAR]")
+    if datetime.now().month < 12:
+        segments = [line.split(":")[0] for line in summary.strip().splitlines()]
+        assert segments == [f"- Tipo Cliente {value}" for value in sorted(df["Tipo Cliente"].cat.categories)]
+
+
+def test_total_overdue_payments(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "total_overdue_payments", {}, "$[TOTAL_MONTO_VENCIDO]")
+    overdue = df[df["Estado Pago"].astype(str).str.contains("Vencido", case=False, na=False)]
+    assert summary == f"${money(overdue['Monto Facturado'].sum())}"
+
+
+@pytest.mark.parametrize("column", ["Costos Financieros", "Monto Facturado"])
+def test_percentage_variation(df, forecast_engine, column):
+    params = {"column_to_analyze": column, "year1": 2023, "year2": 2024}
+    summary, _ = run(df, forecast_engine, "percentage_variation", params, "[YEAR1]-[YEAR2]: [PERCENTAGE_VARIATION:.2f]%")
+    value1 = df[df["Fecha"].dt.year == 2023][column].sum()
+    value2 = df[df["Fecha"].dt.year == 2024][column].sum()
+    assert summary == f"2023-2024: {(value2 - value1) / value1 * 100:.2f}%"
+
+
+def test_percentage_variation_fallbacks(df, forecast_engine):
+    template = "[YEAR1]-[YEAR2]: [PERCENTAGE_VARIATION:.2f]%"
+    summary, _ = run(df, forecast_engine, "percentage_variation",
+                     {"column_to_analyze": "Monto Facturado", "year1": 2019, "year2": 2024}, template)
+    assert summary == "2019-2024: N/A%. No se puede calcular la variación porque el valor del año inicial es cero."
+    summary, _ = run(df, forecast_engine, "percentage_variation", {"column_to_analyze": "No Existe"}, template)
+    assert summary == "Año1-Año2: N/A%. Faltan datos o columnas para calcular la variación."
+
+
+@pytest.mark.parametrize("group_by", ["Sucursal", "Ejecutivo"])
+def test_average_by_column(df, forecast_engine, group_by):
+    params = {"column_to_average": "Monto Facturado", "group_by_column": group_by}
+    summary, _ = run(df, forecast_engine, "average_by_column", params, "Promedio: [AVERAGE_BY_SUCURSAL]")
+    average = df.groupby(group_by, observed=True)["Monto Facturado"].mean().reset_index()
+    average["Monto Facturado"] = average["Monto Facturado"].apply(lambda x: f"${x:,.2f}")
+    assert summary == "Promedio: \n" + average.to_string(index=False)
+
+
+def test_average_by_column_fallbacks(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "average_by_column",
+                     {"column_to_average": "Observaciones", "group_by_column": "Sucursal"}, "[AVERAGE_BY_SUCURSAL]")
+    assert summary == "N/A. La columna 'Observaciones' no es numérica para calcular el promedio."
+    summary, _ = run(df, forecast_engine, "average_by_column", {"column_to_average": "Monto Facturado"}, "[AVERAGE_BY_SUCURSAL]")
+    assert summary == "N/A. Faltan columnas para calcular el promedio."
+
+
+def test_total_for_column_by_year(df, forecast_engine):
+    params = {"column_to_sum": "Materiales y Pintura", "year": 2024}
+    summary, _ = run(df, forecast_engine, "total_for_column_by_year", params, "[YEAR]: $[TOTAL_MATERIALS_PAINT]")
+    assert summary == f"2024: ${money(df[df['Fecha'].dt.year == 2024]['Materiales y Pintura'].sum())}"
+    summary, _ = run(df, forecast_engine, "total_for_column_by_year", {"column_to_sum": "Observaciones", "year": 2024},
+                     "$[TOTAL_MATERIALS_PAINT]")
+    assert summary == "$N/A. La columna 'Observaciones' no es numérica para sumar."
+
+
+@pytest.mark.parametrize("column, value", [("Tipo Cliente", "Particular"), ("Tipo Vehículo", "pesado"), ("Sucursal", "centro")])
+def test_percentage_of_total_sales_by_category(df, forecast_engine, column, value):
+    params = {"category_column": column, "category_value": value}
+    summary, _ = run(df, forecast_engine, "percentage_of_total_sales_by_category", params,
+                     "[CATEGORY_VALUE]: [PERCENTAGE_SALES_CATEGORY:.2f]%")
+    category = df[df[column].astype(str).str.contains(value, case=False, na=False)]
+    assert summary == f"{value}: {category['Monto Facturado'].sum() / df['Monto Facturado'].sum() * 100:.2f}%"
+
+
+def test_percentage_of_total_sales_by_category_fallback(df, forecast_engine):
+    summary, _ = run(df, forecast_engine, "percentage_of_total_sales_by_category", {"category_column": "No Existe"},
+                     "[CATEGORY_VALUE]: [PERCENTAGE_SALES_CATEGORY:.2f]%")
+    assert summary == "N/A: N/A%. Faltan datos o columnas para calcular el porcentaje."
+
+
+def test_recommendations(df, forecast_engine):
+    # Sin cálculo: la respuesta vacía va a la llamada de análisis
+    assert run(df, forecast_engine, "recommendations", {}, "") == ("", [])
+
+
+def test_every_metric_is_covered():
+    tested = {name[len("test_"):] for name in globals() if name.startswith("test_")}
+    assert set(METRICS) <= tested
+
+
+def test_one_pass_per_source(df, forecast_engine):
+    executor = MetricExecutor(AggregateCube.build(df), df, VersionForecasts(forecast_engine, df))
+    summary, _ = executor.run([("total_sales", {}), ("sales_for_period", {"year": 2024}),
+                               ("min_month_sales", {}), ("total_overdue_payments", {})],
+                              "[TOTAL_MONTO_FACTURADO] [CALCULATED_TOTAL_YEAR] [MONTO_MIN_INGRESOS] [TOTAL_MONTO_VENCIDO]")
+    assert "[" not in summary
+    # Todas las claves (año, mes, Estado Pago) están en el cubo: una sola pasada
+    assert executor.passes == 1
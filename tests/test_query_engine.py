@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench.bench_batch import build_engine
+from bench.synthetic import generate_sheet_values
+from query_engine import QueryResult
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = build_engine(generate_sheet_values(100), 0, str(tmp_path / "cache.sqlite"))
+    engine.chart_max_points = 4000
+    yield engine
+    engine.forecast_engine.close()
+
+
+def test_aggregated_bars_are_not_downsampled(engine):
+    df = pd.DataFrame({"Cliente": [f"Cliente {i}" for i in range(10_000)] * 2,
+                       "Monto Facturado": np.arange(20_000, dtype="float64")})
+    chart = engine._line_or_bar("bar", df, "Cliente", "Monto Facturado", None, "none", QueryResult("gráfico"))
+    assert len(chart.df) == 10_000
+    assert chart.df["Monto Facturado"].sum() == df["Monto Facturado"].sum()
+
+
+def test_daily_line_is_downsampled(engine):
+    df = pd.DataFrame({"Fecha": pd.date_range("2000-01-01", periods=10_000, freq="D"),
+                       "Monto Facturado": np.random.default_rng(0).normal(size=10_000)})
+    chart = engine._line_or_bar("line", df, "Fecha", "Monto Facturado", None, "day", QueryResult("gráfico"))
+    assert len(chart.df) <= 4000
@@ -0,0 +1,28 @@
+import pandas as pd
+
+from bench.bench_batch import build_engine
+from bench.synthetic import generate_sheet_values
+from result_table import ResultTable
+
+
+def test_index_is_built_only_when_filtering():
+    df = pd.DataFrame({"Cliente": ["Ana", "Beto", "ana maría"], "Monto Facturado": [3.0, 1.0, 2.0]})
+    table = ResultTable(df)
+    assert table.page(1).rows.equals(df)
+    assert list(table.positions(sort_by="Monto Facturado")) == [1, 2, 0]
+    assert table._index is None
+    assert list(table.positions(sort_by="Monto Facturado", filter_column="Cliente", filter_text="ana")) == [2, 0]
+    assert table._index is not None
+
+
+def test_preview_reuses_the_version_index(tmp_path):
+    engine = build_engine(generate_sheet_values(200), 0, str(tmp_path / "cache.sqlite"))
+    try:
+        data = engine.load()
+        engine.prepare_version(data.fingerprint, data.df)
+        preview = engine.derived(data.fingerprint, "vista previa")
+        assert preview.index is engine.derived(data.fingerprint, "índice")
+        particular = preview.positions(filter_column="Tipo Cliente", filter_text="particular")
+        assert len(particular) == (preview.df["Tipo Cliente"] == "Particular").sum()
+    finally:
+        engine.forecast_engine.close()
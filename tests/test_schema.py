@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from schema import parse_numbers, parse_numeric_columns
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("$1.234.567", 1234567.0),
+    ("1.234,5", 1234.5),
+    ("5,5%", 5.5),
+    ("1,234,567.89", 1234567.89),
+    ("12.5", 12.5),
+    ("5", 5.0),
+    ("-1.000", -1000.0),
+    ("$ 1.234.567", 1234567.0),
+    ("1.234.567 CLP", 1234567.0),
+    ("clp 2.500", 2500.0),
+    ("(1.000)", -1000.0),
+    ("($1.234,5)", -1234.5),
+    ("  $1.000  ", 1000.0),
+    ("1.000,0001", 1000.0001),
+])
+def test_parses(text, expected):
+    assert parse_numbers([text])[0] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text", ["12abc34", "N/A", "abc", "", "-", "$", "()", "1.000-", "--5", "5-3", "US$ 1.000"])
+def test_unparseable_is_nan(text):
+    assert np.isnan(parse_numbers([text])[0])
+
+
+def test_missing_values_are_nan():
+    assert parse_numbers([None, pd.NA, "1.000"]).isna().tolist() == [True, True, False]
+
+
+def test_parse_numeric_columns_reuses_repeated_values():
+    df = pd.DataFrame({"Monto Facturado": ["$1.000", "(2.000)", "$1.000", "x1"], "Descuento Aplicado (%)": ["5%", "5%", "", "2,5"]})
+    parse_numeric_columns(df, ["Monto Facturado", "Descuento Aplicado (%)"])
+    assert df["Monto Facturado"].tolist()[:3] == [1000.0, -2000.0, 1000.0] and np.isnan(df["Monto Facturado"][3])
+    assert df["Descuento Aplicado (%)"].tolist()[:2] == [5.0, 5.0] and df["Descuento Aplicado (%)"][3] == 2.5
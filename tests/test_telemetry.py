@@ -0,0 +1,29 @@
+import os
+
+from telemetry import QueryTrace, TraceLog
+
+
+def append(log, n):
+    for i in range(n):
+        trace = QueryTrace(f"pregunta {i}")
+        trace.attributes["i"] = i
+        log.append(trace)
+
+
+def test_read_returns_the_tail(tmp_path):
+    log = TraceLog(str(tmp_path / "traces.jsonl"), max_mb=0)
+    append(log, 50)
+    assert [record["i"] for record in log.read(limit=5)] == [45, 46, 47, 48, 49]
+    assert len(log.read()) == 50
+
+
+def test_append_rotates_and_read_spans_both_files(tmp_path):
+    log = TraceLog(str(tmp_path / "traces.jsonl"), max_mb=0.01)
+    append(log, 200)
+    assert os.path.exists(log.rotated_path)
+    assert os.path.getsize(log.path) < log.max_bytes
+    assert sorted(os.listdir(tmp_path)) == ["traces.jsonl", "traces.jsonl.1"]
+    # El archivo actual puede tener pocas líneas recién rotado: se completa con el rotado
+    current = len(log._tail(log.path, None))
+    records = log.read(limit=current + 3)
+    assert [record["i"] for record in records] == list(range(200 - current - 3, 200))
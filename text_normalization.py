@@ -0,0 +1,31 @@
+import re
+import unicodedata
+
+_PUNCTUATION = re.compile(r"[¿?¡!.,;:\"'()]")
+
+
+def strip_accents(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def normalize_text(text):
+    """Minúsculas, sin tildes, sin signos de puntuación y con espacios colapsados."""
+    text = strip_accents(str(text or "")).lower()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def singular(token):
+    """Forma singular aproximada de una palabra ya normalizada ("particulares" -> "particular")."""
+    if len(token) <= 3 or not token.endswith("s"):
+        return token
+    token = token[:-1]
+    # "-es" tras consonante final: particulares, sucursales, camiones
+    if token.endswith("e") and token[-2] in "rlndzj":
+        token = token[:-1]
+    return token
+
+
+def normalize_value(text):
+    """Clave de comparación de un valor de categoría: normalizado y en singular por palabra."""
+    return " ".join(singular(token) for token in normalize_text(text).split())
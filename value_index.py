@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from text_normalization import normalize_value
+
+
+class ValueIndex:
+    """Valores distintos de una columna de texto con su clave normalizada.
+
+    Los filtros se comparan contra los valores distintos (no contra cada fila):
+    sin distinguir mayúsculas, tildes ni plurales, y cada palabra del filtro debe
+    aparecer en el valor ("particulares" -> "Particular", "centro" -> "Santiago Centro").
+    """
+
+    def __init__(self, values):
+        self.values = pd.Index(values).astype(str)
+        self.keys = pd.Series([normalize_value(value) for value in self.values], dtype=object)
+
+    def __len__(self):
+        return len(self.values)
+
+    def matches(self, query):
+        """Arreglo booleano (uno por valor distinto) con los valores que coinciden con `query`."""
+        # Coincidencia literal como antes (sin distinguir mayúsculas), más la normalizada
+        literal = np.asarray(self.values.str.contains(str(query), case=False, regex=False), dtype=bool)
+        words = normalize_value(query).split()
+        if not words:
+            return literal
+        normalized = np.ones(len(self.keys), dtype=bool)
+        for word in words:
+            normalized &= self.keys.str.contains(word, regex=False).to_numpy(dtype=bool)
+        return literal | normalized
+
+    def matching_values(self, query):
+        return list(self.values[self.matches(query)])